@@ -0,0 +1,136 @@
+"""Runs the scan engines against a simulated network.
+
+No packet leaves the machine and no root privileges are needed, also not for the SYN-Scan.
+Every host gets the same profile: median round trip time, its spread, loss, the answer of the
+closed ports and a rate limit of the answers. The open ports are chosen with the seed, the
+same seed gives the same network. The timing profile, the concurrency and the rate control can
+be tuned against slow or lossy targets offline.
+
+Prints the probes per second, how many of the open ports were found and the state of the rate
+control, and writes them as JSON. Exits with 1 if fewer than --min-found percent of the open
+ports were found.
+
+    python benchmarks/simulate.py --hosts 256 --ports 1-1024 --rtt 150 --loss 2 --timing slow
+    python benchmarks/simulate.py --engine syn --hosts 4096 --ports 1-256 --rate 50000 --json sim.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from classes.portset import PortSet
+from classes.ratelimiter import RateLimiter
+from classes.scan import Scan
+from classes.simulation import HostProfile, SimulatedNetwork, SimulatedTransport
+from classes.targets import Targets
+
+# First address of the simulated hosts
+FIRST_HOST = '10.0.0.1'
+
+
+def network(args, targets):
+    """Builds the simulated network of the command line options.
+
+    Args:
+        args (Namespace) : The command line options
+        targets (Targets) : The scanned hosts and ports
+
+    Returns:
+        network (SimulatedNetwork) : The network
+        open_ports (int) : Number of open ports of all hosts
+    """
+    generator = random.Random(args.seed)
+    ports = list(targets.ports())
+    hosts = {}
+    open_ports = 0
+    for host in targets.hosts():
+        chosen = PortSet(generator.sample(ports, int(len(ports) * args.open / 100)))
+        open_ports += len(chosen)
+        hosts[host] = HostProfile(rtt=args.rtt / 1000, jitter=args.jitter, loss=args.loss / 100, open_ports=chosen,
+                                  closed=args.closed, rate_limit=args.host_rate)
+    return SimulatedNetwork(hosts, seed=args.seed), open_ports
+
+
+def positive_int(value):
+    """Converts an option to an int of at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('must be at least 1: ' + value)
+    return number
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scan engines against a simulated network')
+    parser.add_argument('--engine', choices=['async', 'thread', 'syn'], default='async', help='Engine of the scan')
+    parser.add_argument('--hosts', type=int, default=64, help='Number of simulated hosts')
+    parser.add_argument('--ports', default='1-1024', help='Ports and Port-Ranges of every host')
+    parser.add_argument('--open', type=float, default=2, help='Percent of open ports')
+    parser.add_argument('--rtt', type=float, default=20, help='Median round trip time in ms')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Spread of the log-normal round trip times')
+    parser.add_argument('--loss', type=float, default=0, help='Percent of lost probes')
+    parser.add_argument('--closed', choices=[HostProfile.RST, HostProfile.DROP, HostProfile.UNREACHABLE],
+                        default=HostProfile.RST, help='Answer of the closed ports')
+    parser.add_argument('--host-rate', type=float, help='Answers per second of every host')
+    parser.add_argument('--timing', default='normal', help='Timing profile of the scan')
+    parser.add_argument('--concurrency', type=int, default=1000, help='Connects in flight of the async engine')
+    parser.add_argument('--rate', type=positive_int, help='Probes per second of the scan')
+    parser.add_argument('--randomize', action='store_true', help='Probes in a random order')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the network and the scan order')
+    parser.add_argument('--min-found', type=float, help='Fails if fewer percent of the open ports are found')
+    parser.add_argument('--json', help='Writes the results to this file')
+    args = parser.parse_args()
+
+    first = int.from_bytes(bytes(int(octet) for octet in FIRST_HOST.split('.')), 'big')
+    last = first + args.hosts - 1
+    hosts = FIRST_HOST + '-' + '.'.join(str(last >> shift & 0xff) for shift in (24, 16, 8, 0))
+    targets = Targets(hosts, args.ports, args.seed if args.randomize else None)
+    simulated, open_ports = network(args, targets)
+
+    rate_limiter = RateLimiter(args.rate)
+    sc = Scan(args.ports, hosts, engine='thread' if args.engine == 'thread' else 'async',
+              concurrency=args.concurrency, timing=args.timing, rate_limiter=rate_limiter, targets=targets,
+              transport=SimulatedTransport(simulated))
+    states = Counter()
+    sc.listener = lambda event: states.update((event.state,))
+    sc.states = (Scan.OPEN, Scan.CLOSED, Scan.FILTERED)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    output = sc.scan_syn() if args.engine == 'syn' else sc.scan_tcp()
+    elapsed = time.perf_counter() - start
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    found = sum(len(host_ports) for host_ports in output.values())
+    result = {
+        'engine': args.engine,
+        'probes': len(targets),
+        'elapsed_s': round(elapsed, 3),
+        'probes_per_s': round(len(targets) / elapsed, 1),
+        'cpu_s': round(end_usage.ru_utime + end_usage.ru_stime - usage.ru_utime - usage.ru_stime, 3),
+        'open_ports': open_ports,
+        'found': found,
+        'found_percent': round(found / open_ports * 100, 2) if open_ports else 100.0,
+        'states': dict(states),
+        'network': {'answers': simulated.answers, 'lost': simulated.lost, 'rate_limited': simulated.limited},
+        'rate': {'final': rate_limiter.rate, 'sent': rate_limiter.sent, 'answered': rate_limiter.answered_total,
+                 'failures': rate_limiter.failures},
+    }
+    print(json.dumps(result, indent=2))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(dict(result, options=vars(args)), file, indent=2)
+
+    if args.min_found is not None and result['found_percent'] < args.min_found:
+        print('Found ' + str(result['found_percent']) + '% of the open ports, less than ' + str(args.min_found) + '%')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Measures the cold start time of the PenScan command line.
+
+Every command runs in a new interpreter, so the imports and the work done at import time are
+measured the way a user starts PenScan. Prints the median and the 90th percentile of every
+command and exits with 1 if a median is above --max-ms.
+
+    python benchmarks/startup.py --runs 20 --max-ms 150 --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> arguments of the interpreter
+COMMANDS = {
+    'import': ['-c', 'import penscan'],
+    'help': ['penscan.py', '--help'],
+    'print': ['penscan.py', '-p', '1'],
+}
+
+
+def measure(arguments, runs):
+    """Runs a command in new interpreters.
+
+    Args:
+        arguments (list) : Arguments of the interpreter
+        runs (int) : Number of runs
+
+    Returns:
+        times (list) : Wall clock time of every run in milliseconds
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + arguments, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def percentile(times, fraction):
+    """Returns the value below which the fraction of the sorted times lies."""
+    ordered = sorted(times)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold start time of the PenScan command line')
+    parser.add_argument('--runs', type=int, default=10, help='Runs of every command')
+    parser.add_argument('--max-ms', type=float, help='Fails if the median of a command is above it')
+    parser.add_argument('--json', help='Writes the results to this file')
+    args = parser.parse_args()
+
+    # one run to fill the caches of the file system and the bytecode
+    measure(COMMANDS['import'], 1)
+
+    results = {}
+    failed = False
+    for name, arguments in COMMANDS.items():
+        times = measure(arguments, args.runs)
+        results[name] = {'median_ms': round(statistics.median(times), 1), 'p90_ms': round(percentile(times, 0.9), 1)}
+        print(name.ljust(8) + 'median ' + str(results[name]['median_ms']) + 'ms\tp90 '
+              + str(results[name]['p90_ms']) + 'ms')
+        if args.max_ms is not None and results[name]['median_ms'] > args.max_ms:
+            print(name + ' is slower than ' + str(args.max_ms) + 'ms')
+            failed = True
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'python': sys.version.split()[0], 'runs': args.runs, 'commands': results}, file, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,370 @@
+"""Measures the throughput of the scan engines against local targets.
+
+Listeners are started on loopback for the open ports of a seeded port mix, the other ports are
+closed. The filtered ports are dropped by an nftables rule, without nft or root they stay closed.
+With --netns the suite runs in a new network namespace, so no firewall or service of the host
+interferes. Every case runs in its own interpreter, the CPU time and the peak RSS belong to it.
+
+Cases:
+    tcp-<engine>-<ports>-c<concurrency> : Scan.scan_tcp of all ports
+    syn-<ports>                         : Scan.scan_syn of all ports, needs root
+    packet-single, packet-batch         : RawScan.create_packet and RawScan.create_packets
+
+Prints a table and writes the results as JSON. With --baseline every case whose ports per second
+dropped by more than --max-regression percent fails the run with exit code 1.
+
+    python benchmarks/throughput.py --ports 1000,10000 --concurrency 100,1000 --json result.json
+    python benchmarks/throughput.py --netns --baseline result.json --max-regression 10
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import selectors
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# First port of the scanned range
+BASE_PORT = 20000
+
+# Table of the nftables rule of the filtered ports
+NFT_TABLE = 'penscan_bench'
+
+# Set in the environment of the suite once it runs in its own network namespace
+NETNS_ENV = 'PENSCAN_BENCH_NETNS'
+
+
+class Listeners:
+    """The listeners and the firewall rule of the port mix on loopback."""
+
+    def __init__(self, hosts, port_count, open_percent, filtered_percent, seed):
+        """Chooses the open and the filtered ports.
+
+        Args:
+            hosts (int) : Number of loopback addresses, from 127.0.0.1 on
+            port_count (int) : Number of ports from BASE_PORT on
+            open_percent (float) : Share of the open ports
+            filtered_percent (float) : Share of the filtered ports
+            seed (int) : Seed of the choice of the ports
+        """
+        self.hosts = ['127.0.0.' + str(index + 1) for index in range(hosts)]
+        ports = random.Random(seed).sample(range(BASE_PORT, BASE_PORT + port_count), port_count)
+        open_count = int(port_count * open_percent / 100)
+        filtered_count = int(port_count * filtered_percent / 100)
+        self.open = sorted(ports[:open_count])
+        self.filtered = sorted(ports[open_count:open_count + filtered_count])
+        self.listeners = []
+        self.selector = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        """Starts the listeners and a thread that accepts and closes their connections."""
+        self.selector = selectors.DefaultSelector()
+        for host in self.hosts:
+            for port_number in self.open:
+                listener = socket.create_server((host, port_number), backlog=4096, reuse_port=True)
+                listener.setblocking(False)
+                self.selector.register(listener, selectors.EVENT_READ)
+                self.listeners.append(listener)
+        self.thread = threading.Thread(target=self.accept, daemon=True)
+        self.thread.start()
+        if self.filtered and not self.add_rule():
+            print('nft is not usable, the filtered ports are closed')
+            self.filtered = []
+
+    def accept(self):
+        """Accepts the connections of the scans, so the backlogs do not fill up."""
+        while not self.stopped.is_set():
+            for key, _ in self.selector.select(0.1):
+                try:
+                    key.fileobj.accept()[0].close()
+                except OSError:
+                    pass
+
+    def add_rule(self):
+        """Drops the SYNs to the filtered ports with nftables.
+
+        Returns:
+            added (bool) : False if nft is missing or not permitted
+        """
+        if shutil.which('nft') is None or os.geteuid() != 0:
+            return False
+        ports = ', '.join(str(port_number) for port_number in self.filtered)
+        script = ('table inet ' + NFT_TABLE + ' {\n chain input {\n  type filter hook input priority 0;\n'
+                  '  ip daddr 127.0.0.0/8 tcp dport { ' + ports + ' } drop\n }\n}\n')
+        return subprocess.run(['nft', '-f', '-'], input=script, text=True).returncode == 0
+
+    def stop(self):
+        """Removes the firewall rule and closes the listeners."""
+        if self.filtered:
+            subprocess.run(['nft', 'delete', 'table', 'inet', NFT_TABLE])
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        for listener in self.listeners:
+            listener.close()
+        if self.selector is not None:
+            self.selector.close()
+
+
+def percentile(values, fraction):
+    """Returns the value below which the fraction of the sorted values lies, None without values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_case(case):
+    """Runs one case in this interpreter.
+
+    Args:
+        case (dict) : Settings of the case
+
+    Returns:
+        result (dict) : The measurements
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    if case['kind'] == 'packet':
+        result = run_packets(case)
+    else:
+        result = run_scan(case)
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+    result['cpu_s'] = round(end_usage.ru_utime + end_usage.ru_stime - usage.ru_utime - usage.ru_stime, 3)
+    result['max_rss_kb'] = end_usage.ru_maxrss
+    return result
+
+
+def run_scan(case):
+    """Scans the port range of the case and records the state and round trip time of every probe.
+
+    Args:
+        case (dict) : kind ('tcp' or 'syn'), engine, ports, concurrency, hosts and timing
+
+    Returns:
+        result (dict) : Probes per second, latency percentiles and the number of ports per state
+    """
+    from classes.scan import Scan
+
+    hosts = '127.0.0.1' if case['hosts'] == 1 else '127.0.0.1-' + str(case['hosts'])
+    ports = str(BASE_PORT) + '-' + str(BASE_PORT + case['ports'] - 1)
+    sc = Scan(ports, hosts, engine=case['engine'], concurrency=case['concurrency'], timing=case['timing'])
+
+    # Appending is atomic, the thread engine records from many threads
+    events = []
+    sc.listener = events.append
+    sc.states = (Scan.OPEN, Scan.CLOSED, Scan.FILTERED)
+
+    start = time.perf_counter()
+    if case['kind'] == 'syn':
+        sc.scan_syn()
+    else:
+        sc.scan_tcp()
+    elapsed = time.perf_counter() - start
+
+    rtts = [event.rtt * 1000 for event in events if event.rtt is not None]
+    probes = len(sc.targets)
+    result = {
+        'probes': probes,
+        'elapsed_s': round(elapsed, 4),
+        'ports_per_s': round(probes / elapsed, 1),
+        'p50_ms': percentile(rtts, 0.5),
+        'p99_ms': percentile(rtts, 0.99),
+    }
+    for state in sc.states:
+        result[state] = sum(1 for event in events if event.state == state)
+    return result
+
+
+def run_packets(case):
+    """Builds probes with the packet builder of the SYN-Scan.
+
+    Args:
+        case (dict) : engine ('single' for create_packet, 'batch' for create_packets) and count
+
+    Returns:
+        result (dict) : Packets per second
+    """
+    from classes.rawscan import RawScan
+
+    rs = RawScan('127.0.0.1')
+    count = case['count']
+    ports = [BASE_PORT + index % 40000 for index in range(count)]
+
+    start = time.perf_counter()
+    if case['engine'] == 'single':
+        for port_number in ports:
+            rs.create_packet(port_number)
+    else:
+        for index in range(0, count, 256):
+            rs.create_packets(ports[index:index + 256])
+    elapsed = time.perf_counter() - start
+
+    return {'probes': count, 'elapsed_s': round(elapsed, 4), 'ports_per_s': round(count / elapsed, 1)}
+
+
+def cases(args):
+    """Returns the cases of the command line options.
+
+    Args:
+        args (Namespace) : The command line options
+
+    Returns:
+        cases (list) : Settings of every case
+    """
+    port_counts = [int(count) for count in args.ports.split(',')]
+    concurrencies = [int(concurrency) for concurrency in args.concurrency.split(',')]
+    result = []
+    for port_count in port_counts:
+        for engine in args.engines.split(','):
+            for concurrency in concurrencies if engine == 'async' else [100]:
+                result.append({'name': 'tcp-' + engine + '-' + str(port_count) + '-c' + str(concurrency),
+                               'kind': 'tcp', 'engine': engine, 'ports': port_count, 'concurrency': concurrency,
+                               'hosts': args.hosts, 'timing': args.timing})
+        if args.syn:
+            result.append({'name': 'syn-' + str(port_count), 'kind': 'syn', 'engine': 'async', 'ports': port_count,
+                           'concurrency': 1, 'hosts': args.hosts, 'timing': args.timing})
+    for engine in ('single', 'batch'):
+        result.append({'name': 'packet-' + engine, 'kind': 'packet', 'engine': engine, 'count': args.packets})
+    return result
+
+
+def measure(case, repeat):
+    """Runs a case in new interpreters and keeps the median of every measurement.
+
+    Args:
+        case (dict) : Settings of the case
+        repeat (int) : Number of runs
+
+    Returns:
+        result (dict) : Median of every measurement, the runs under 'runs'
+    """
+    runs = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-case', json.dumps(case)],
+                                   cwd=ROOT, stdout=subprocess.PIPE, text=True, check=True)
+        runs.append(json.loads(completed.stdout.splitlines()[-1]))
+    result = dict(case)
+    for key, value in runs[0].items():
+        values = [run[key] for run in runs if run[key] is not None]
+        result[key] = round(statistics.median(values), 3) if values else None
+    result['runs'] = runs
+    return result
+
+
+def compare(results, baseline, max_regression):
+    """Compares the ports per second with a baseline.
+
+    Args:
+        results (list) : Results of the cases
+        baseline (dict) : Result file of an earlier run
+        max_regression (float) : Allowed drop in percent
+
+    Returns:
+        failed (list) : Names of the cases that are slower than allowed
+    """
+    previous = {case['name']: case for case in baseline['cases']}
+    failed = []
+    for result in results:
+        before = previous.get(result['name'])
+        if before is None or not before['ports_per_s']:
+            continue
+        change = (result['ports_per_s'] / before['ports_per_s'] - 1) * 100
+        print(result['name'].ljust(28) + 'ports/s ' + ('%+.1f' % change) + '% against the baseline')
+        if change < -max_regression:
+            failed.append(result['name'])
+    return failed
+
+
+def environment():
+    """Returns the machine and the revision the results belong to."""
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, text=True)
+    return {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'commit': commit.stdout.strip() or None,
+        'netns': os.environ.get(NETNS_ENV) == '1',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput of the scan engines against local targets')
+    parser.add_argument('--ports', default='1000,10000', help='Comma separated numbers of scanned ports')
+    parser.add_argument('--concurrency', default='100,1000', help='Comma separated windows of the async engine')
+    parser.add_argument('--engines', default='async', help='Comma separated TCP engines (async, thread)')
+    parser.add_argument('--hosts', type=int, default=1, help='Number of loopback addresses')
+    parser.add_argument('--open', type=float, default=5, help='Percent of open ports')
+    parser.add_argument('--filtered', type=float, default=0, help='Percent of filtered ports, needs nft and root')
+    parser.add_argument('--timing', default='lan', help='Timing profile of the scans')
+    parser.add_argument('--syn', action='store_true', help='Also runs the SYN-Scan, needs root')
+    parser.add_argument('--packets', type=int, default=200000, help='Packets built by the packet cases')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of every case, the median is reported')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the port mix')
+    parser.add_argument('--netns', action='store_true', help='Runs the suite in a new network namespace')
+    parser.add_argument('--json', help='Writes the results to this file')
+    parser.add_argument('--baseline', help='Result file of an earlier run to compare with')
+    parser.add_argument('--max-regression', type=float, default=10, help='Allowed drop of ports/s in percent')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case))))
+        return
+
+    if args.netns and os.environ.get(NETNS_ENV) != '1':
+        command = [sys.executable, os.path.abspath(__file__)] + [arg for arg in sys.argv[1:] if arg != '--netns']
+        os.execvpe('unshare', ['unshare', '--net', '--', 'sh', '-c', 'ip link set lo up && exec "$@"', 'sh']
+                   + command, dict(os.environ, **{NETNS_ENV: '1'}))
+
+    listeners = Listeners(args.hosts, max(int(count) for count in args.ports.split(',')), args.open, args.filtered,
+                          args.seed)
+    listeners.start()
+    try:
+        results = []
+        for case in cases(args):
+            result = measure(case, args.repeat)
+            results.append(result)
+            line = result['name'].ljust(28) + str(result['ports_per_s']).rjust(12) + ' ports/s'
+            if result.get('p50_ms') is not None:
+                line += '  p50 %.3fms  p99 %.3fms' % (result['p50_ms'], result['p99_ms'])
+            line += '  cpu %.2fs  rss %dMB' % (result['cpu_s'], result['max_rss_kb'] // 1024)
+            print(line)
+            if case['kind'] != 'packet':
+                # Only the ports of the range of the case are scanned
+                expected = sum(1 for port_number in listeners.open if port_number < BASE_PORT + case['ports'])
+                if result['open'] != expected * args.hosts:
+                    print(result['name'] + ' found ' + str(result['open']) + ' open ports instead of '
+                          + str(expected * args.hosts))
+    finally:
+        listeners.stop()
+
+    report = {'environment': environment(), 'open_percent': args.open,
+              'filtered_percent': args.filtered if listeners.filtered else 0, 'cases': results}
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    failed = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            failed = compare(results, json.load(file), args.max_regression)
+        for name in failed:
+            print(name + ' is more than ' + str(args.max_regression) + '% slower than the baseline')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+import asyncio
+import re
+import threading
+from collections import namedtuple
+
+from classes.scan import Scan
+from classes.services import Services
+
+# Banner of an open port, state is always BannerGrabber.BANNER so the writers can tell it from a ScanEvent.
+# rtt is the time until the first byte of the banner, banner is the text with the control characters escaped.
+BannerEvent = namedtuple('BannerEvent', ['host', 'port', 'state', 'rtt', 'service', 'version', 'banner'])
+
+# Service and pattern of every signature, the first group of a pattern is the version.
+# A banner is matched from its first byte, the first signature that matches wins.
+SIGNATURES = [
+    ('ssh', rb'SSH-[\d.]+-([^\r\n]+)'),
+    ('http', rb'HTTP/[\d.]+ \d{3}(?:.*?\r\n(?i:server): *([^\r\n]+))?'),
+    ('rtsp', rb'RTSP/[\d.]+ \d{3}(?:.*?\r\n(?i:server): *([^\r\n]+))?'),
+    ('ftp', rb'220[ -]([^\r\n]*(?i:ftp)[^\r\n]*)'),
+    ('smtp', rb'220[ -]([^\r\n]*(?i:smtp|mail)[^\r\n]*)'),
+    ('pop3', rb'\+OK ?([^\r\n]*)'),
+    ('imap', rb'\* OK ?([^\r\n]*)'),
+    ('redis', rb'\+PONG|-(?:ERR|NOAUTH|DENIED)'),
+    ('mysql', rb'.\x00\x00\x00\x0a([\w.~+-]+)\x00'),
+    ('vnc', rb'RFB (\d{3}\.\d{3})'),
+    ('amqp', rb'AMQP\x00'),
+    ('telnet', rb'\xff[\xfb-\xfe]'),
+    # TLS alert record, the answer of a TLS server to a plain text probe
+    ('tls', rb'\x15\x03[\x00-\x04]'),
+]
+
+
+class Signatures:
+    """This class matches banners against a compiled set of signatures.
+    All patterns are joined into one regular expression with a named group per signature, so a
+    banner is matched in a single pass however many signatures there are. Only the signature that
+    matched is run again to extract its version.
+    """
+
+    def __init__(self, signatures=None):
+        """Compiles the signatures.
+
+        Args:
+            signatures (list) : (service, pattern) of every signature, SIGNATURES if None
+        """
+        signatures = SIGNATURES if signatures is None else signatures
+        self.services = [service for service, _ in signatures]
+        self.patterns = [re.compile(pattern, re.DOTALL) for _, pattern in signatures]
+        self.combined = re.compile(b'|'.join(b'(?P<s' + str(index).encode() + b'>' + pattern + b')'
+                                             for index, (_, pattern) in enumerate(signatures)), re.DOTALL)
+
+    def match(self, data):
+        """Returns the service and version of a banner.
+
+        Args:
+            data (bytes) : The banner
+
+        Returns:
+            result (tuple) : (service, version as bytes or None), None if no signature matches
+        """
+        match = self.combined.match(data)
+        if match is None:
+            return None
+        # The named group of the signature is the outermost group, it closes last
+        index = int(match.lastgroup[1:])
+        version = self.patterns[index].match(data)
+        return self.services[index], version.group(1) if version.re.groups else None
+
+
+class BannerGrabber:
+    """This class grabs the banners of open ports while the scans are still running.
+    The open ports are submitted from the scan engines and grabbed in an event loop of its own
+    thread. A fixed window of worker coroutines is the global budget of the connections. Every
+    connection reads at most read_limit bytes and is closed at its deadline. Servers that do not
+    speak first get a probe. The banners are matched against the signatures and passed to the
+    listener and the database as they arrive.
+    """
+
+    BANNER = 'banner'
+
+    # Bytes read from a connection at most
+    READ_LIMIT = 1024
+
+    # Seconds a server gets to send its greeting before the probe is sent
+    GREETING_WAIT = 1.0
+
+    # Seconds without further data after which a banner is complete
+    IDLE_WAIT = 0.2
+
+    # Sent to servers that do not speak first, most text protocols answer it with an error
+    PROBE = b'HEAD / HTTP/1.0\r\n\r\n'
+
+    # Ports of services that wait for the client, they get their probe right after the connect
+    PROBES = dict.fromkeys((80, 81, 443, 591, 631, 3000, 5000, 8000, 8008, 8080, 8081, 8443, 8888, 9200), PROBE)
+    PROBES[6379] = b'PING\r\n'
+
+    # Control characters of the banners are escaped for the output
+    ESCAPES = {code: '\\x%02x' % code for code in list(range(32)) + list(range(127, 160))}
+    ESCAPES.update({ord('\r'): '\\r', ord('\n'): '\\n', ord('\t'): '\\t'})
+
+    def __init__(self, connections=100, timeout=5.0, read_limit=READ_LIMIT, signatures=None, listener=None,
+                 controller=None, metrics=None):
+        """Initializes the BannerGrabber-Class, start() starts the event loop.
+
+        Args:
+            connections (int) : Maximum number of connections open at the same time
+            timeout (float) : Seconds from the connect until the connection is closed
+            read_limit (int) : Bytes read from a connection at most
+            signatures (Signatures) : Signatures the banners are matched against, the default set if None
+            listener (function) : Called with every BannerEvent in the thread of the event loop
+            controller (DBController) : Stores the banners of the ports submitted with log
+            metrics (Metrics) : Counts the grabbed banners and the failed connections, nothing is counted if None
+        """
+        self.connections = max(1, min(connections, Scan.max_connections()))
+        self.timeout = timeout
+        self.read_limit = read_limit
+        self.signatures = signatures if signatures is not None else Signatures()
+        self.listener = listener
+        self.controller = controller
+        self.metrics = metrics
+
+        # BannerEvent of every port of every host, complete for the submitted ports after join()
+        self.results = {}
+
+        # Number of submitted ports of every host that are not grabbed yet, only used in the event loop
+        self.pending = {}
+        self.grabbed = None
+
+        self.loop = None
+        self.queue = None
+        self.stopping = None
+        self.thread = None
+
+    def start(self):
+        """Starts the event loop of the connections in a background thread."""
+        ready = threading.Event()
+        self.thread = threading.Thread(target=asyncio.run, args=(self.run(ready),), daemon=True)
+        self.thread.start()
+        ready.wait()
+
+    async def run(self, ready):
+        """Runs the worker coroutines until close() is called.
+
+        Args:
+            ready (Event) : Set once ports can be submitted
+        """
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.grabbed = asyncio.Condition()
+        self.stopping = self.loop.create_future()
+        workers = [asyncio.ensure_future(self.worker()) for _ in range(self.connections)]
+        ready.set()
+
+        cancel = await self.stopping
+        if not cancel:
+            await self.wait()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    def submit(self, event, log=False):
+        """Queues the grab of an open port, can be called from any thread.
+
+        Args:
+            event (ScanEvent) : Result of the open port
+            log (bool) : Store the banner in the database
+        """
+        self.loop.call_soon_threadsafe(self.enqueue, event.host, event.port, log)
+
+    def enqueue(self, host, port_number, log):
+        """Queues the grab of an open port in the event loop.
+
+        Args:
+            host (str) : The Host IP-Address
+            port_number (int) : The Port number
+            log (bool) : Store the banner in the database
+        """
+        self.pending[host] = self.pending.get(host, 0) + 1
+        self.queue.put_nowait((host, port_number, log))
+
+    def join(self, hosts=None):
+        """Waits until the banners of the ports submitted before are grabbed.
+        Ports of other hosts that are submitted while waiting do not delay the hosts waited for.
+
+        Args:
+            hosts (iterable) : Hosts to wait for, all hosts if None
+
+        Returns:
+            results (dict) : BannerEvent of every port of every host
+        """
+        asyncio.run_coroutine_threadsafe(self.wait(hosts), self.loop).result()
+        return self.results
+
+    async def wait(self, hosts=None):
+        """Waits in the event loop until the ports of the hosts are grabbed.
+
+        Args:
+            hosts (iterable) : Hosts to wait for, all hosts if None
+        """
+        hosts = None if hosts is None else list(hosts)
+        async with self.grabbed:
+            await self.grabbed.wait_for(lambda: not self.grabbing(hosts))
+
+    def grabbing(self, hosts=None):
+        """Returns True while ports of the hosts are queued or grabbed.
+
+        Args:
+            hosts (list) : The hosts, all hosts if None
+        """
+        if hosts is None:
+            return bool(self.pending)
+        return any(host in self.pending for host in hosts)
+
+    def close(self, cancel=False):
+        """Stops the event loop once the submitted ports are grabbed.
+
+        Args:
+            cancel (bool) : Drop the queued ports and close the open connections instead of waiting
+        """
+        if self.thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.stopping.set_result, cancel)
+        self.thread.join()
+        self.thread = None
+
+    async def worker(self):
+        """Grabs the queued ports one after another."""
+        while True:
+            host, port_number, log = await self.queue.get()
+            try:
+                event = await self.grab(host, port_number)
+                if event is not None:
+                    self.found(event, log)
+            finally:
+                self.pending[host] -= 1
+                if not self.pending[host]:
+                    del self.pending[host]
+                async with self.grabbed:
+                    self.grabbed.notify_all()
+
+    def found(self, event, log):
+        """Passes a banner to the results, the listener and the database.
+
+        Args:
+            event (BannerEvent) : The banner
+            log (bool) : Store the banner in the database
+        """
+        ports = self.results.get(event.host)
+        if ports is None:
+            ports = self.results[event.host] = {}
+        ports[event.port] = event
+        if self.listener is not None:
+            self.listener(event)
+        if log and self.controller is not None:
+            self.controller.save_banner(event.host, event.port, event.service, event.version, event.banner)
+
+    async def grab(self, host, port_number):
+        """Connects to an open port and reads its banner until the deadline.
+
+        Args:
+            host (str) : The Host IP-Address
+            port_number (int) : The Port number
+
+        Returns:
+            event (BannerEvent) : The banner, None if the connect failed or nothing was received
+        """
+        start = self.loop.time()
+        deadline = start + self.timeout
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port_number), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            if self.metrics is not None:
+                self.metrics.count('banner_errors')
+            return None
+
+        data = b''
+        first_byte = None
+        try:
+            probe = self.PROBES.get(port_number)
+            if probe is not None:
+                writer.write(probe)
+            data = await self.read(reader, min(deadline, self.loop.time() + self.GREETING_WAIT), data)
+            if not data and probe is None and self.loop.time() < deadline:
+                writer.write(self.PROBE)
+                data = await self.read(reader, deadline, data)
+            if data:
+                first_byte = self.loop.time() - start
+            # The rest of the banner follows within the idle wait
+            while data and len(data) < self.read_limit and self.loop.time() < deadline:
+                # A recognized banner that ends with a full line is complete
+                if data.endswith(b'\n') and self.signatures.match(data) is not None:
+                    break
+                more = await self.read(reader, min(deadline, self.loop.time() + self.IDLE_WAIT), data)
+                if len(more) == len(data):
+                    break
+                data = more
+        except OSError:
+            pass
+        finally:
+            # Closed with a RST, the socket does not linger in TIME_WAIT
+            writer.transport.abort()
+
+        if not data:
+            if self.metrics is not None:
+                self.metrics.count('banner_errors')
+            return None
+        if self.metrics is not None:
+            self.metrics.count('banners')
+
+        match = self.signatures.match(data)
+        if match is None:
+            service, version = Services.get_service(port_number), None
+        else:
+            service, version = match
+        return BannerEvent(host, port_number, self.BANNER, first_byte, service,
+                           self.text(version) if version else '', self.text(data))
+
+    async def read(self, reader, until, data):
+        """Reads more of the banner until data arrives, the connection is closed or the time is up.
+
+        Args:
+            reader (StreamReader) : Reader of the connection
+            until (float) : Time of the event loop to stop waiting
+            data (bytes) : The banner read so far
+
+        Returns:
+            data (bytes) : The banner with the new data, at most read_limit bytes
+        """
+        wait = until - self.loop.time()
+        if wait <= 0:
+            return data
+        try:
+            chunk = await asyncio.wait_for(reader.read(self.read_limit - len(data)), wait)
+        except asyncio.TimeoutError:
+            return data
+        return data + chunk
+
+    @classmethod
+    def text(cls, data):
+        """Converts a banner to printable text.
+
+        Args:
+            data (bytes) : The banner
+
+        Returns:
+            text (str) : The banner without trailing whitespace, the control characters escaped
+        """
+        return data.rstrip().decode('utf-8', 'backslashreplace').translate(cls.ESCAPES)
@@ -0,0 +1,185 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from classes.scan import Scan
+
+
+class ProbeBudget:
+    """This class limits the connects in flight of all scans in one event loop.
+    Every connect takes one slot of the global budget and one slot of its host, so no single
+    host gets more than the per-host cap, however many sections scan it at the same time.
+    Scans in worker threads take their slots through the event loop with the threadsafe methods.
+    """
+
+    def __init__(self, budget, host_limit=None, loop=None):
+        """Initializes the ProbeBudget-Class with the limits.
+
+        Args:
+            budget (int) : Maximum number of connects in flight of all scans
+            host_limit (int) : Maximum number of connects in flight per host, unlimited if None
+            loop (AbstractEventLoop) : Event loop of the slots, needed by the threadsafe methods
+        """
+        self.slots = asyncio.Semaphore(budget)
+        self.host_limit = host_limit
+        self.loop = loop
+
+        # host -> [Semaphore, number of connects holding or waiting for it]
+        self.hosts = {}
+
+    async def acquire(self, host):
+        """Waits until a connect to the host may be started.
+        The slot of the host is taken first, so waiting for a busy host does not hold a global slot.
+
+        Args:
+            host (str) : Address of the host
+        """
+        if self.host_limit:
+            entry = self.hosts.get(host)
+            if entry is None:
+                entry = self.hosts[host] = [asyncio.Semaphore(self.host_limit), 0]
+            entry[1] += 1
+            try:
+                await entry[0].acquire()
+            except BaseException:
+                self.forget(host, entry)
+                raise
+        await self.slots.acquire()
+
+    def release(self, host):
+        """Frees the slots of a finished connect.
+
+        Args:
+            host (str) : Address of the host
+        """
+        self.slots.release()
+        if self.host_limit:
+            entry = self.hosts[host]
+            entry[0].release()
+            self.forget(host, entry)
+
+    def acquire_threadsafe(self, host):
+        """Waits in a worker thread until a probe of the host may be sent.
+
+        Args:
+            host (str) : Address of the host
+        """
+        asyncio.run_coroutine_threadsafe(self.acquire(host), self.loop).result()
+
+    def release_threadsafe(self, host):
+        """Frees the slots of a finished probe from a worker thread.
+
+        Args:
+            host (str) : Address of the host
+        """
+        self.loop.call_soon_threadsafe(self.release, host)
+
+    def forget(self, host, entry):
+        """Drops the semaphore of a host once no connect uses it.
+
+        Args:
+            host (str) : Address of the host
+            entry (list) : [Semaphore, number of connects] of the host
+        """
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self.hosts[host]
+
+
+class BatchScan:
+    """This class runs the sections of a config file concurrently.
+    Up to `parallel` sections run at the same time in one event loop. All scans share one
+    ProbeBudget, so the probes in flight of all sections stay within the budget and the per-host cap.
+    SYN-Scans and the thread engine run in a pool with a worker thread per running section, every
+    SYN-Scan with its own raw socket. A failed section does not stop the others.
+    The report of a section is written as soon as it is finished, in the order the sections complete.
+    """
+
+    def __init__(self, sections, engine='async', budget=1000, host_limit=100, parallel=16, seed=None,
+                 timing='normal', rate_limiter=None, resolver=None, metrics=None, listener=None):
+        """Initializes the BatchScan-Class with the sections.
+
+        Args:
+            sections (list) : (host, protocol, ports, log) of every section
+            engine (str) : TCP engine to use, 'async' (event loop) or 'thread' (thread per port)
+            budget (int) : Maximum number of connects in flight of all sections
+            host_limit (int) : Maximum number of connects in flight per host, unlimited if None
+            parallel (int) : Maximum number of sections that run at the same time
+            seed (int) : Seed of the random scan order, ascending order if None
+            timing (str) : Timing profile of the scans
+            rate_limiter (RateLimiter) : Probe rate shared by all scans, unlimited if None
+            resolver (Resolver) : Resolver of the hostnames shared by all scans
+            metrics (Metrics) : Collects the counters and timers of all scans, nothing is collected if None
+            listener (function) : Called with (section, ScanEvent) of every open port while the sections are scanned
+        """
+        self.sections = sections
+        self.engine = engine
+        self.budget = budget
+        self.host_limit = host_limit
+        self.parallel = max(1, parallel)
+        self.seed = seed
+        self.timing = timing
+        self.rate_limiter = rate_limiter
+        self.resolver = resolver
+        self.metrics = metrics
+        self.listener = listener
+
+    def run(self, report):
+        """Runs all sections and reports every finished section.
+
+        Args:
+            report (function) : Called with (section, Scan, results) in a worker thread, results is the
+                                PortSet of every host or the exception of a failed section
+        """
+        asyncio.run(self.run_sections(report))
+
+    async def run_sections(self, report):
+        """Starts the sections and reports them in the order they complete.
+        The reports are written one after another while the other sections keep running.
+
+        Args:
+            report (function) : Called with (section, Scan, results) of every section
+        """
+        budget = ProbeBudget(self.budget, self.host_limit, asyncio.get_running_loop())
+        running = asyncio.Semaphore(self.parallel)
+        # The sections get their own workers, the default executor only writes the reports
+        with ThreadPoolExecutor(max_workers=self.parallel, thread_name_prefix='section') as executor:
+            tasks = [asyncio.ensure_future(self.run_section(section, budget, running, executor))
+                     for section in self.sections]
+            for task in asyncio.as_completed(tasks):
+                section, sc, results = await task
+                await asyncio.to_thread(report, section, sc, results)
+
+    async def run_section(self, section, budget, running, executor):
+        """Scans one section once a place among the running sections is free.
+
+        Args:
+            section (tuple) : (host, protocol, ports, log)
+            budget (ProbeBudget) : Connects in flight shared by all sections
+            running (Semaphore) : Places of the running sections
+            executor (Executor) : Worker threads of the running sections
+
+        Returns:
+            result (tuple) : (section, Scan, results)
+        """
+        host, protocol, ports, _ = section
+        loop = asyncio.get_running_loop()
+        async with running:
+            sc = None
+            try:
+                # Hostnames are resolved while the Targets are built, outside of the event loop
+                sc = await loop.run_in_executor(executor, functools.partial(
+                    Scan, ports, host, engine=self.engine, concurrency=self.budget, timing=self.timing,
+                    seed=self.seed, rate_limiter=self.rate_limiter, budget=budget, resolver=self.resolver,
+                    metrics=self.metrics))
+                if self.listener is not None:
+                    sc.listener = functools.partial(self.listener, section)
+                if protocol == 'syn':
+                    results = await loop.run_in_executor(executor, sc.scan_syn)
+                elif self.engine == 'thread':
+                    results = await loop.run_in_executor(executor, sc.scan_tcp_thread)
+                else:
+                    results = await sc.scan_tcp_task()
+            except Exception as e:
+                results = e
+        return section, sc, results
@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import deque
+
+
+class Checkpoint:
+    """This class stores the progress of a running scan, so an interrupted scan can be resumed.
+    The work items of a scan have positions in the order of its Targets. Every few seconds the
+    position of the first item that is not finished yet and the open ports found since the last
+    checkpoint are handed to the background writer of the database.
+    The TCP engines report when an item starts and finishes. The SYN-Scan only reports the sent
+    items, an item counts as finished once the drain timeout after its probe has passed.
+    """
+
+    # Seconds between two checkpoints
+    interval = 5.0
+
+    def __init__(self, controller, checkpoint_id, sc, protocol):
+        """Initializes the Checkpoint-Class for a scan.
+
+        Args:
+            controller (DBController) : The database of the checkpoint
+            checkpoint_id (int) : Id of the checkpoint
+            sc (Scan) : The scan, it continues at its start position
+            protocol (str) : 'tcp' or 'syn'
+        """
+        self.controller = controller
+        self.checkpoint_id = checkpoint_id
+        self.sc = sc
+        self.protocol = protocol
+
+        self.lock = threading.Lock()
+        # Positions of the started items that are not finished yet and the next position
+        self.in_flight = {}
+        self.next = sc.start
+        # (monotonic time, position after the probe) of the sent SYN probes
+        self.sent_positions = deque()
+        self.sent_position = sc.start
+
+        # Number of open ports of every host at the last checkpoint
+        self.saved = {host: len(ports) for host, ports in sc.initial_output.items()}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @classmethod
+    def create(cls, controller, sc, hosts, ports, protocol, seed):
+        """Creates the checkpoint of a new scan.
+
+        Args:
+            controller (DBController) : The database of the checkpoint
+            sc (Scan) : The scan
+            hosts (str) : The hosts of the scan
+            ports (str) : The ports of the scan
+            protocol (str) : 'tcp' or 'syn'
+            seed (int) : Seed of the random scan order, None for ascending order
+
+        Returns:
+            checkpoint (Checkpoint) : The checkpoint
+        """
+        return cls(controller, controller.create_checkpoint(hosts, ports, protocol, seed), sc, protocol)
+
+    def started(self, position):
+        """Remembers that an item is in flight.
+
+        Args:
+            position (int) : Position of the item
+        """
+        with self.lock:
+            self.in_flight[position] = None
+            if position >= self.next:
+                self.next = position + 1
+
+    def finished(self, position):
+        """Remembers that an item is finished.
+
+        Args:
+            position (int) : Position of the item
+        """
+        with self.lock:
+            del self.in_flight[position]
+
+    def sent(self, position):
+        """Remembers the position after the last sent SYN probe.
+
+        Args:
+            position (int) : Position of the next item
+        """
+        with self.lock:
+            self.sent_positions.append((time.monotonic(), position))
+
+    def position(self):
+        """Returns the position of the first item that is not finished yet.
+
+        Returns:
+            position (int) : Every item before it is finished
+        """
+        with self.lock:
+            if self.protocol != 'syn':
+                return min(self.in_flight, default=self.next)
+            # Replies to probes older than the drain timeout are in
+            deadline = time.monotonic() - self.sc.timing.drain_timeout()
+            while self.sent_positions and self.sent_positions[0][0] <= deadline:
+                self.sent_position = self.sent_positions.popleft()[1]
+            return self.sent_position
+
+    def start(self):
+        """Starts storing checkpoints in the background."""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """Stores a checkpoint every interval until the scan is stopped."""
+        while not self.stopped.wait(self.interval):
+            self.save()
+
+    def save(self):
+        """Stores the position and the open ports of the hosts that changed.
+        The position is taken before the results, so every item before it is in the results.
+        The changed ports are copied under the lock of the results, the scan keeps adding to them.
+        """
+        position = self.position()
+        changed = {}
+        with self.sc.output_lock:
+            for host, ports in self.sc.output.items():
+                if self.saved.get(host) != len(ports):
+                    self.saved[host] = len(ports)
+                    changed[host] = ports.copy()
+        self.controller.save_checkpoint(self.checkpoint_id, position, changed)
+
+    def stop(self, completed):
+        """Stops the checkpoints and stores the final state.
+
+        Args:
+            completed (bool) : True if the scan finished, False if it was interrupted
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        if completed:
+            self.controller.finish_checkpoint(self.checkpoint_id)
+        else:
+            self.save()
@@ -11,7 +11,8 @@ class ConfigController:
     def read_config(filepath):
         """Reads the config file into the program.
         With the passed filepath to the *.ini config file, the content will be read in and
-        the given values will proceeded internally.
+        the given values will proceeded internally. The host of a section can be a single host,
+        a CIDR block, an address range or a comma separated list of them.
 
         Args:
             filepath (str) : path to the config file
@@ -1,97 +1,575 @@
+import json
+import queue
 import sqlite3
+import threading
 import time
-import os
+
+from classes.portset import PortSet
 
 
 class DBController:
-    """This Class creates the database if none exist and provides methods to store and load Scan Results."""
+    """This Class creates the database if none exist and provides methods to store and load Scan Results.
+    Every scan is a row of the scan table with the host from the host table and one row per
+    open port in the open_port table. The open ports are also kept in the binary encoding of the
+    PortSet, so a scan can be loaded without reading its port rows.
+    The port_stats table counts how often every port was found open, it is updated with every scan.
+    The banner table keeps the latest banner and the detected service of every port of a host.
+    Running scans store their progress and partial results in the checkpoint tables to be resumed.
+    Saving only enqueues the scan, a background writer stores many scans in one transaction.
+    """
 
     file_name = 'penscan.db'
 
+    # Scans stored in one transaction at most and the time the writer waits to fill a batch
+    batch_size = 1000
+    batch_wait = 0.2
+    # Attempts of a transaction that fails with an operational error like a locked database
+    write_attempts = 3
+    retry_wait = 0.1
+
+    schema = [
+        '''CREATE TABLE IF NOT EXISTS host
+           (id INTEGER PRIMARY KEY, address TEXT NOT NULL UNIQUE)''',
+        '''CREATE TABLE IF NOT EXISTS scan
+           (id INTEGER PRIMARY KEY, date REAL NOT NULL, host_id INTEGER NOT NULL REFERENCES host(id),
+            open_tcp BLOB NOT NULL)''',
+        '''CREATE INDEX IF NOT EXISTS scan_host ON scan (host_id, id)''',
+        '''CREATE TABLE IF NOT EXISTS open_port
+           (scan_id INTEGER NOT NULL REFERENCES scan(id), port INTEGER NOT NULL,
+            PRIMARY KEY (scan_id, port)) WITHOUT ROWID''',
+        '''CREATE INDEX IF NOT EXISTS open_port_port ON open_port (port, scan_id)''',
+        '''CREATE TABLE IF NOT EXISTS port_stats
+           (port INTEGER PRIMARY KEY, open_count INTEGER NOT NULL)''',
+        '''CREATE INDEX IF NOT EXISTS port_stats_count ON port_stats (open_count DESC, port)''',
+        '''CREATE TABLE IF NOT EXISTS checkpoint
+           (id INTEGER PRIMARY KEY, created REAL NOT NULL, updated REAL NOT NULL, hosts TEXT NOT NULL,
+            ports TEXT NOT NULL, protocol TEXT NOT NULL, seed INTEGER, position INTEGER NOT NULL,
+            finished INTEGER NOT NULL)''',
+        '''CREATE TABLE IF NOT EXISTS checkpoint_result
+           (checkpoint_id INTEGER NOT NULL REFERENCES checkpoint(id), host TEXT NOT NULL, open_tcp BLOB NOT NULL,
+            PRIMARY KEY (checkpoint_id, host)) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS banner
+           (host_id INTEGER NOT NULL REFERENCES host(id), port INTEGER NOT NULL, date REAL NOT NULL,
+            service TEXT NOT NULL, version TEXT NOT NULL, banner TEXT NOT NULL,
+            PRIMARY KEY (host_id, port)) WITHOUT ROWID''',
+    ]
+
     def __init__(self):
-        """Checks if Database file exist, if not creates one."""
-        exist = os.path.isfile(self.file_name)
-        self.conn = sqlite3.connect(self.file_name)
-        if not exist:
-            self.create_database()
-        pass
+        """Opens the Database and creates the tables if they do not exist."""
+        self.conn = self.connect()
+        self.create_database()
+
+        # Background writer, started with the first save
+        self.queue = queue.Queue()
+        self.writer = None
+        self.error = None
+
+        # Counts the written rows and times the transactions of the writer if set
+        self.metrics = None
+
+        # Ranked ports by limit, dropped when the writer changed the statistics
+        self.stats_version = 0
+        self.ranking_cache = {}
+        self.ranking_version = 0
+
+    def connect(self):
+        """Opens a connection in WAL mode.
+        With write-ahead logging the readers do not block the writer, and with synchronous=NORMAL
+        a commit does not wait for the disk.
+
+        Returns:
+            conn (Connection) : The connection
+        """
+        conn = sqlite3.connect(self.file_name, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
 
     def create_database(self):
-        """Creates the Database-Tables."""
-        c = self.conn.cursor()
-        # Create table
-        c.execute('''CREATE TABLE scans
-                     (date text, host text, open_tcp text)''')
-        # Save (commit) the changes
-        self.conn.commit()
+        """Creates the Database-Tables and takes over the scans of older versions."""
+        with self.conn:
+            for statement in self.schema:
+                self.conn.execute(statement)
+        self.migrate()
+        self.fill_port_stats()
+
+    def migrate(self):
+        """Moves the rows of the scans table of older versions into the new tables.
+        The old table is renamed afterwards, not dropped.
+        """
+        exists = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'scans'").fetchone()
+        if not exists:
+            return
+
+        with self.conn:
+            c = self.conn.cursor()
+            for date, host, open_tcp in c.execute('SELECT date, host, open_tcp FROM scans ORDER BY rowid').fetchall():
+                self.insert_scan(c, {}, self.parse_date(date), host, self.decode_ports(open_tcp))
+            c.execute('ALTER TABLE scans RENAME TO scans_migrated')
+
+    def fill_port_stats(self):
+        """Counts the open ports of the stored scans if the statistics are empty."""
+        with self.conn:
+            if self.conn.execute('SELECT 1 FROM port_stats LIMIT 1').fetchone():
+                return
+            self.conn.execute('''INSERT INTO port_stats (port, open_count)
+                                 SELECT port, COUNT(*) FROM open_port GROUP BY port''')
+
+    @staticmethod
+    def parse_date(date):
+        """Converts the date of older versions to a timestamp.
+
+        Args:
+            date (str) : Date as '%x %X'
+
+        Return:
+            timestamp (float) : Seconds since the epoch, 0 if the date is unreadable
+        """
+        try:
+            return time.mktime(time.strptime(date, '%x %X'))
+        except (TypeError, ValueError):
+            return 0.0
 
     def save_scan(self, host, ports_tcp):
         """Saves the Scan-Results to the Database
+        The scan is handed to the background writer, flush() waits until it is stored.
+
+        Args:
+            host (str)          : Host IP-Address
+            ports_tcp (PortSet) : The opened TCP-Ports
+        """
+        self.enqueue(self.insert_scan, time.time(), host, ports_tcp)
+
+    def enqueue(self, method, *args):
+        """Hands a write to the background writer.
+
+        Args:
+            method (function) : Called with the cursor, the cache of the host ids and the args
+            args : Further arguments of the method
+        """
+        if self.error is not None:
+            raise self.error
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.write_scans, daemon=True)
+            self.writer.start()
+        self.queue.put((method, args))
+
+    def write_scans(self):
+        """Stores the enqueued scans and checkpoints until close() is called.
+        The writer waits a little for further writes, so many of them share one transaction.
+        If a write of a transaction is faulty, the writes are stored one by one, so only the faulty writes
+        are lost. The first error is raised by the next save, flush() or close().
+        """
+        conn = self.connect()
+        host_ids = {}
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            scans = [item for item in batch if item is not None]
+            running = len(scans) == len(batch)
+            try:
+                self.write_batch(conn, host_ids, scans)
+            except sqlite3.OperationalError as e:
+                self.error = self.error or e
+            except sqlite3.Error:
+                for scan in scans:
+                    try:
+                        self.write_batch(conn, host_ids, [scan])
+                    except sqlite3.Error as e:
+                        self.error = self.error or e
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+        conn.close()
+
+    def write_batch(self, conn, host_ids, writes):
+        """Stores writes in one transaction.
+        A failed transaction is rolled back, it is tried again if the error was an operational one.
+
+        Args:
+            conn (Connection) : The connection of the writer
+            host_ids (dict)   : Cache of the ids of the hosts
+            writes (list)     : (method, args) of every write
+        """
+        for attempt in range(1, self.write_attempts + 1):
+            start, changes = time.perf_counter(), conn.total_changes
+            try:
+                with conn:
+                    c = conn.cursor()
+                    for method, args in writes:
+                        method(c, host_ids, *args)
+            except sqlite3.Error as e:
+                # the ids of the hosts inserted by the transaction were rolled back with it
+                host_ids.clear()
+                if not isinstance(e, sqlite3.OperationalError) or attempt == self.write_attempts:
+                    raise
+                time.sleep(self.retry_wait)
+                continue
+            self.stats_version += 1
+            if self.metrics is not None:
+                self.metrics.add_time('db_commit', time.perf_counter() - start)
+                self.metrics.count('db_rows', conn.total_changes - changes)
+                self.metrics.count('db_transactions')
+            return
+
+    def save_banner(self, host, port_number, service, version, banner):
+        """Saves the banner of a port, it replaces the previous banner of the port.
+        The banner is handed to the background writer like the scans.
+
+        Args:
+            host (str)        : Host IP-Address
+            port_number (int) : The Port number
+            service (str)     : The detected service
+            version (str)     : The detected version, empty if unknown
+            banner (str)      : The text of the banner
+        """
+        self.enqueue(self.insert_banner, time.time(), host, port_number, service, version, banner)
+
+    @staticmethod
+    def host_id(c, host_ids, host):
+        """Returns the id of a host, the host is inserted if it is new.
+
+        Args:
+            c (Cursor)      : Cursor of the open transaction
+            host_ids (dict) : Cache of the ids of the hosts
+            host (str)      : Host IP-Address
+
+        Return:
+            host_id (int) : Id of the host
+        """
+        host_id = host_ids.get(host)
+        if host_id is None:
+            c.execute('INSERT OR IGNORE INTO host (address) VALUES (?)', (host,))
+            host_id = c.execute('SELECT id FROM host WHERE address = ?', (host,)).fetchone()[0]
+            host_ids[host] = host_id
+        return host_id
+
+    @classmethod
+    def insert_banner(cls, c, host_ids, date, host, port_number, service, version, banner):
+        """Inserts or replaces the banner of a port.
+
+        Args:
+            c (Cursor)        : Cursor of the open transaction
+            host_ids (dict)   : Cache of the ids of the hosts
+            date (float)      : Time the banner was grabbed
+            host (str)        : Host IP-Address
+            port_number (int) : The Port number
+            service (str)     : The detected service
+            version (str)     : The detected version
+            banner (str)      : The text of the banner
+        """
+        c.execute('''INSERT OR REPLACE INTO banner (host_id, port, date, service, version, banner)
+                     VALUES (?, ?, ?, ?, ?, ?)''',
+                  (cls.host_id(c, host_ids, host), port_number, date, service, version, banner))
+
+    @classmethod
+    def insert_scan(cls, c, host_ids, date, host, ports_tcp):
+        """Inserts one scan with its host and open ports.
+
+        Args:
+            c (Cursor)          : Cursor of the open transaction
+            host_ids (dict)     : Cache of the ids of the hosts
+            date (float)        : Time of the scan
+            host (str)          : Host IP-Address
+            ports_tcp (PortSet) : The opened TCP-Ports
+        """
+        host_id = cls.host_id(c, host_ids, host)
+        c.execute('INSERT INTO scan (date, host_id, open_tcp) VALUES (?, ?, ?)', (date, host_id, ports_tcp.to_bytes()))
+        scan_id = c.lastrowid
+        c.executemany('INSERT INTO open_port (scan_id, port) VALUES (?, ?)',
+                      [(scan_id, port_number) for port_number in ports_tcp])
+        c.executemany('''INSERT INTO port_stats (port, open_count) VALUES (?, 1)
+                         ON CONFLICT (port) DO UPDATE SET open_count = open_count + 1''',
+                      [(port_number,) for port_number in ports_tcp])
+
+    def create_checkpoint(self, hosts, ports, protocol, seed):
+        """Creates the checkpoint of a new scan.
+
+        Args:
+            hosts (str) : The hosts of the scan
+            ports (str) : The ports of the scan
+            protocol (str) : 'tcp' or 'syn'
+            seed (int) : Seed of the random scan order, None for ascending order
+
+        Return:
+            checkpoint_id (int) : Id of the checkpoint
+        """
+        now = time.time()
+        with self.conn:
+            c = self.conn.execute('''INSERT INTO checkpoint (created, updated, hosts, ports, protocol, seed, position,
+                                     finished) VALUES (?, ?, ?, ?, ?, ?, 0, 0)''', (now, now, hosts, ports, protocol, seed))
+        return c.lastrowid
+
+    def save_checkpoint(self, checkpoint_id, position, results):
+        """Hands the progress of a scan to the background writer.
+
+        Args:
+            checkpoint_id (int) : Id of the checkpoint
+            position (int) : Position of the first work item that is not finished yet
+            results (dict) : PortSet of the open ports of the hosts that changed since the last checkpoint
+        """
+        self.enqueue(self.store_checkpoint, checkpoint_id, position,
+                     [(host, ports.to_bytes()) for host, ports in results.items()])
+
+    @staticmethod
+    def store_checkpoint(c, host_ids, checkpoint_id, position, results):
+        """Stores the progress of a scan.
+
+        Args:
+            c (Cursor)          : Cursor of the open transaction
+            host_ids (dict)     : Cache of the ids of the hosts, unused
+            checkpoint_id (int) : Id of the checkpoint
+            position (int)      : Position of the first work item that is not finished yet
+            results (list)      : (host, encoded PortSet) of the hosts that changed
+        """
+        c.execute('UPDATE checkpoint SET position = ?, updated = ? WHERE id = ?', (position, time.time(), checkpoint_id))
+        c.executemany('INSERT OR REPLACE INTO checkpoint_result (checkpoint_id, host, open_tcp) VALUES (?, ?, ?)',
+                      [(checkpoint_id, host, open_tcp) for host, open_tcp in results])
+
+    def finish_checkpoint(self, checkpoint_id):
+        """Drops the checkpoint of a finished scan and its partial results.
+
+        Args:
+            checkpoint_id (int) : Id of the checkpoint
+        """
+        self.enqueue(self.store_finished, checkpoint_id)
+
+    @staticmethod
+    def store_finished(c, host_ids, checkpoint_id):
+        """Deletes the checkpoint of a finished scan.
 
         Args:
-            host (str)       : Host IP-Address
-            ports_tcp (list) : List of TCP-Ports
+            c (Cursor)          : Cursor of the open transaction
+            host_ids (dict)     : Cache of the ids of the hosts, unused
+            checkpoint_id (int) : Id of the checkpoint
         """
-        c = self.conn.cursor()
-        # Insert a row of data
-        c.execute("INSERT INTO scans VALUES ('" + time.strftime("%x %X") + "', '" + host + "', '" +
-                  self.list_to_string(ports_tcp) + "')")
-        # Save (commit) the changes
-        self.conn.commit()
+        c.execute('DELETE FROM checkpoint_result WHERE checkpoint_id = ?', (checkpoint_id,))
+        c.execute('DELETE FROM checkpoint WHERE id = ?', (checkpoint_id,))
+
+    def load_checkpoint(self, checkpoint_id):
+        """Loads the checkpoint of a scan.
+
+        Args:
+            checkpoint_id (int) : Id of the checkpoint
+
+        Return:
+            checkpoint (tuple) : (hosts, ports, protocol, seed, position, finished, PortSet of every host),
+                                 None if there is no such checkpoint
+        """
+        row = self.conn.execute('''SELECT hosts, ports, protocol, seed, position, finished FROM checkpoint
+                                   WHERE id = ?''', (checkpoint_id,)).fetchone()
+        if row is None:
+            return None
+        results = {host: PortSet.from_bytes(open_tcp) for host, open_tcp in self.conn.execute(
+            'SELECT host, open_tcp FROM checkpoint_result WHERE checkpoint_id = ?', (checkpoint_id,))}
+        return row + (results,)
+
+    def flush(self):
+        """Waits until all saved scans are stored."""
+        self.queue.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """Stores the remaining scans, stops the writer and closes the Database."""
+        if self.writer is not None:
+            self.queue.put(None)
+            self.writer.join()
+            self.writer = None
+        self.conn.close()
+        if self.error is not None:
+            raise self.error
 
     def load_scans(self):
         """Loads the previous scans.
 
         Return:
-            ret (array) : Array of the Database Entries
+            ret (array) : Array of the Database Entries, the newest first
+        """
+        return list(self.last_scans())
+
+    def last_scans(self, limit=None):
+        """Streams the latest scans from the Database, the newest first.
+
+        Args:
+            limit (int) : Maximum number of scans, all if None
+
+        Return:
+            scans (generator) : (date, host, PortSet) of every scan
+        """
+        cursor = self.conn.execute('''SELECT scan.date, host.address, scan.open_tcp FROM scan
+                                      JOIN host ON host.id = scan.host_id
+                                      ORDER BY scan.id DESC LIMIT ?''', (self.sql_limit(limit),))
+        for date, host, open_tcp in cursor:
+            yield self.format_date(date), host, self.decode_ports(open_tcp)
+
+    def host_history(self, host, limit=None):
+        """Streams the scans of a host, the newest first.
+
+        Args:
+            host (str)  : Host IP-Address
+            limit (int) : Maximum number of scans, all if None
+
+        Return:
+            scans (generator) : (date, host, PortSet) of every scan
+        """
+        cursor = self.conn.execute('''SELECT scan.date, scan.open_tcp FROM scan
+                                      WHERE scan.host_id = (SELECT id FROM host WHERE address = ?)
+                                      ORDER BY scan.id DESC LIMIT ?''', (host, self.sql_limit(limit)))
+        for date, open_tcp in cursor:
+            yield self.format_date(date), host, self.decode_ports(open_tcp)
+
+    def last_scan(self, host):
+        """Loads the open ports of the latest scan of a host.
+
+        Args:
+            host (str) : Host IP-Address
+
+        Return:
+            ports (PortSet) : The opened Ports, None if the host was never scanned
+        """
+        for _, _, ports in self.host_history(host, 1):
+            return ports
+        return None
+
+    def last_scans_of(self, hosts):
+        """Loads the open ports of the latest scan of many hosts in one query.
+        The hosts are passed as one JSON array, so their number is not bound by the parameter limit.
+
+        Args:
+            hosts (iterable) : Host IP-Addresses
+
+        Return:
+            last (dict) : PortSet of the opened Ports of every host that was scanned
+        """
+        cursor = self.conn.execute('''SELECT host.address, scan.open_tcp FROM host
+                                      JOIN scan ON scan.id = (SELECT MAX(latest.id) FROM scan AS latest
+                                                              WHERE latest.host_id = host.id)
+                                      WHERE host.address IN (SELECT value FROM json_each(?))''',
+                                   (json.dumps(list(hosts)),))
+        return {host: self.decode_ports(open_tcp) for host, open_tcp in cursor}
+
+    def hosts_with_port(self, port_number):
+        """Streams the hosts whose latest scan found the port open.
+
+        Args:
+            port_number (int) : The Port number
+
+        Return:
+            hosts (generator) : (date, host) of the latest scan of every host
+        """
+        cursor = self.conn.execute('''SELECT scan.date, host.address FROM open_port
+                                      JOIN scan ON scan.id = open_port.scan_id
+                                      JOIN host ON host.id = scan.host_id
+                                      WHERE open_port.port = ?
+                                      AND scan.id = (SELECT MAX(latest.id) FROM scan AS latest
+                                                     WHERE latest.host_id = scan.host_id)
+                                      ORDER BY host.address''', (port_number,))
+        for date, host in cursor:
+            yield self.format_date(date), host
+
+    def port_changes(self, host):
+        """Compares the last two scans of a host.
+
+        Args:
+            host (str) : Host IP-Address
+
+        Return:
+            changes (tuple) : (date of the older scan, date of the newer scan, opened PortSet, closed PortSet),
+                              None if the host was scanned less than twice
         """
-        ret = []
-        for row in self.conn.execute("SELECT * from scans"):
-            ret.insert(0, (row[0], row[1], self.string_to_list(row[2])))
-        return ret
+        scans = list(self.host_history(host, 2))
+        if len(scans) < 2:
+            return None
+        (new_date, _, new_ports), (old_date, _, old_ports) = scans
+        return old_date, new_date, new_ports - old_ports, old_ports - new_ports
+
+    def top_ports(self, limit):
+        """Loads the ports that were found open most often.
+        The lists are cached until the next scans are stored.
+
+        Args:
+            limit (int) : Maximum number of ports
+
+        Return:
+            ports (list) : Port numbers, the most frequently open first
+        """
+        if self.ranking_version != self.stats_version:
+            self.ranking_cache = {}
+            self.ranking_version = self.stats_version
+        ports = self.ranking_cache.get(limit)
+        if ports is None:
+            cursor = self.conn.execute('SELECT port FROM port_stats ORDER BY open_count DESC, port LIMIT ?',
+                                       (self.sql_limit(limit),))
+            ports = self.ranking_cache[limit] = [row[0] for row in cursor]
+        return ports
 
     @staticmethod
-    def list_to_string(ports_list):
-        """Converts the Port-List to a comma separated string.
+    def sql_limit(limit):
+        """Converts the limit of a query, -1 means no limit in SQLite.
 
         Args:
-            ports_list (list) : The List of Ports
+            limit (int) : Maximum number of rows, all if None
 
         Return:
-            open_ports (str)  : String of opened Ports
+            limit (int) : Value for LIMIT
         """
-        if not ports_list:
-            return ""
+        return -1 if limit is None else limit
 
-        open_ports = ""
-        for key, value in ports_list.items():
-            if value == 1:
-                if open_ports == "":
-                    open_ports += str(key)
-                else:
-                    open_ports += "," + str(key)
-        return open_ports
+    @staticmethod
+    def format_date(timestamp):
+        """Formats the time of a scan.
+
+        Args:
+            timestamp (float) : Seconds since the epoch
+
+        Return:
+            date (str) : Date as '%x %X'
+        """
+        return time.strftime('%x %X', time.localtime(timestamp))
+
+    @classmethod
+    def decode_ports(cls, value):
+        """Converts the stored open ports to a PortSet.
+        Rows of older versions store a comma separated string instead of the binary encoding.
+
+        Args:
+            value (bytes) : The stored open ports
+
+        Return:
+            ports (PortSet) : The opened Ports
+        """
+        if isinstance(value, str):
+            return cls.string_to_list(value)
+        return PortSet.from_bytes(value)
 
     @staticmethod
-    def string_to_list(port_string):
-        """Converts the comma separated port string to a List
+    def list_to_string(ports_list):
+        """Converts the PortSet to a comma separated string.
 
         Args:
-            port_string (str) : String of opened Ports
+            ports_list (PortSet) : The opened Ports
 
         Return:
-            port_list (list)  : The List of Ports
+            open_ports (str)  : String of opened Ports
         """
-        if port_string == '':
-            return []
+        return ports_list.to_string()
 
-        # fills list with zeros
-        port_list = {}
-        for i in range(0, 65535):
-            port_list[i] = 0
+    @staticmethod
+    def string_to_list(port_string):
+        """Converts the comma separated port string to a PortSet
 
-        # sets the value of the list with the corresponding port number to 1 (open)
-        for item in port_string.split(','):
-            port_list[int(item)] = 1
+        Args:
+            port_string (str) : String of opened Ports
 
-        return port_list
+        Return:
+            port_list (PortSet) : The opened Ports
+        """
+        return PortSet.from_string(port_string)
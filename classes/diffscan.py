@@ -0,0 +1,97 @@
+import math
+import random
+
+from classes.portset import PortSet
+from classes.scan import Scan
+from classes.targets import HostPorts, Targets
+
+
+class DiffScan:
+    """This class rescans targets against the results of their last logged scan.
+    The ports that were open in the last scan of a host are probed first, so closed ports are
+    known after a few probes. The rest of the range is swept afterwards, either completely or a
+    random sample of it, to find the ports that are new.
+    """
+
+    def __init__(self, ports, ip, controller, sweep=100, seed=None, **options):
+        """Initializes the DiffScan-Class and loads the last results of the hosts.
+
+        Args:
+            ports (str) : Ports and Port-Ranges to scan (50-80,443)
+            ip (str) : IP-Addresses, Hostnames, CIDR blocks or address ranges to scan
+            controller (DBController) : The database with the last results
+            sweep (int) : Percentage of the remaining ports that is swept after the known ports
+            seed (int) : Seed of the order of the sweep, a random one is used for a partial sweep
+            options : Further arguments of the Scan-Class
+        """
+        self.ports = ports
+        self.ip = ip
+        self.controller = controller
+        self.sweep = sweep
+        self.seed = seed
+        self.options = options
+
+        self.targets = Targets(ip, ports, resolver=options.get('resolver'))
+        self.known = self.load_known()
+
+    def load_known(self):
+        """Loads the open ports of the last scan of every host within the port ranges.
+
+        Returns:
+            known (dict) : PortSet of the last open ports of every host with a logged scan
+        """
+        scanned = PortSet.from_ranges(self.targets.port_ranges)
+        last = self.controller.last_scans_of(self.targets.hosts())
+        return {host: last[host] & scanned for host in self.targets.hosts() if host in last}
+
+    def scan_known(self, protocol):
+        """Probes the ports that were open in the last scan.
+
+        Args:
+            protocol (str) : 'tcp' or 'syn'
+
+        Returns:
+            output (dict) : PortSet of the ports of every host that are still open
+        """
+        targets = HostPorts(self.known)
+        if not len(targets):
+            return {}
+        return self.run(Scan(None, None, targets=targets, **self.options), protocol)
+
+    def scan_rest(self, protocol):
+        """Sweeps the ports that were not open in the last scan.
+
+        Args:
+            protocol (str) : 'tcp' or 'syn'
+
+        Returns:
+            output (dict) : PortSet of the new open ports of every host
+        """
+        seed = self.seed
+        limit = None
+        if self.sweep < 100:
+            if seed is None:
+                seed = random.getrandbits(32)
+            remaining = self.targets.size() - sum(len(host_ports) for host_ports in self.known.values())
+            limit = math.ceil(remaining * self.sweep / 100)
+
+        targets = Targets(self.ip, self.ports, seed, exclude=self.known, limit=limit,
+                          resolver=self.options.get('resolver'))
+        if not len(targets):
+            return {}
+        return self.run(Scan(None, None, targets=targets, **self.options), protocol)
+
+    @staticmethod
+    def run(sc, protocol):
+        """Runs the scan with the protocol.
+
+        Args:
+            sc (Scan) : The scan
+            protocol (str) : 'tcp' or 'syn'
+
+        Returns:
+            output (dict) : PortSet of the opened ports of every host with open ports
+        """
+        if protocol == 'syn':
+            return sc.scan_syn()
+        return sc.scan_tcp()
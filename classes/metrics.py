@@ -0,0 +1,270 @@
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+
+class Metrics:
+    """This class collects the counters, the phase timers and the round trip times of the scans.
+    The engines, the resolver and the database writer only report to it if a Metrics object is
+    passed to them, without one the hooks are a single check for None.
+    The counters and the progress can be printed while the scans run and exported as JSON or
+    as a textfile of the Prometheus node exporter.
+    """
+
+    # Upper bounds of the buckets of the round trip times in seconds
+    RTT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    # Counters that are always exported, also if they stay 0
+    COUNTERS = ('probes_sent', 'replies', 'open', 'closed', 'filtered', 'timeouts', 'retries', 'send_errors',
+                'db_rows', 'db_transactions')
+
+    # Prefix of the Prometheus metrics
+    PREFIX = 'penscan'
+
+    def __init__(self):
+        """Initializes the Metrics-Class, the clock of the elapsed time starts now."""
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+
+        # phase -> [seconds, number of timed sections]
+        self.phases = {}
+
+        # Number of round trip times per bucket, the last bucket counts those above all bounds
+        self.rtt_counts = [0] * (len(self.RTT_BUCKETS) + 1)
+        self.rtt_sum = 0.0
+
+        # Number of probes of the running scans, for the progress
+        self.total = 0
+
+        self.reporter = None
+        self.stopped = threading.Event()
+
+    def count(self, name, value=1):
+        """Adds to a counter.
+
+        Args:
+            name (str) : Name of the counter
+            value (int) : Amount to add
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_time(self, phase, seconds):
+        """Adds the duration of a timed section to a phase.
+
+        Args:
+            phase (str) : Name of the phase
+            seconds (float) : Duration of the section
+        """
+        with self.lock:
+            entry = self.phases.get(phase)
+            if entry is None:
+                entry = self.phases[phase] = [0.0, 0]
+            entry[0] += seconds
+            entry[1] += 1
+
+    def phase(self, phase):
+        """Returns a context manager that adds the time of its block to a phase.
+
+        Args:
+            phase (str) : Name of the phase
+
+        Returns:
+            timer (PhaseTimer) : The context manager
+        """
+        return PhaseTimer(self, phase)
+
+    def probe(self, result=None, wait=None):
+        """Counts a finished connect, one lock for all its values.
+
+        Args:
+            result (str) : Counter of the result ('replies', 'timeouts' or 'send_errors'), None for no counter
+            wait (float) : Seconds the connect took, added to the phase connect_wait
+        """
+        with self.lock:
+            self.counters['probes_sent'] += 1
+            if result is not None:
+                self.counters[result] += 1
+            if wait is not None:
+                entry = self.phases.get('connect_wait')
+                if entry is None:
+                    entry = self.phases['connect_wait'] = [0.0, 0]
+                entry[0] += wait
+                entry[1] += 1
+
+    def result(self, state, rtt=None):
+        """Counts the state of a probed port and its round trip time.
+
+        Args:
+            state (str) : 'open', 'closed' or 'filtered'
+            rtt (float) : Round trip time in seconds, None if unknown
+        """
+        index = None if rtt is None else bisect_left(self.RTT_BUCKETS, rtt)
+        with self.lock:
+            self.counters[state] += 1
+            if index is not None:
+                self.rtt_counts[index] += 1
+                self.rtt_sum += rtt
+
+    def add_total(self, probes):
+        """Adds the probes of a starting scan to the progress.
+
+        Args:
+            probes (int) : Number of probes of the scan
+        """
+        with self.lock:
+            self.total += probes
+
+    def progress(self):
+        """Returns the progress of the scans.
+
+        Returns:
+            progress (dict) : Sent and total probes, elapsed seconds, probes per second and the
+                              estimated seconds until all probes are sent (None if unknown)
+        """
+        with self.lock:
+            sent, total = self.counters['probes_sent'], self.total
+        elapsed = time.monotonic() - self.started
+        rate = sent / elapsed if elapsed > 0 else 0.0
+        eta = (total - sent) / rate if rate > 0 and total >= sent else None
+        return {'sent': sent, 'total': total, 'elapsed': elapsed, 'rate': rate, 'eta': eta}
+
+    def snapshot(self):
+        """Returns all values.
+
+        Returns:
+            stats (dict) : Counters, phases, round trip time histogram and progress
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            phases = {phase: {'seconds': round(seconds, 6), 'count': count}
+                      for phase, (seconds, count) in self.phases.items()}
+            rtt_counts = list(self.rtt_counts)
+            rtt_sum = self.rtt_sum
+        buckets = {str(bound): count for bound, count in zip(self.RTT_BUCKETS + ('+Inf',), rtt_counts)}
+        return {
+            'counters': counters,
+            'phases': phases,
+            'rtt': {'buckets': buckets, 'count': sum(rtt_counts), 'sum': round(rtt_sum, 6)},
+            'progress': self.progress(),
+        }
+
+    def to_json(self):
+        """Returns the values as JSON document."""
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """Returns the values in the text format of Prometheus.
+
+        Returns:
+            text (str) : Counters, phase seconds, round trip time histogram and progress
+        """
+        stats = self.snapshot()
+        prefix = self.PREFIX
+        lines = []
+        for name, value in sorted(stats['counters'].items()):
+            lines.append('# TYPE ' + prefix + '_' + name + '_total counter')
+            lines.append(prefix + '_' + name + '_total ' + str(value))
+
+        lines.append('# TYPE ' + prefix + '_phase_seconds_total counter')
+        for phase, entry in sorted(stats['phases'].items()):
+            lines.append(prefix + '_phase_seconds_total{phase="' + phase + '"} ' + repr(entry['seconds']))
+
+        # Buckets of the histogram are cumulative
+        lines.append('# TYPE ' + prefix + '_rtt_seconds histogram')
+        cumulative = 0
+        for bound, count in stats['rtt']['buckets'].items():
+            cumulative += count
+            lines.append(prefix + '_rtt_seconds_bucket{le="' + bound + '"} ' + str(cumulative))
+        lines.append(prefix + '_rtt_seconds_sum ' + repr(stats['rtt']['sum']))
+        lines.append(prefix + '_rtt_seconds_count ' + str(stats['rtt']['count']))
+
+        progress = stats['progress']
+        for name, value in (('probes_total', progress['total']), ('elapsed_seconds', progress['elapsed']),
+                            ('probes_per_second', progress['rate'])):
+            lines.append('# TYPE ' + prefix + '_' + name + ' gauge')
+            lines.append(prefix + '_' + name + ' ' + repr(value))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def write_file(path, text):
+        """Replaces a file at once, a reader never sees a partly written file.
+
+        Args:
+            path (str) : Path of the file
+            text (str) : New content
+        """
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as file:
+            file.write(text)
+        os.replace(temporary, path)
+
+    def export(self, json_path=None, prometheus_path=None):
+        """Writes the values to the files that are given.
+
+        Args:
+            json_path (str) : Path of the JSON file
+            prometheus_path (str) : Path of the Prometheus textfile, should end with .prom
+        """
+        if json_path:
+            self.write_file(json_path, self.to_json() + '\n')
+        if prometheus_path:
+            self.write_file(prometheus_path, self.to_prometheus())
+
+    def format_progress(self):
+        """Returns the progress as one line of text."""
+        progress = self.progress()
+        line = str(progress['sent']) + '/' + str(progress['total']) + ' probes'
+        if progress['total']:
+            line += ' (' + str(round(min(progress['sent'] / progress['total'], 1.0) * 100, 1)) + '%)'
+        line += ', ' + str(int(progress['rate'])) + '/s'
+        if progress['eta'] is not None:
+            line += ', ETA ' + str(int(progress['eta'])) + 's'
+        return line
+
+    def start_reporting(self, interval=2.0, progress=True, prometheus_path=None, file=None):
+        """Prints the progress and updates the Prometheus textfile every interval while the scans run.
+
+        Args:
+            interval (float) : Seconds between two reports
+            progress (bool) : Print the progress line
+            prometheus_path (str) : Path of the Prometheus textfile, not written if None
+            file (file) : Output of the progress, stderr if None
+        """
+        def report():
+            while not self.stopped.wait(interval):
+                if progress:
+                    print(self.format_progress(), file=file or sys.stderr, flush=True)
+                if prometheus_path:
+                    self.export(prometheus_path=prometheus_path)
+
+        self.reporter = threading.Thread(target=report, daemon=True)
+        self.reporter.start()
+
+    def stop_reporting(self):
+        """Stops the reports."""
+        self.stopped.set()
+        if self.reporter is not None:
+            self.reporter.join()
+            self.reporter = None
+
+
+class PhaseTimer:
+    """Context manager that adds the monotonic time of its block to a phase of the Metrics."""
+
+    def __init__(self, metrics, phase):
+        self.metrics = metrics
+        self.phase = phase
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.add_time(self.phase, time.perf_counter() - self.start)
+        return False
@@ -0,0 +1,91 @@
+import random
+
+
+class Permutation:
+    """This class provides a pseudo-random permutation of the indices 0 to size - 1.
+    The permutation is a Feistel network over the smallest domain of an even number of bits that
+    holds all indices. Indices outside of the range are mapped again until they fall into it
+    (cycle walking), so every index is visited exactly once without storing a shuffled list.
+    The same seed always gives the same order, which allows to resume at any position.
+    """
+
+    # Number of Feistel rounds
+    rounds = 4
+
+    # Odd 64 bit constant of the round function (golden ratio)
+    multiplier = 0x9e3779b97f4a7c15
+
+    def __init__(self, size, seed):
+        """Initializes the Permutation-Class with the size of the index space and the seed.
+
+        Args:
+            size (int) : Number of indices
+            seed (int) : Seed of the round keys
+        """
+        self.size = size
+        self.seed = seed
+
+        # Both halves get the same number of bits
+        bits = max(2, (size - 1).bit_length())
+        self.half_bits = (bits + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+
+        generator = random.Random(seed)
+        self.keys = [generator.getrandbits(64) for _ in range(self.rounds)]
+
+    def __len__(self):
+        """Returns the number of indices."""
+        return self.size
+
+    def __getitem__(self, index):
+        """Returns the index at the position of the permuted order.
+
+        Args:
+            index (int) : Position in the permuted order
+
+        Returns:
+            index (int) : Index at the position
+        """
+        if not 0 <= index < self.size:
+            raise IndexError('Permutation index out of range')
+
+        # Cycle walking: the domain is at most four times the size
+        index = self.encrypt(index)
+        while index >= self.size:
+            index = self.encrypt(index)
+        return index
+
+    def __iter__(self):
+        """Generates all indices in the permuted order."""
+        for position in range(self.size):
+            yield self[position]
+
+    def encrypt(self, value):
+        """Maps a value of the domain through the Feistel network.
+
+        Args:
+            value (int) : Value of the domain
+
+        Returns:
+            value (int) : Permuted value of the domain
+        """
+        left = value >> self.half_bits
+        right = value & self.half_mask
+        for key in self.keys:
+            left, right = right, left ^ self.round_function(right, key)
+        return (left << self.half_bits) | right
+
+    def round_function(self, value, key):
+        """Mixes one half with the round key.
+        The function does not need to be invertible, the Feistel network is a bijection anyway.
+
+        Args:
+            value (int) : Half of the value
+            key (int) : Round key
+
+        Returns:
+            value (int) : Mixed half
+        """
+        value = ((value ^ key) * self.multiplier) & 0xffffffffffffffff
+        value ^= value >> 29
+        return value & self.half_mask
@@ -0,0 +1,243 @@
+import sys
+from array import array
+from bisect import bisect_left
+
+
+class PortSet:
+    """This class is a compact set of port numbers.
+    Small sets are kept as a sorted array of 16 bit port numbers. Once the array would be
+    larger than a bitmap of all 65536 ports (8 KiB), the set switches to the bitmap.
+    Set operations work on the bitmaps as integers, so they run in C instead of per port.
+    The binary encoding is the smaller of both forms with a leading tag byte.
+    """
+
+    # Ports up to which the sorted array is smaller than the bitmap
+    array_limit = 4096
+    bitmap_size = 8192
+
+    # Tags of the binary encoding
+    ARRAY = 0
+    BITMAP = 1
+
+    def __init__(self, ports=()):
+        """Initializes the PortSet-Class with port numbers.
+
+        Args:
+            ports (iterable) : Port numbers of the set
+        """
+        self.ports = array('H')
+        self.bitmap = None
+        self.count = 0
+        for port_number in ports:
+            self.add(port_number)
+
+    def add(self, port_number):
+        """Adds a port to the set.
+
+        Args:
+            port_number (int) : The Port number
+        """
+        if self.bitmap is not None:
+            mask = 1 << (port_number & 7)
+            if not self.bitmap[port_number >> 3] & mask:
+                self.bitmap[port_number >> 3] |= mask
+                self.count += 1
+            return
+
+        index = bisect_left(self.ports, port_number)
+        if index < len(self.ports) and self.ports[index] == port_number:
+            return
+        self.ports.insert(index, port_number)
+        self.count += 1
+        if self.count > self.array_limit:
+            self.to_bitmap()
+
+    def discard(self, port_number):
+        """Removes a port from the set if it is in it.
+
+        Args:
+            port_number (int) : The Port number
+        """
+        if self.bitmap is not None:
+            mask = 1 << (port_number & 7)
+            if self.bitmap[port_number >> 3] & mask:
+                self.bitmap[port_number >> 3] &= ~mask
+                self.count -= 1
+            return
+
+        index = bisect_left(self.ports, port_number)
+        if index < len(self.ports) and self.ports[index] == port_number:
+            del self.ports[index]
+            self.count -= 1
+
+    def __contains__(self, port_number):
+        """Returns True if the port is in the set."""
+        if self.bitmap is not None:
+            return 0 <= port_number <= 0xffff and bool(self.bitmap[port_number >> 3] & (1 << (port_number & 7)))
+        index = bisect_left(self.ports, port_number)
+        return index < len(self.ports) and self.ports[index] == port_number
+
+    def __len__(self):
+        """Returns the number of ports in the set."""
+        return self.count
+
+    def __iter__(self):
+        """Generates the ports in ascending order."""
+        if self.bitmap is None:
+            yield from self.ports
+            return
+        for index, byte in enumerate(self.bitmap):
+            if byte:
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        yield (index << 3) | bit
+
+    def __eq__(self, other):
+        """Returns True if both sets hold the same ports."""
+        if not isinstance(other, PortSet):
+            return NotImplemented
+        return self.count == other.count and self.to_int() == other.to_int()
+
+    def __repr__(self):
+        """Returns the ports as comma separated list."""
+        return 'PortSet(' + self.to_string() + ')'
+
+    def __or__(self, other):
+        """Returns the union of both sets."""
+        return self.from_int(self.to_int() | other.to_int())
+
+    def __and__(self, other):
+        """Returns the intersection of both sets."""
+        return self.from_int(self.to_int() & other.to_int())
+
+    def __sub__(self, other):
+        """Returns the ports of this set that are not in the other set."""
+        return self.from_int(self.to_int() & ~other.to_int())
+
+    def union(self, other):
+        """Returns the union of both sets."""
+        return self | other
+
+    def intersection(self, other):
+        """Returns the intersection of both sets."""
+        return self & other
+
+    def difference(self, other):
+        """Returns the ports of this set that are not in the other set."""
+        return self - other
+
+    def copy(self):
+        """Returns a new set with the same ports."""
+        ports = PortSet()
+        ports.ports = array('H', self.ports)
+        ports.bitmap = None if self.bitmap is None else bytearray(self.bitmap)
+        ports.count = self.count
+        return ports
+
+    def to_bitmap(self):
+        """Switches the set from the sorted array to the bitmap."""
+        bitmap = bytearray(self.bitmap_size)
+        for port_number in self.ports:
+            bitmap[port_number >> 3] |= 1 << (port_number & 7)
+        self.bitmap = bitmap
+        self.ports = array('H')
+
+    def to_int(self):
+        """Returns the set as integer, bit n is set if port n is in the set."""
+        if self.bitmap is not None:
+            return int.from_bytes(self.bitmap, 'little')
+        value = 0
+        for port_number in self.ports:
+            value |= 1 << port_number
+        return value
+
+    @classmethod
+    def from_int(cls, value):
+        """Creates a set from an integer, bit n is set if port n is in the set.
+
+        Args:
+            value (int) : The ports as bits
+
+        Returns:
+            ports (PortSet) : The set
+        """
+        port_set = cls()
+        port_set.bitmap = bytearray(value.to_bytes(cls.bitmap_size, 'little'))
+        port_set.count = bin(value).count('1')
+        if port_set.count <= cls.array_limit:
+            port_set.ports = array('H', port_set)
+            port_set.bitmap = None
+        return port_set
+
+    @classmethod
+    def from_ranges(cls, port_ranges):
+        """Creates a set from ranges of ports.
+
+        Args:
+            port_ranges (list) : Ranges of port numbers with step 1
+
+        Returns:
+            ports (PortSet) : The set
+        """
+        value = 0
+        for port_range in port_ranges:
+            if len(port_range):
+                value |= ((1 << len(port_range)) - 1) << port_range.start
+        return cls.from_int(value)
+
+    def to_bytes(self):
+        """Encodes the set for the storage.
+        Small sets are stored as big-endian 16 bit port numbers, large ones as bitmap.
+
+        Returns:
+            data (bytes) : Tag byte and the ports
+        """
+        if self.bitmap is not None:
+            return bytes([self.BITMAP]) + bytes(self.bitmap)
+        ports = array('H', self.ports)
+        if sys.byteorder == 'little':
+            ports.byteswap()
+        return bytes([self.ARRAY]) + ports.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Decodes a set of the storage.
+
+        Args:
+            data (bytes) : Tag byte and the ports
+
+        Returns:
+            ports (PortSet) : The set
+        """
+        port_set = cls()
+        if not data:
+            return port_set
+        if data[0] == cls.BITMAP:
+            port_set.bitmap = bytearray(data[1:1 + cls.bitmap_size])
+            port_set.count = bin(int.from_bytes(port_set.bitmap, 'little')).count('1')
+            return port_set
+        ports = array('H')
+        ports.frombytes(bytes(data[1:]))
+        if sys.byteorder == 'little':
+            ports.byteswap()
+        port_set.ports = ports
+        port_set.count = len(ports)
+        if port_set.count > cls.array_limit:
+            port_set.to_bitmap()
+        return port_set
+
+    def to_string(self):
+        """Returns the ports as comma separated list."""
+        return ','.join(str(port_number) for port_number in self)
+
+    @classmethod
+    def from_string(cls, port_string):
+        """Creates a set from a comma separated list of ports.
+
+        Args:
+            port_string (str) : Comma separated list of ports
+
+        Returns:
+            ports (PortSet) : The set
+        """
+        return cls(int(item) for item in port_string.split(',') if item.strip())
@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    """This class limits the probes per second of all engines that share it.
+    It is a token bucket: the tokens refill with the current rate up to the burst size and every
+    probe takes one. If the bucket is empty the caller waits until its token is due.
+    Every window the ratio of answered probes is compared to its running average. If it drops,
+    or a send fails with ENOBUFS, the rate is halved. A burst of failed sends halves it once.
+    Otherwise it recovers step by step towards the target rate.
+    """
+
+    # Length of the window of the response ratio in seconds
+    window = 1.0
+
+    # Probes of a window needed for a meaningful response ratio
+    min_window_probes = 50
+
+    # Response ratio below this share of its average counts as loss
+    loss_threshold = 0.5
+
+    # Factor of the rate on loss and share of the target rate added per good window
+    backoff = 0.5
+    recovery = 0.05
+
+    # Seconds after a backoff on a failed send in which further failed sends do not back off again
+    failure_holdoff = 0.1
+
+    # Waits shorter than this are collected instead of slept
+    sleep_granularity = 0.001
+
+    def __init__(self, rate=None, burst=None):
+        """Initializes the RateLimiter-Class with the target rate.
+
+        Args:
+            rate (int) : Target rate in probes per second, unlimited if None
+            burst (int) : Size of the bucket, 1/100 s of the rate if None
+
+        Raises:
+            ValueError : If the rate or the burst is not positive
+        """
+        if rate is not None and rate <= 0:
+            raise ValueError('The rate must be positive: ' + str(rate))
+        if burst is not None and burst <= 0:
+            raise ValueError('The burst must be positive: ' + str(burst))
+        self.target = rate
+        self.rate = rate
+        if burst is None:
+            burst = max(1, int(rate / 100)) if rate else 1
+        self.burst = burst
+        self.min_rate = max(1.0, rate / 100) if rate else None
+
+        self.lock = threading.Lock()
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+        # Response ratio of the current window and its running average
+        self.window_start = self.updated
+        self.window_sent = 0
+        self.window_answered = 0
+        self.average_ratio = None
+
+        # Totals for the statistics
+        self.sent = 0
+        self.answered_total = 0
+        self.failures = 0
+        self.failure_backoff = None
+
+    def delay(self, count=1):
+        """Takes tokens for the probes and returns how long the caller has to wait.
+        The bucket may go into debt, the debt is the wait.
+
+        Args:
+            count (int) : Number of probes
+
+        Returns:
+            delay (float) : Wait in seconds before the probes may be sent
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.sent += count
+            self.window_sent += count
+            if now - self.window_start >= self.window:
+                self.end_window(now)
+
+            if self.rate is None:
+                return 0.0
+
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= count
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, count=1):
+        """Waits until the probes may be sent.
+
+        Args:
+            count (int) : Number of probes
+        """
+        delay = self.delay(count)
+        if delay >= self.sleep_granularity:
+            time.sleep(delay)
+
+    async def acquire_async(self, count=1):
+        """Waits in the event loop until the probes may be sent.
+
+        Args:
+            count (int) : Number of probes
+        """
+        delay = self.delay(count)
+        if delay >= self.sleep_granularity:
+            await asyncio.sleep(delay)
+
+    def answered(self, count=1):
+        """Counts replies to probes.
+
+        Args:
+            count (int) : Number of replies
+        """
+        with self.lock:
+            self.window_answered += count
+            self.answered_total += count
+
+    def send_failed(self):
+        """Backs off because the network stack could not take another probe.
+        The retries of the same full queue come within the holdoff and do not back off again.
+        """
+        with self.lock:
+            self.failures += 1
+            now = time.monotonic()
+            if self.failure_backoff is None or now - self.failure_backoff >= self.failure_holdoff:
+                self.failure_backoff = now
+                self.decrease()
+
+    def end_window(self, now):
+        """Compares the response ratio of the window with its average and adapts the rate.
+
+        Args:
+            now (float) : Monotonic time
+        """
+        if self.window_sent >= self.min_window_probes:
+            ratio = self.window_answered / self.window_sent
+            if self.average_ratio is None:
+                self.average_ratio = ratio
+            elif ratio < self.average_ratio * self.loss_threshold:
+                self.decrease()
+            else:
+                self.increase()
+            # The average follows lasting changes, e.g. a block of filtered hosts
+            self.average_ratio = 0.9 * self.average_ratio + 0.1 * ratio
+
+        self.window_start = now
+        self.window_sent = 0
+        self.window_answered = 0
+
+    def decrease(self):
+        """Halves the rate, down to 1/100 of the target."""
+        if self.rate is not None:
+            self.rate = max(self.min_rate, self.rate * self.backoff)
+
+    def increase(self):
+        """Raises the rate by a share of the target, up to the target."""
+        if self.rate is not None:
+            self.rate = min(self.target, self.rate + self.target * self.recovery)
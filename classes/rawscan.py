@@ -1,6 +1,12 @@
+import ctypes
+import os
 import socket
+from hashlib import blake2b
 from struct import *
 
+# Not exported by the socket module, value of linux/asm-generic/socket.h
+SO_ATTACH_FILTER = getattr(socket, 'SO_ATTACH_FILTER', 26)
+
 
 class RawScan:
     """This class sets the necessary options to perform a stealth syn scan.
@@ -13,6 +19,19 @@ class RawScan:
     ip_header = b""
     packet = b""
 
+    # Layout of a probe: 20 byte ip header followed by 20 byte tcp header
+    packet_length = 40
+    ip_checksum_offset = 10
+    src_addr_offset = 12
+    dest_addr_offset = 16
+    src_port_offset = 20
+    dest_port_offset = 22
+    tcp_checksum_offset = 36
+
+    # Range of the source ports if they are derived from the cookie
+    src_port_base = 32768
+    src_port_count = 28232
+
     # Initialize all settings necessary for the ip header
     version = 0x4
     ihl = 0x5
@@ -24,7 +43,6 @@ class RawScan:
     ttl = 0x40
     protocol = 0x6
     header_checksum = 0x0
-    src_ip = socket.gethostbyname(socket.getfqdn())
 
     # Putting version and ihl into one byte
     v_ihl = (version << 4) + ihl
@@ -55,19 +73,55 @@ class RawScan:
     # Putting both together into two byte
     data_offset_flags = data_offset + flags
 
-    def __init__(self, ip):
+    # TCP flags of the replies
+    SYN_ACK = 0x12
+    RST = 0x04
+
+    # Classic BPF opcodes (linux/filter.h)
+    BPF_LDB_ABS = 0x30    # A = byte at [k]
+    BPF_LDH_ABS = 0x28    # A = half word at [k]
+    BPF_LD_ABS = 0x20     # A = word at [k]
+    BPF_LDH_IND = 0x48    # A = half word at [X + k]
+    BPF_LDXB_MSH = 0xb1   # X = 4 * ([k] & 0xf)
+    # Networks of the destinations whose source address is kept, the oldest is dropped beyond it
+    SOURCE_CACHE_SIZE = 65536
+
+    BPF_JEQ = 0x15        # pc += (A == k) ? jt : jf
+    BPF_JGE = 0x35        # pc += (A >= k) ? jt : jf
+    BPF_JGT = 0x25        # pc += (A > k) ? jt : jf
+    BPF_JSET = 0x45       # pc += (A & k) ? jt : jf
+    BPF_RET = 0x06        # return k
+
+    def __init__(self, ip=None, secret=None, random_src_port=False):
         """RawScan Constructor.
         Sets the values of the necessary properties.
 
         Args:
-            ip (str)    : Ip of the target
+            ip (str)    : Ip of the target, None if the probes go to many targets
+            secret (bytes) : Key of the probe cookies, a random one is used if none is given
+            random_src_port (bool) : Derive the source port of every probe from its cookie
         """
 
         self.dest_ip = ip
 
+        # Source address of every /24 network of the destinations, looked up on first use
+        self.src_addrs = {}
+
+        # Keyed hash of the probe cookies, copied for every probe
+        self.secret = secret if secret is not None else os.urandom(16)
+        self.cookie_hash = blake2b(key=self.secret, digest_size=6)
+        self.random_src_port = random_src_port
+
         # Converting from dotted-quad string into 32 bit packed binary
-        self.src_addr = socket.inet_aton(self.src_ip)
-        self.dest_addr = socket.inet_aton(ip)
+        self.dest_addr = socket.inet_aton(ip) if ip is not None else bytes(4)
+        self.src_addr = self.source_address(self.dest_addr) if ip is not None else bytes(4)
+        self.src_ip = socket.inet_ntoa(self.src_addr)
+
+        # Template of the probe, only the addresses and the checksums change per probe
+        self.template = b""
+        self.template_ip_checksum = 0
+        self.template_checksum = 0
+        self.build_template()
 
     @staticmethod
     def calc_checksum(msg):
@@ -94,7 +148,9 @@ class RawScan:
 
         # Removing carryover by moving 4 bytes down then
         # do and conjunction with 4 bytes of 1's
-        s = (s >> 16) + (s & 0xffff)
+        # Folding again until no carryover is left
+        while s >> 16:
+            s = (s >> 16) + (s & 0xffff)
 
         # Negation
         # Complement of s and subtract from highest value
@@ -102,6 +158,293 @@ class RawScan:
 
         return s
 
+    @staticmethod
+    def update_checksum(checksum, old_value, new_value):
+        """Incremental update of a checksum.
+        If a single 16 bit word of the message changes, the new checksum can be derived from
+        the old one without adding up the whole message again (RFC 1624, Eqn. 3):
+
+            HC' = ~(~HC + ~m + m')
+
+        Args:
+            checksum (int) : Checksum of the message with the old word
+            old_value (int) : Old 16 bit word
+            new_value (int) : New 16 bit word
+
+        Returns:
+            s (int) : Checksum of the message with the new word
+        """
+        s = (~checksum & 0xffff) + (~old_value & 0xffff) + new_value
+
+        # Removing carryover, the sum of three words needs two folds at most
+        s = (s >> 16) + (s & 0xffff)
+        s = (s >> 16) + (s & 0xffff)
+
+        return ~s & 0xffff
+
+    @staticmethod
+    def patch_checksum(checksum, *new_values):
+        """Incremental update of a checksum for words that are zero in the message.
+        Same as update_checksum for an old word of 0. ~0 is the negative zero of the
+        one's complement sum, so only the new words have to be added.
+
+        Args:
+            checksum (int) : Checksum of the message with the words set to zero
+            new_values (int) : New 16 bit words
+
+        Returns:
+            s (int) : Checksum of the message with the new words
+        """
+        s = (~checksum & 0xffff) + sum(new_values)
+
+        # Removing carryover
+        while s >> 16:
+            s = (s >> 16) + (s & 0xffff)
+
+        return ~s & 0xffff
+
+    def source_address(self, dest_addr):
+        """Returns the source address the kernel uses for a destination.
+        Connecting a UDP socket only looks up the route, no packet is sent. The address of the
+        outgoing interface is part of the tcp checksum, so it has to be known before sending.
+        The route is looked up once per /24 network, the hosts of a network share their route.
+
+        Args:
+            dest_addr (bytes) : Packed destination address
+
+        Returns:
+            src_addr (bytes) : Packed source address, 0.0.0.0 if there is no route
+        """
+        network = dest_addr[:3]
+        src_addr = self.src_addrs.get(network)
+        if src_addr is None:
+            try:
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp_sock:
+                    udp_sock.connect((socket.inet_ntoa(dest_addr), 9))
+                    src_addr = socket.inet_aton(udp_sock.getsockname()[0])
+            except OSError:
+                src_addr = bytes(4)
+            if len(self.src_addrs) >= self.SOURCE_CACHE_SIZE:
+                del self.src_addrs[next(iter(self.src_addrs))]
+            self.src_addrs[network] = src_addr
+        return src_addr
+
+    def cookie(self, dest_addr, port_number):
+        """Calculation of the probe cookie.
+        The cookie is a keyed hash over the destination address and port, so every reply can be
+        validated by recomputing it, without remembering anything about the sent probes.
+        Its upper 32 bits are the sequence number and the lower 16 bits select the source port.
+
+        Args:
+            dest_addr (bytes) : Packed destination address of the probe
+            port_number (int) : Destination port of the probe
+
+        Returns:
+            seq_no, src_port (tuple) : Sequence number and source port of the probe
+        """
+        h = self.cookie_hash.copy()
+        h.update(dest_addr)
+        h.update(port_number.to_bytes(2, 'big'))
+        cookie = int.from_bytes(h.digest(), 'big')
+
+        if self.random_src_port:
+            src_port = self.src_port_base + (cookie & 0xffff) % self.src_port_count
+        else:
+            src_port = self.src_port
+        return cookie >> 16, src_port
+
+    def build_template(self):
+        """Creation of the probe template.
+        The headers are built with source and destination address 0.0.0.0, destination port 0 and
+        sequence number 0 (and source port 0 if it is taken from the cookie) and both checksums are kept.
+        Every probe only needs to patch these fields and update the checksums incrementally,
+        so one template serves all targets and source addresses.
+        """
+
+        # Template is built with port 0, create_packet patches the real one
+        self.dest_port = 0
+        empty_addr = bytes(4)
+
+        # IP header creation with checksum of the header without destination
+        ip_header = pack("!BBHHHBBH4s4s", self.v_ihl, self.type_of_service, self.total_length,
+                         self.identification, self.f_fo,
+                         self.ttl, self.protocol, self.header_checksum,
+                         empty_addr,
+                         empty_addr)
+        self.template_ip_checksum = self.calc_checksum(ip_header)
+        self.ip_header = ip_header[:self.ip_checksum_offset] + pack("!H", self.template_ip_checksum) + \
+            ip_header[self.ip_checksum_offset + 2:]
+
+        # Temporary tcp header creation with checksum 0x0
+        self.tcp_header = self.create_tcp_header()
+        if self.random_src_port:
+            self.tcp_header = pack("!H", 0) + self.tcp_header[2:]
+
+        pseudo_header = pack("!4s4sBBH", empty_addr, empty_addr, self.checksum, self.protocol,
+                             len(self.tcp_header))
+
+        self.template_checksum = self.calc_checksum(pseudo_header + self.tcp_header)
+        self.template = self.ip_header + self.tcp_header
+
+        # Preallocated buffer reused by create_packet
+        self.packet = bytearray(self.template)
+
+    def write_packet(self, buffer, offset, port_number, dest_addr=None):
+        """Writes one probe for the port into the buffer.
+        The template gets copied and only the addresses, the ports, the sequence
+        number from the cookie and the checksums are patched.
+
+        Args:
+            buffer (bytearray) : Buffer to write the probe into
+            offset (int) : Position of the probe in the buffer
+            port_number (int) : Port number to send packet to
+            dest_addr (bytes) : Packed address to send packet to, the target of the class if None
+        """
+        if dest_addr is None:
+            dest_addr = self.dest_addr
+        seq_no, src_port = self.cookie(dest_addr, port_number)
+        src_addr = self.source_address(dest_addr)
+        addr_high, addr_low, src_high, src_low = unpack("!HH", dest_addr) + unpack("!HH", src_addr)
+
+        # The template holds 0 in the patched fields, the addresses are also part of the pseudo header
+        ip_checksum = self.patch_checksum(self.template_ip_checksum, addr_high, addr_low, src_high, src_low)
+        if self.random_src_port:
+            checksum = self.patch_checksum(self.template_checksum, addr_high, addr_low, src_high, src_low,
+                                           port_number, seq_no >> 16, seq_no & 0xffff, src_port)
+        else:
+            checksum = self.patch_checksum(self.template_checksum, addr_high, addr_low, src_high, src_low,
+                                           port_number, seq_no >> 16, seq_no & 0xffff)
+
+        buffer[offset:offset + self.packet_length] = self.template
+        pack_into("!H", buffer, offset + self.ip_checksum_offset, ip_checksum)
+        buffer[offset + self.src_addr_offset:offset + self.src_addr_offset + 4] = src_addr
+        buffer[offset + self.dest_addr_offset:offset + self.dest_addr_offset + 4] = dest_addr
+        pack_into("!HHL", buffer, offset + self.src_port_offset, src_port, port_number, seq_no)
+        pack_into("!H", buffer, offset + self.tcp_checksum_offset, checksum)
+
+    def create_packets(self, ports, dest_addrs=None):
+        """Creation of many probes at once.
+        All probes get written back to back into one buffer, the probe for the i-th
+        port starts at i * packet_length.
+
+        Args:
+            ports (list) : Port numbers to send packets to
+            dest_addrs (list) : Packed address for every port, the target of the class if None
+
+        Returns:
+            buffer (bytearray) : Buffer with all probes
+        """
+        buffer = bytearray(len(ports) * self.packet_length)
+        if dest_addrs is None:
+            for index, port_number in enumerate(ports):
+                self.write_packet(buffer, index * self.packet_length, port_number)
+        else:
+            for index, port_number in enumerate(ports):
+                self.write_packet(buffer, index * self.packet_length, port_number, dest_addrs[index])
+        return buffer
+
+    def parse_reply(self, response):
+        """Parses a received packet in place.
+        The fields are read with unpack_from directly from the buffer, so nothing gets copied.
+        The length of the ip header is taken from the IHL. Only tcp packets addressed to the
+        source port of the probe that acknowledge its cookie are accepted. The cookie covers
+        the address of the target, so replies of other hosts can not be mistaken for ours.
+
+        Args:
+            response (memoryview) : The received ip packet
+
+        Returns:
+            reply (tuple) : (host, port number, tcp flags) of the reply or None if it is no reply to a probe
+        """
+        if len(response) < 20 or response[0] >> 4 != self.version or response[9] != self.protocol:
+            return None
+
+        # Options may extend the ip header, IHL counts 32 bit words
+        ihl = (response[0] & 0x0f) * 4
+        if ihl < 20 or len(response) < ihl + 14:
+            return None
+
+        # Source address must be the target, if there is only one
+        src_addr = bytes(response[12:16])
+        if self.dest_ip is not None and src_addr != self.dest_addr:
+            return None
+
+        # Source port, destination port, sequence number, acknowledgment number, data offset, flags
+        port_number, dest_port, _, ack_no, _, flags = unpack_from("!HHLLBB", response, ihl)
+
+        # The reply acknowledges the sequence number of the probe + 1
+        seq_no, src_port = self.cookie(src_addr, port_number)
+        if dest_port != src_port or ack_no != (seq_no + 1) & 0xffffffff:
+            return None
+
+        return socket.inet_ntoa(src_addr), port_number, flags
+
+    def attach_filter(self, sock):
+        """Attaches a classic BPF program to the raw socket.
+        Without the filter the raw socket receives every tcp packet of the host. With it the kernel
+        only delivers unfragmented tcp packets addressed to our source port(s), and only those
+        of the target if there is one. If the platform does not support socket filters,
+        nothing is attached.
+
+        Args:
+            sock (socket) : The raw socket
+
+        Returns:
+            attached (bool) : True if the filter is active
+        """
+        if self.random_src_port:
+            ports = [(self.BPF_JGE, 0, 2, self.src_port_base),
+                     (self.BPF_JGT, 1, 0, self.src_port_base + self.src_port_count - 1)]
+        else:
+            ports = [(self.BPF_JEQ, 0, 1, self.src_port)]
+
+        if self.dest_ip is not None:
+            address = [(self.BPF_LD_ABS, 0, 0, 12),                 # source address
+                       (self.BPF_JEQ, 0, None, unpack("!L", self.dest_addr)[0])]
+        else:
+            address = []
+
+        # None marks a jump to the final drop instruction
+        program = [
+            (self.BPF_LDB_ABS, 0, 0, 9),                            # protocol
+            (self.BPF_JEQ, 0, None, self.protocol),
+        ] + address + [
+            (self.BPF_LDH_ABS, 0, 0, 6),                            # flags and fragment offset
+            (self.BPF_JSET, None, 0, 0x1fff),
+            (self.BPF_LDXB_MSH, 0, 0, 0),                           # length of the ip header
+            (self.BPF_LDH_IND, 0, 0, 2),                            # tcp destination port
+        ] + ports + [
+            (self.BPF_RET, 0, 0, 0xffff),                           # accept
+            (self.BPF_RET, 0, 0, 0),                                # drop
+        ]
+        drop = len(program) - 1
+        program = [(code, drop - index - 1 if jt is None else jt, drop - index - 1 if jf is None else jf, k)
+                   for index, (code, jt, jf, k) in enumerate(program)]
+        return self.set_filter(sock, program)
+
+    @staticmethod
+    def set_filter(sock, program):
+        """Loads the BPF program into the kernel.
+
+        Args:
+            sock (socket) : The socket to attach the filter to
+            program (list) : Instructions as (code, jt, jf, k) tuples
+
+        Returns:
+            attached (bool) : True if the filter is active
+        """
+        # struct sock_filter { u16 code; u8 jt; u8 jf; u32 k; }
+        instructions = b"".join(pack("HBBI", *instruction) for instruction in program)
+        buffer = ctypes.create_string_buffer(instructions, len(instructions))
+
+        # struct sock_fprog { unsigned short len; struct sock_filter *filter; }
+        fprog = pack("HP", len(program), ctypes.addressof(buffer))
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+        except OSError:
+            return False
+        return True
+
     def create_ip_header(self):
         """Creation the whole ip packet.
         With the use of the pack function the temporary ip header will be created and returned.
@@ -193,6 +536,7 @@ class RawScan:
     def create_packet(self, port_number):
         """Creation of the whole raw packet.
         The ip header and the tcp header get created and merged into one complete raw packet.
+        Both come from the template, so only the port and the tcp checksum are calculated.
 
          Protocol Layering
 
@@ -216,40 +560,7 @@ class RawScan:
             final_header (str) : Final ip + tcp header
         """
 
-        # !     network (= big-endian)
-        # B     unsigned char 1 byte
-        # H     unsigned short 2 byte
-        # L     unsigned long 4 byte
-        # 4s    char[] with length of 4
-
-        # Setting port number
-        self.dest_port = port_number
-
-        # IP header creation with checksum from the temporary ip header
-        final_ip_header = pack("!BBHHHBBH4s4s", self.v_ihl, self.type_of_service, self.total_length,
-                               self.identification, self.f_fo,
-                               self.ttl, self.protocol, self.calc_checksum(self.create_ip_header()),
-                               self.src_addr,
-                               self.dest_addr)
-
-        # Temporary tcp header creation with checksum 0x0
-        tmp_tcp_header = self.create_tcp_header()
-
-        pseudo_header = pack("!4s4sBBH", self.src_addr, self.dest_addr, self.checksum, self.protocol,
-                             len(tmp_tcp_header))
-
-        # Needed for tcp checksum calculation
-        psh = pseudo_header + tmp_tcp_header
-
-        # Creation of final tcp header with correct checksum
-        final_tcp_header = pack("!HHLLHHHH", self.src_port, self.dest_port,
-                                self.seq_no,
-                                self.ack_no,
-                                self.data_offset_flags, self.window_size,
-                                self.calc_checksum(psh), self.urg_pointer)
-
-        self.ip_header = final_ip_header
-        self.tcp_header = final_tcp_header
+        # Patching the template in the preallocated buffer
+        self.write_packet(self.packet, 0, port_number)
 
-        # Putting both together and return
-        return final_ip_header + final_tcp_header
+        return bytes(self.packet)
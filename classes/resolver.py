@@ -0,0 +1,155 @@
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Resolver:
+    """This class resolves hostnames and addresses with a cache.
+    Forward (hostname -> address) and reverse (address -> hostname) lookups are kept in an LRU
+    cache for ttl seconds, failed lookups for negative_ttl seconds. Many names are resolved
+    concurrently in a thread pool, so the latency of the resolver is paid once per batch
+    instead of once per host. Reverse lookups can be switched off.
+    """
+
+    # Seconds a lookup is cached, the system resolver does not return the TTL of the records
+    ttl = 300.0
+    negative_ttl = 30.0
+
+    # Number of cached lookups, the least recently used are dropped
+    max_entries = 65536
+
+    # Lookups that run at the same time
+    workers = 32
+
+    def __init__(self, reverse_dns=True, metrics=None):
+        """Initializes the Resolver-Class.
+
+        Args:
+            reverse_dns (bool) : Resolve addresses to hostnames, reverse() returns the address if False
+            metrics (Metrics) : Counts the lookups and times them in the phases forward_dns and reverse_dns
+        """
+        self.reverse_dns = reverse_dns
+        self.metrics = metrics
+
+        # (kind, key) -> (expiry, result, error)
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.pool = None
+
+    def forward(self, name):
+        """Resolves a hostname to its IPv4 address, an address is returned as it is.
+
+        Args:
+            name (str) : Hostname or address
+
+        Returns:
+            address (str) : Dotted-quad address
+
+        Raises:
+            socket.gaierror : If the name can not be resolved
+        """
+        return self.lookup('forward', name, socket.gethostbyname)
+
+    def reverse(self, address):
+        """Resolves an address to its fully qualified hostname.
+
+        Args:
+            address (str) : Dotted-quad address
+
+        Returns:
+            name (str) : The hostname, the address if there is none or reverse lookups are off
+        """
+        if not self.reverse_dns:
+            return address
+        return self.lookup('reverse', address, socket.getfqdn)
+
+    def forward_many(self, names):
+        """Resolves hostnames concurrently.
+
+        Args:
+            names (iterable) : Hostnames or addresses
+
+        Returns:
+            addresses (list) : Dotted-quad address of every name, in the same order
+
+        Raises:
+            socket.gaierror : If a name can not be resolved
+        """
+        return self.map(self.forward, names)
+
+    def reverse_many(self, addresses):
+        """Resolves addresses concurrently.
+
+        Args:
+            addresses (iterable) : Dotted-quad addresses
+
+        Returns:
+            names (dict) : Hostname of every address
+        """
+        addresses = list(addresses)
+        if not self.reverse_dns:
+            return {address: address for address in addresses}
+        return dict(zip(addresses, self.map(self.reverse, addresses)))
+
+    def map(self, function, items):
+        """Runs the lookups of the items that are not cached in the thread pool.
+
+        Args:
+            function (function) : forward or reverse
+            items (iterable) : Names or addresses
+
+        Returns:
+            results (list) : Result of every item, in the same order
+        """
+        items = list(items)
+        if len(items) < 2:
+            return [function(item) for item in items]
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(self.workers, thread_name_prefix='resolver')
+        return list(self.pool.map(function, items))
+
+    def lookup(self, kind, key, function):
+        """Returns the cached result of a lookup or runs it.
+
+        Args:
+            kind (str) : 'forward' or 'reverse'
+            key (str) : Name or address
+            function (function) : The lookup
+
+        Returns:
+            result (str) : Result of the lookup
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.cache.get((kind, key))
+            if entry is not None and entry[0] > now:
+                self.cache.move_to_end((kind, key))
+                if entry[2] is not None:
+                    raise entry[2]
+                return entry[1]
+
+        start = time.perf_counter()
+        try:
+            result, error = function(key), None
+        except OSError as e:
+            result, error = None, e
+        if self.metrics is not None:
+            self.metrics.add_time(kind + '_dns', time.perf_counter() - start)
+            self.metrics.count('dns_lookups')
+
+        with self.lock:
+            self.cache[(kind, key)] = (now + (self.ttl if error is None else self.negative_ttl), result, error)
+            self.cache.move_to_end((kind, key))
+            if len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        if error is not None:
+            raise error
+        return result
+
+    def close(self):
+        """Stops the threads of the pool."""
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.pool = None
@@ -1,60 +1,399 @@
+import asyncio
+import errno
+import queue
+import resource
 import socket
 import threading
 import select
-import binascii
+import time
+from collections import namedtuple
+from itertools import islice
 
-from classes.rawscan import RawScan
+from classes.portset import PortSet
+from classes.ratelimiter import RateLimiter
+from classes.targets import Targets
+from classes.timing import Timing
+from classes.transport import SocketTransport
+
+# Result of one probe, rtt is the round trip time in seconds or None if it is unknown
+ScanEvent = namedtuple('ScanEvent', ['host', 'port', 'state', 'rtt'])
 
 
 class Scan:
-    """This class provides the methods to scan the target."""
+    """This class provides the methods to scan the targets."""
 
     threads = []        # To perform threading
     output = {}         # For printing purposes
-    portList = []
     SUCCESS = 0         # Success constant
 
+    # States of the probed ports
+    OPEN = 'open'
+    CLOSED = 'closed'
+    FILTERED = 'filtered'
+
     # Limiting access of semaphore
     threadLimiter = threading.BoundedSemaphore(100)
 
-    def __init__(self, ports, ip):
+    # Number of SYN probes built at once
+    SEND_BATCH = 256
+
+    # Largest reply that is read from the raw socket
+    RECV_SIZE = 1024
+
+    # File descriptors kept free for the interpreter, the database and stdio
+    RESERVED_FDS = 64
+
+    # Errors of connect if the local network stack can not take another connection
+    SEND_ERRORS = (errno.ENOBUFS, errno.EAGAIN, errno.EADDRNOTAVAIL)
+
+    # Errors of sendto for a single destination, e.g. a broadcast address or a network without a route
+    DESTINATION_ERRORS = (errno.EACCES, errno.EPERM, errno.EHOSTUNREACH, errno.ENETUNREACH)
+
+    # Seconds between the releases of the budget slots of unanswered SYN probes
+    SLOT_POLL = 0.05
+
+    # Events buffered between the scan and the consumer of stream()
+    STREAM_BUFFER = 65536
+
+    # Seconds a full stream buffer is waited on before the stop flag is checked again
+    STREAM_PUT_WAIT = 0.1
+
+    # Seconds the scan of a closed stream gets to finish its probes in flight
+    STREAM_JOIN_TIMEOUT = 5.0
+
+    def __init__(self, ports, ip, engine='async', concurrency=1000, timing='normal', random_src_port=False,
+                 seed=None, rate_limiter=None, targets=None, budget=None, resolver=None, transport=None,
+                 metrics=None):
         """Initializes Scan-Class with Port-Range and IP-Address.
 
         Args:
-            ports (str) : Port or Port-Range to scan
-            ip (str) : IP-Address to scan
+            ports (str) : Ports and Port-Ranges to scan (50-80,443)
+            ip (str) : IP-Addresses, Hostnames, CIDR blocks or address ranges to scan
+            engine (str) : TCP engine to use, 'async' (event loop) or 'thread' (thread per port)
+            concurrency (int) : Maximum number of connects in flight with the async engine
+            timing (str) : Timing profile, the timeouts adapt to the measured round trip times within its bounds
+            random_src_port (bool) : Derive the source port of every SYN probe from its cookie
+            seed (int) : Seed of the random scan order, ascending order if None
+            rate_limiter (RateLimiter) : Probe rate shared with other scans, unlimited if None
+            targets (Targets) : Work items to scan instead of the ports and ip
+            budget (ProbeBudget) : Probes in flight shared with other scans, all engines take their slots from it
+            resolver (Resolver) : Resolver of the hostnames shared with other scans, the system resolver if None
+            transport (SocketTransport) : Sends the probes, the sockets of the operating system if None
+            metrics (Metrics) : Collects the counters and timers of the scan, nothing is collected if None
         """
+        self.metrics = metrics
+
+        # Work items are generated lazily from the hosts and ports, the hostnames are resolved here
+        if targets is None:
+            start = time.perf_counter()
+            targets = Targets(ip, ports, seed, resolver=resolver)
+            if metrics is not None:
+                metrics.add_time('targets', time.perf_counter() - start)
+        self.targets = targets
+
+        self.engine = engine
+        self.random_src_port = random_src_port
+        self.concurrency = max(1, min(concurrency, self.max_connections()))
+        self.timing = Timing(timing)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.budget = budget
+        self.transport = transport if transport is not None else SocketTransport()
+
+        # Position of the first work item and the open ports found before it, to resume a scan
+        self.start = 0
+        # Position after the last work item, the end of the targets if None, to scan a shard
+        self.stop = None
+        self.initial_output = {}
+        self.checkpoint = None
+
+        # Guards the output, the thread engine records from many threads
+        self.output_lock = threading.Lock()
+
+        # Receiver of the result events and the states it gets, see stream()
+        self.listener = None
+        self.states = (self.OPEN,)
+        self.keep_output = True
+
+        # Set to stop the running scan early, the engines send no further probes
+        self.stopped = threading.Event()
+
+        # Number of validated replies of the SYN-Scan and the PortSet of the answered ports of every host
+        self.replies = 0
+        self.answered = {}
+
+        # (deadline, host) of the SYN probes holding a slot of the budget, in the order they were sent
+        self.in_flight = {}
+        self.in_flight_lock = threading.Lock()
+
+    @classmethod
+    def max_connections(cls):
+        """Returns the number of sockets that can be open at the same time.
+        Every connect in flight holds one file descriptor, so the concurrency window
+        is bounded by the soft limit of open files of the process.
 
-        # Get host from address. If address is given it does nothing
-        self.ip = socket.gethostbyname(ip)
+        Returns:
+            limit (int) : Usable number of file descriptors
+        """
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft == resource.RLIM_INFINITY:
+            return 65535
+        return max(1, soft - cls.RESERVED_FDS)
 
-        # If range is given then save range in array
-        if "-" in ports:
-            for port in range(int(ports.split("-")[0]), int(ports.split("-")[1])+1):
-                self.portList.append(port)
-        elif "," in ports:
-            for port in ports.split(','):
-                self.portList.append(int(port))
-        else:
-            self.portList.append(int(ports))
+    def work_items(self):
+        """Generates the (host, port) work items from the start to the stop position.
+
+        Returns:
+            items (iterator) : (host, port) tuples
+        """
+        items = self.targets.items(self.start)
+        if self.stop is not None:
+            items = islice(items, max(0, self.stop - self.start))
+        return items
+
+    def remaining(self):
+        """Returns the number of work items from the start to the stop position."""
+        stop = len(self.targets) if self.stop is None else min(self.stop, len(self.targets))
+        return max(0, stop - self.start)
 
     def scan_tcp(self):
+        """Starts the TCP-Scan with the selected engine.
+
+        Returns:
+            output: PortSet of the opened ports of every host with open ports
+        """
+        if self.engine == 'thread':
+            return self.scan_tcp_thread()
+        return self.scan_tcp_async()
+
+    def scan_tcp_async(self):
+        """Starts the event-loop based TCP-Scan.
+        A fixed window of worker coroutines pulls the port numbers from one shared iterator,
+        so up to `concurrency` non-blocking connects are in flight from a single thread.
+
+        Returns:
+            output: PortSet of the opened ports of every host with open ports
+        """
+
+        return asyncio.run(self.scan_tcp_task())
+
+    async def scan_tcp_task(self):
+        """Runs the event-loop based TCP-Scan in the running event loop.
+        Scans that run in the same loop can share a ProbeBudget.
+
+        Returns:
+            output: PortSet of the opened ports of every host with open ports
+        """
+
+        # Resetting the fields
+        self.output = dict(self.initial_output)
+        if self.metrics is not None:
+            self.metrics.add_total(self.remaining())
+
+        await self.run_tcp_workers()
+
+        return self.output
+
+    async def run_tcp_workers(self):
+        """Starts the worker coroutines and waits until all ports are scanned."""
+        work = enumerate(self.work_items(), self.start)
+        workers = min(self.concurrency, self.remaining())
+        await asyncio.gather(*[self.tcp_worker(work) for _ in range(workers)])
+
+    async def tcp_worker(self, work):
+        """Scans (host, port) items from the shared iterator until it is exhausted.
+
+        Args:
+            work (iterator) : Iterator over the (position, work item) tuples shared by all workers
+        """
+        loop = asyncio.get_running_loop()
+        for position, (host, port_number) in work:
+            if self.stopped.is_set():
+                break
+            if self.checkpoint is not None:
+                self.checkpoint.started(position)
+            if self.budget is not None:
+                await self.budget.acquire(host)
+            try:
+                await self.rate_limiter.acquire_async()
+                self.record(host, port_number, *await self.connect_tcp_async(loop, host, port_number))
+            finally:
+                if self.budget is not None:
+                    self.budget.release(host)
+            # An interrupted connect stays in flight, it is scanned again on resume
+            if self.checkpoint is not None:
+                self.checkpoint.finished(position)
+
+    def record(self, host, port_number, state, rtt=None):
+        """Writes an open port into the PortSet of the host and passes the result to the listener.
+        Only open ports are kept, so the output does not grow with the size of the scan.
+
+        Args:
+            host (str) : The Host IP-Address
+            port_number (int) : The Port number
+            state (str) : OPEN, CLOSED or FILTERED
+            rtt (float) : Round trip time of the probe in seconds, None if unknown
+        """
+        if state == self.OPEN and self.keep_output:
+            with self.output_lock:
+                ports = self.output.get(host)
+                if ports is None:
+                    ports = self.output[host] = PortSet()
+                ports.add(port_number)
+        if self.metrics is not None:
+            self.metrics.result(state, rtt)
+        if self.listener is not None and state in self.states:
+            self.listener(ScanEvent(host, port_number, state, rtt))
+
+    def stream(self, protocol='tcp', states=None, keep_output=False):
+        """Runs the scan in a background thread and generates its results while it runs.
+        The events are handed over through a bounded queue, a slow consumer slows the scan down.
+        If the consumer stops early, the scan is stopped and the events still queued are dropped.
+
+        Args:
+            protocol (str) : 'tcp' or 'syn'
+            states (tuple) : States of the generated events, only OPEN if None
+            keep_output (bool) : Also collect the open ports in output, e.g. to save them afterwards
+
+        Returns:
+            events (generator) : ScanEvent of every probe with one of the states
+        """
+        events = queue.Queue(self.STREAM_BUFFER)
+        done = object()
+        errors = []
+
+        def deliver(event):
+            # Gives up once the consumer is gone, a full buffer would block the scan forever
+            while not self.stopped.is_set():
+                try:
+                    events.put(event, timeout=self.STREAM_PUT_WAIT)
+                    return
+                except queue.Full:
+                    pass
+
+        def run():
+            try:
+                if protocol == 'syn':
+                    self.scan_syn()
+                else:
+                    self.scan_tcp()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                deliver(done)
+
+        self.stopped.clear()
+        self.listener = deliver
+        self.states = tuple(states) if states is not None else (self.OPEN,)
+        self.keep_output = keep_output
+        scanner = threading.Thread(target=run, daemon=True)
+        scanner.start()
+        try:
+            while True:
+                event = events.get()
+                if event is done:
+                    break
+                yield event
+        finally:
+            self.stopped.set()
+            while True:
+                try:
+                    events.get_nowait()
+                except queue.Empty:
+                    break
+            scanner.join(self.STREAM_JOIN_TIMEOUT)
+            # A scan that is still running keeps the flag and stops at its next probe
+            if not scanner.is_alive():
+                self.stopped.clear()
+            self.listener = None
+            self.keep_output = True
+        if errors:
+            raise errors[0]
+
+    async def connect_tcp_async(self, loop, host, port_number):
+        """Performs a single non-blocking TCP connect through the transport.
+        The deadline of the connect comes from the round trip times of the host.
+        Every answered connect gives a new sample.
+
+        Args:
+            loop (AbstractEventLoop) : The running event loop
+            host (str) : The Host IP-Address
+            port_number (int) : The Port number
+
+        Returns:
+            result (tuple) : (OPEN, CLOSED or FILTERED, round trip time or None)
+        """
+        start = time.perf_counter()
+        err, rtt = await self.transport.connect_async(loop, host, port_number, self.timing.timeout(host))
+        self.connected(host, err, rtt, time.perf_counter() - start)
+        return self.state_of(err), rtt
+
+    def connected(self, host, err, rtt, wait):
+        """Passes the result of a connect to the timing, the rate control and the metrics.
+
+        Args:
+            host (str) : The Host IP-Address
+            err (int) : Error number of the connect, SUCCESS if it connected
+            rtt (float) : Round trip time if the host answered, None otherwise
+            wait (float) : Seconds the connect took
+        """
+        if rtt is not None:
+            self.timing.update(host, rtt)
+            self.rate_limiter.answered()
+        elif err in self.SEND_ERRORS:
+            self.rate_limiter.send_failed()
+        if self.metrics is not None:
+            if rtt is not None:
+                result = 'replies'
+            elif err == errno.ETIMEDOUT:
+                result = 'timeouts'
+            elif err in self.SEND_ERRORS:
+                result = 'send_errors'
+            else:
+                result = None
+            self.metrics.probe(result, wait)
+
+    def state_of(self, err):
+        """Returns the state of a port from the result of its connect.
+
+        Args:
+            err (int) : Error number of the connect, SUCCESS if it connected
+
+        Returns:
+            state (str) : OPEN, CLOSED (refused) or FILTERED (no answer or unreachable)
+        """
+        if err == self.SUCCESS:
+            return self.OPEN
+        if err == errno.ECONNREFUSED:
+            return self.CLOSED
+        return self.FILTERED
+
+    def scan_tcp_thread(self):
         """Starts the multi-threaded TCP-Scan.
         For every thread a port number is passed and the thread get started.
         If there are too many threads started asynchronously,
         they will be enqueued and completed one by one.
 
         Returns:
-            output: Array of opened ports
+            output: PortSet of the opened ports of every host with open ports
         """
 
         # Resetting the fields
         self.threads = []
-        self.output = {}
-
-        for i in self.portList:
-            t = threading.Thread(target=self.connect_tcp, args=(i,))
-            t.start()
+        self.output = dict(self.initial_output)
+        if self.metrics is not None:
+            self.metrics.add_total(self.remaining())
+
+        for position, (host, port_number) in enumerate(self.work_items(), self.start):
+            if self.stopped.is_set():
+                break
+            if self.checkpoint is not None:
+                self.checkpoint.started(position)
+            t = threading.Thread(target=self.connect_tcp, args=(host, port_number, position))
+            if self.metrics is None:
+                t.start()
+            else:
+                with self.metrics.phase('thread_start'):
+                    t.start()
             # Appending to hold reference
             self.threads.append(t)
 
@@ -64,101 +403,297 @@ class Scan:
 
         return self.output
 
-    def connect_tcp(self, port_number):
+    def connect_tcp(self, host, port_number, position=None):
         """Performs the actual TCP-Scan.
         Limit the access of the resource by mutexing the output array with the threadLimiter.
-        The socket gets created and binded. The open ports will be written into the output array
+        The connect goes through the transport. The open ports will be written into the output array
         for return into main function.
 
         Args:
+            host (str) : The Host IP-Address
             port_number (int) : The Port number
+            position (int) : Position of the work item for the checkpoint
         """
 
+        if self.budget is not None:
+            self.budget.acquire_threadsafe(host)
         self.threadLimiter.acquire()
         try:
-            # Creation of the socket
-            tcp_sock = socket.socket(socket.AF_INET,      # IPv4
-                                     socket.SOCK_STREAM)  # TCP
-
-            # Sets the timeout for the socket
-            tcp_sock.settimeout(0.5)
-
-            # Like connect(address), but return an error indicator instead
-            # of raising an exception for errors returned by the C-level connect()
-            connected = tcp_sock.connect_ex((self.ip, port_number)) is self.SUCCESS
-            if connected:
-                self.output[port_number] = 1
-            else:
-                self.output[port_number] = 0
-
-            # Close the socket
-            tcp_sock.close()
+            self.rate_limiter.acquire()
+            start = time.perf_counter()
+            err, rtt = self.transport.connect(host, port_number, self.timing.timeout(host))
+            self.connected(host, err, rtt, time.perf_counter() - start)
+            self.record(host, port_number, self.state_of(err), rtt)
+            if self.checkpoint is not None:
+                self.checkpoint.finished(position)
         finally:
             self.threadLimiter.release()
+            if self.budget is not None:
+                self.budget.release_threadsafe(host)
 
     def scan_syn(self):
-        """Starts the SYN Raw-Scan.
-        Because of the not thread safe raw socket library the scans get
-        started synchronously.
+        """Starts the pipelined SYN Raw-Scan.
+        One raw socket is used for the whole scan. A sender thread streams the probes
+        for every port while the receiver collects the SYN-ACK/RST replies and matches
+        them back to the probes until the drain timeout after the last probe has passed.
+        The duration depends on the send rate plus one round trip instead of ports x timeout.
+        Replies are validated with the cookie of the probe, the receiver keeps no state per probe.
+        An error of the sender is raised once the receiver is finished.
+        Ports that did not answer until the drain timeout are reported as filtered.
+        With a budget every probe holds a slot until its reply arrives or its timeout has passed.
 
         Returns:
-            output: Array of opened ports
+            output: PortSet of the opened ports of every host with open ports
         """
 
-        # Resetting the fields
-        self.output = {}
+        # The raw socket helpers need ctypes, they are imported for the SYN-Scan only
+        from classes.rawscan import RawScan
 
-        for i in self.portList:
-            self.connect_syn(i)
+        # Resetting the fields
+        self.output = dict(self.initial_output)
+        self.replies = 0
+        self.answered = {}
+        self.in_flight = {}
+        if self.metrics is not None:
+            self.metrics.add_total(self.remaining())
+
+        # Every scan uses a new cookie secret, the filter checks the address of a single target
+        target = next(self.targets.hosts()) if self.targets.is_single_host() else None
+        rs = RawScan(target, random_src_port=self.random_src_port)
+        syn_sock = self.transport.open_raw(rs)
+        sender_done = threading.Event()
+        errors = []
+
+        def send():
+            try:
+                self.send_syn(syn_sock, rs, sender_done)
+            except Exception as e:
+                errors.append(e)
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        try:
+            self.receive_syn(syn_sock, rs, sender_done)
+        finally:
+            sender.join()
+            syn_sock.close()
+            if self.budget is not None:
+                self.release_expired_slots(float('inf'))
+        if errors:
+            raise errors[0]
+
+        # Probes without a reply until the drain timeout
+        if self.metrics is not None:
+            self.metrics.count('timeouts', max(0, self.remaining() - self.replies))
+        if not self.stopped.is_set() and (self.metrics is not None or
+                                          self.listener is not None and self.FILTERED in self.states):
+            self.record_unanswered()
 
         return self.output
 
-    def connect_syn(self, port_number):
-        """Creation of the socket and reception of the raw packet.
-        The socket get created and binded locally. With the multiplexing I/O module "select" the
-        socket gets into receiving mode for our response (SYN ACK).
+    def send_syn(self, syn_sock, rs, sender_done):
+        """Streams one SYN probe for every (host, port) item through the raw socket.
+        The probes are built in batches into one buffer and sent from slices of it.
 
         Args:
-            port_number (int) : Number of the port to scan
-
+            syn_sock (socket) : The raw socket
+            rs (RawScan) : Packet builder for the target
+            sender_done (Event) : Gets set after the last probe is sent
         """
+        try:
+            work = self.work_items()
+            position = self.start
+            while not self.stopped.is_set():
+                batch = list(islice(work, self.SEND_BATCH))
+                if not batch:
+                    break
+                ports = [port_number for _, port_number in batch]
+                addrs = [socket.inet_aton(host) for host, _ in batch]
+                if self.metrics is None:
+                    packets = memoryview(rs.create_packets(ports, addrs))
+                else:
+                    with self.metrics.phase('packet_build'):
+                        packets = memoryview(rs.create_packets(ports, addrs))
+                sent_count = 0
+                for index, (host, port_number) in enumerate(batch):
+                    key = int.from_bytes(addrs[index], 'big') << 16 | port_number
+                    if self.budget is not None:
+                        self.budget.acquire_threadsafe(host)
+                    offset = index * rs.packet_length
+                    sent = self.send_packet(syn_sock, packets[offset:offset + rs.packet_length], host, port_number)
+                    if self.budget is not None:
+                        self.hold_slot(key, host, sent)
+                    if sent:
+                        # Send time for the round trip sample of the reply
+                        self.timing.probe_sent(key, time.monotonic())
+                        sent_count += 1
+                position += len(batch)
+                if self.checkpoint is not None:
+                    self.checkpoint.sent(position)
+                if self.metrics is not None:
+                    self.metrics.count('probes_sent', sent_count)
+        finally:
+            sender_done.set()
 
-        # Give necessary information to RawScan class
-        rs = RawScan(self.ip)
+    def send_packet(self, syn_sock, packet, host, port_number):
+        """Sends one probe when the rate limiter allows it.
+        If the transmit queue of the interface is full, the rate limiter backs off and the probe is sent again.
+        A probe that can not be sent to its destination is dropped, it gets no reply.
 
-        # Initialization of socket in IPv4, Raw Socket, TCP Mode
-        syn_sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+        Args:
+            syn_sock (socket) : The raw socket
+            packet (memoryview) : The probe
+            host (str) : Address of the probed host
+            port_number (int) : Number of the probed port
+
+        Returns:
+            sent (bool) : False if the probe was dropped
+        """
+        self.rate_limiter.acquire()
+        while True:
+            try:
+                # Send, socket should not be connected
+                syn_sock.sendto(packet, (host, port_number))
+                return True
+            except OSError as e:
+                if e.errno in self.DESTINATION_ERRORS:
+                    if self.metrics is not None:
+                        self.metrics.count('send_errors')
+                    return False
+                # Transmit queue is full, give the interface time to drain it
+                if e.errno != errno.ENOBUFS:
+                    raise
+                self.rate_limiter.send_failed()
+                if self.metrics is not None:
+                    self.metrics.count('send_errors')
+                    self.metrics.count('retries')
+                time.sleep(0.001)
+
+    def hold_slot(self, key, host, sent):
+        """Keeps the budget slot of a SYN probe until its reply or its timeout.
+
+        Args:
+            key (int) : Address and port of the probe
+            host (str) : Address of the probed host
+            sent (bool) : False if the probe was dropped, its slot is freed at once
+        """
+        if not sent:
+            self.budget.release_threadsafe(host)
+            return
+        with self.in_flight_lock:
+            self.in_flight[key] = (time.monotonic() + self.timing.timeout(host), host)
 
-        # Set IP Headers and for Raw Sockets IP_HDRINCL is necessary
-        syn_sock.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
+    def release_slot(self, key):
+        """Frees the budget slot of an answered SYN probe.
 
-        # Bind the socket to address
-        syn_sock.bind(('0.0.0.0', 12345))
+        Args:
+            key (int) : Address and port of the probe
+        """
+        with self.in_flight_lock:
+            entry = self.in_flight.pop(key, None)
+        if entry is not None:
+            self.budget.release_threadsafe(entry[1])
 
-        # Send, socket should not be connected
-        syn_sock.sendto(rs.create_packet(port_number), (self.ip, port_number))
+    def release_expired_slots(self, now):
+        """Frees the budget slots of the SYN probes whose timeout has passed.
+        The probes are checked in the order they were sent, a probe with a longer timeout delays the ones after it.
 
-        # readable, writeable, error, 0.5 sec timeout
-        r, _, _ = select.select([syn_sock], [], [], 0.5)
-        if r:
-            response = syn_sock.recv(1024)
-            self.check_if_open(response)
+        Args:
+            now (float) : Current monotonic time, infinite to free all slots
+        """
+        with self.in_flight_lock:
+            expired = []
+            for key, (deadline, host) in self.in_flight.items():
+                if deadline > now:
+                    break
+                expired.append(key)
+            hosts = [self.in_flight.pop(key)[1] for key in expired]
+        for host in hosts:
+            self.budget.release_threadsafe(host)
+
+    def receive_syn(self, syn_sock, rs, sender_done):
+        """Collects the replies until the drain timeout after the last probe.
+        Every reply is received into the same buffer and parsed in place.
 
-        # Close the socket
-        syn_sock.close()
+        Args:
+            syn_sock (socket) : The raw socket
+            rs (RawScan) : Packet parser for the target
+            sender_done (Event) : Set by the sender after the last probe
+        """
+        buffer = bytearray(self.RECV_SIZE)
+        view = memoryview(buffer)
+        drain_end = None
+        # Stops early once every probe has been answered
+        while self.replies < self.remaining() and not self.stopped.is_set():
+            # The drain timeout starts when the sender is finished
+            if drain_end is None:
+                if sender_done.is_set():
+                    drain_end = time.monotonic() + self.timing.drain_timeout()
+                wait = 0.05
+            else:
+                wait = drain_end - time.monotonic()
+                if wait <= 0:
+                    break
+            # Unanswered probes give their slots of the budget back to the other scans
+            if self.budget is not None:
+                self.release_expired_slots(time.monotonic())
+                wait = min(wait, self.SLOT_POLL)
+
+            # readable, writeable, error
+            if self.metrics is None:
+                r, _, _ = select.select([syn_sock], [], [], wait)
+            else:
+                with self.metrics.phase('select_wait'):
+                    r, _, _ = select.select([syn_sock], [], [], wait)
+            if not r:
+                continue
+
+            # Read everything that is queued without waiting again
+            while True:
+                try:
+                    length = syn_sock.recv_into(buffer, self.RECV_SIZE, socket.MSG_DONTWAIT)
+                except BlockingIOError:
+                    break
+                self.check_if_open(view[:length], rs)
+
+    def record_unanswered(self):
+        """Records the work items of the SYN-Scan without a reply as filtered.
+        The work items are generated again, the receiver only kept the answered ports.
+        """
+        for host, port_number in self.work_items():
+            if port_number not in self.answered.get(host, ()):
+                self.record(host, port_number, self.FILTERED)
 
-    def check_if_open(self, response):
+    def check_if_open(self, response, rs):
         """Checks if the port is open.
-        By reading the flags on the correct position and also reading out the port_number.
+        The reply gets parsed and validated by the RawScan class, only replies of the target
+        that acknowledge the cookie of a probe are counted.
         If the port is open, it will be written in the output array.
 
         Args:
-            response (str) : The response from the receiving socket
-        """
-        cont = binascii.hexlify(response)
-        port_number = int(cont[40:44], 16)
-        # (012 = [SYN ACK])
-        if cont[65:68] == b"012":
-            self.output[port_number] = 1
-        # else:
-        # self.output[port_number] = 0
+            response (memoryview) : The response from the receiving socket
+            rs (RawScan) : Packet parser for the target
+        """
+        reply = rs.parse_reply(response)
+        if reply is None:
+            return
+        host, port_number, flags = reply
+        # Retransmitted SYN-ACKs and repeated RSTs are counted only once
+        answered = self.answered.get(host)
+        if answered is None:
+            answered = self.answered[host] = PortSet()
+        if port_number in answered:
+            return
+        answered.add(port_number)
+        key = int.from_bytes(socket.inet_aton(host), 'big') << 16 | port_number
+        rtt = self.timing.probe_answered(host, key, time.monotonic())
+        if flags & rs.SYN_ACK == rs.SYN_ACK:
+            self.record(host, port_number, self.OPEN, rtt)
+        else:
+            self.record(host, port_number, self.CLOSED, rtt)
+        if self.budget is not None:
+            self.release_slot(key)
+        self.replies += 1
+        if self.metrics is not None:
+            self.metrics.count('replies')
+        self.rate_limiter.answered()
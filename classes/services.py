@@ -1,73 +1,410 @@
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from hashlib import blake2b
+
+# Bundled service names as "port/protocol name", the names may contain spaces.
+# They take precedence over the names of /etc/services, so the common ports print the same on every machine.
+BUNDLED = '''
+1/tcp tcpmux
+7/tcp echo
+7/udp echo
+9/tcp discard
+9/udp discard
+11/tcp systat
+13/tcp daytime
+13/udp daytime
+17/tcp qotd
+18/tcp message send
+19/tcp chargen
+19/udp chargen
+20/tcp ftp data
+21/tcp ftp control
+22/tcp ssh
+23/tcp telnet
+25/tcp smtp
+37/tcp time
+37/udp time
+43/tcp whois
+49/udp tacacs
+53/tcp domain
+53/udp domain
+67/udp bootps
+68/udp bootpc
+69/tcp tftp
+69/udp tftp
+79/tcp finger
+80/tcp http
+88/tcp kerberos
+88/udp kerberos
+101/tcp nic host name
+102/tcp iso-tsap
+107/tcp rtelnet
+109/tcp pop2
+110/tcp pop3
+111/tcp sunrpc
+111/udp sunrpc
+113/tcp ident
+115/tcp sftp
+118/tcp sql
+119/tcp nntp
+123/tcp ntp
+123/udp ntp
+135/tcp msrpc
+135/udp msrpc
+137/tcp netbios
+137/udp netbios-ns
+138/udp netbios-dgm
+139/tcp netbios-ssn
+143/tcp imap
+152/tcp bftp
+156/tcp sql
+158/tcp dmsp
+161/tcp snmp
+161/udp snmp
+162/tcp snmptrap
+162/udp snmptrap
+170/tcp postscript
+177/tcp x server
+177/udp xdmcp
+179/tcp bgp
+194/tcp irc
+199/tcp smux
+220/tcp imap v3
+389/tcp ldap
+389/udp ldap
+401/tcp ups
+427/tcp svrloc
+427/udp svrloc
+443/tcp https
+443/udp https
+445/tcp active directory / smb
+464/tcp kerberos change/set password
+464/udp kerberos change/set password
+465/tcp smtps
+500/udp isakmp
+512/tcp exec
+513/tcp login
+514/tcp remote shell
+514/udp syslog
+515/tcp ldp
+520/udp router
+525/tcp timeserver
+543/tcp kerberos login
+544/tcp kerberos remote shell
+546/tcp dhcp v6 client
+546/udp dhcp v6 client
+547/tcp dhcp v6 server
+547/udp dhcp v6 server
+548/tcp afp
+554/tcp rtsp
+554/udp rtsp
+587/tcp smtp
+593/tcp http-rpc-epmap
+623/udp ipmi
+631/tcp ipp
+631/udp ipp
+636/tcp ldaps
+646/tcp ldp
+666/tcp doom
+749/tcp kerberos administration
+873/tcp rsync
+902/tcp vmware-auth
+989/tcp ftps data
+990/tcp ftps control
+993/tcp imaps
+995/tcp pop3s
+1080/tcp socks
+1194/tcp openvpn
+1194/udp openvpn
+1433/tcp ms-sql-s
+1434/udp ms-sql-m
+1521/tcp oracle
+1701/udp l2tp
+1723/tcp pptp
+1812/udp radius
+1813/udp radius-acct
+1883/tcp mqtt
+1900/udp ssdp
+2049/tcp nfs
+2049/udp nfs
+2375/tcp docker
+2376/tcp docker-s
+3128/tcp squid-http
+3268/tcp globalcatLDAP
+3306/tcp mysql
+3389/tcp ms-wbt-server
+3389/udp ms-wbt-server
+3478/udp stun
+3690/tcp svn
+4369/tcp epmd
+4500/udp ipsec-nat-t
+5060/tcp sip
+5060/udp sip
+5061/tcp sips
+5222/tcp xmpp-client
+5269/tcp xmpp-server
+5353/udp mdns
+5355/udp llmnr
+5432/tcp postgresql
+5672/tcp amqp
+5900/tcp vnc
+5985/tcp wsman
+5986/tcp wsmans
+6000/tcp x11
+6379/tcp redis
+6667/tcp ircd
+8008/tcp http-alt
+8080/tcp http-alt
+8443/tcp https-alt
+9100/tcp jetdirect
+9200/tcp elasticsearch
+11211/tcp memcache
+11211/udp memcache
+27017/tcp mongodb
+51820/udp wireguard
+'''
+
+
 class Services:
-    """This class provides a method to resolve some services of ports"""
+    """This class provides a method to resolve the services of ports.
+    The names of /etc/services and of the bundled table are compiled once into an index: one
+    slot per port and protocol that holds the number of the name in a table of unique names.
+    The index is cached in a file and memory-mapped at the next start, a lookup indexes the
+    mapped slots and returns the shared string of the name without parsing or allocating.
+    The cache is compiled again when /etc/services or the bundled table changed.
+    """
 
-    @staticmethod
-    def get_service(port):
+    # Source of the names of the system
+    services_file = '/etc/services'
+
+    # Cache of the compiled index
+    cache_file = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                              'penscan', 'services.idx')
+
+    # Protocols of the index and slots per protocol
+    PROTOCOLS = ('tcp', 'udp')
+    SLOTS = 65536
+
+    # Header of the cache: magic, signature of the sources, size of the name table, number of names.
+    # The name table follows as NUL separated UTF-8, then the 16 bit slots of every protocol in native byte order.
+    MAGIC = b'PSV1'
+    header = struct.Struct('<4s16sII')
+
+    # Names by number, 0 is the empty name of unknown ports, and the slots of every protocol
+    names = None
+    index = None
+    lock = threading.Lock()
+
+    @classmethod
+    def get_service(cls, port, protocol='tcp'):
         """Returns the service name to the corresponding port.
 
         Args:
-                port (int) : port number
+            port (int) : port number
+            protocol (str) : 'tcp' or 'udp'
 
         Returns:
             service name (str) : Service name as string or empty string if service unknown
         """
+        index = cls.index
+        if index is None:
+            index = cls.load()
+        slots = index.get(protocol)
+        if slots is None or not 0 <= port < cls.SLOTS:
+            return ''
+        return cls.names[slots[port]]
+
+    @classmethod
+    def load(cls):
+        """Maps the cached index or compiles and caches it if the cache is missing or outdated.
+
+        Returns:
+            index (dict) : Slots of every protocol
+        """
+        with cls.lock:
+            if cls.index is None:
+                signature = cls.signature()
+                data = cls.read_cache(signature)
+                if data is None:
+                    data = cls.compile(signature)
+                    cls.write_cache(data)
+                names, index = cls.parse(data)
+                # The names are set first, get_service only checks the index
+                cls.names = names
+                cls.index = index
+        return cls.index
+
+    @classmethod
+    def signature(cls):
+        """Returns the signature of the sources of the index.
+        It covers the bundled table, the size and time of modification of /etc/services and the byte order,
+        the services file itself is not read.
+
+        Returns:
+            signature (bytes) : 16 byte digest
+        """
+        h = blake2b(BUNDLED.encode(), digest_size=16)
+        try:
+            stat = os.stat(cls.services_file)
+            h.update(cls.services_file.encode() + b'\0' + str((stat.st_size, stat.st_mtime_ns)).encode())
+        except OSError:
+            h.update(b'no services file')
+        h.update(sys.byteorder.encode())
+        return h.digest()
+
+    @classmethod
+    def read_cache(cls, signature):
+        """Maps the cached index.
+
+        Args:
+            signature (bytes) : Signature of the current sources
+
+        Returns:
+            data (mmap) : The mapped cache, None if it is missing, damaged or outdated
+        """
+        try:
+            with open(cls.cache_file, 'rb') as file:
+                if os.fstat(file.fileno()).st_size < cls.header.size + len(cls.PROTOCOLS) * cls.SLOTS * 2:
+                    return None
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except OSError:
+            return None
+
+        magic, cached, names_size, _ = cls.header.unpack_from(data)
+        if magic != cls.MAGIC or cached != signature or len(data) != cls.size(names_size):
+            data.close()
+            return None
+        return data
+
+    @classmethod
+    def write_cache(cls, data):
+        """Writes the compiled index to the cache, a reader never sees a partly written cache.
+        The index still works if the cache can not be written.
+
+        Args:
+            data (bytes) : The compiled index
+        """
+        temporary = cls.cache_file + '.' + str(os.getpid()) + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(cls.cache_file), exist_ok=True)
+            with open(temporary, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, cls.cache_file)
+        except OSError:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+
+    @classmethod
+    def size(cls, names_size):
+        """Returns the size of an index with a name table of names_size bytes."""
+        return cls.offset(names_size) + len(cls.PROTOCOLS) * cls.SLOTS * 2
+
+    @classmethod
+    def offset(cls, names_size):
+        """Returns the position of the slots, aligned to their 16 bit size."""
+        return cls.header.size + names_size + (cls.header.size + names_size) % 2
+
+    @classmethod
+    def parse(cls, data):
+        """Splits a compiled index into the names and the slots.
+        The slots stay in the buffer, a mapped cache is not copied.
+
+        Args:
+            data (bytes) : The compiled index or the mapped cache
+
+        Returns:
+            names (list) : Names by number
+            index (dict) : Slots of every protocol
+        """
+        view = memoryview(data)
+        _, _, names_size, count = cls.header.unpack_from(view)
+        names = ['']
+        if count:
+            names += bytes(view[cls.header.size:cls.header.size + names_size]).decode().split('\0')
+        offset = cls.offset(names_size)
+        index = {}
+        for protocol in cls.PROTOCOLS:
+            index[protocol] = view[offset:offset + cls.SLOTS * 2].cast('H')
+            offset += cls.SLOTS * 2
+        return names, index
+
+    @classmethod
+    def compile(cls, signature):
+        """Compiles the names of /etc/services and the bundled table into an index.
+        Every name is stored once, however many ports have it.
+
+        Args:
+            signature (bytes) : Signature of the sources, stored in the header
+
+        Returns:
+            data (bytes) : The compiled index
+        """
+        entries = cls.read_services_file()
+        entries.update(cls.bundled())
+
+        numbers = {}
+        slots = {protocol: array('H', bytes(cls.SLOTS * 2)) for protocol in cls.PROTOCOLS}
+        for (protocol, port), name in entries.items():
+            number = numbers.get(name)
+            if number is None:
+                number = numbers[name] = len(numbers) + 1
+            slots[protocol][port] = number
+
+        name_table = '\0'.join(numbers).encode()
+        padding = b'\0' * (cls.offset(len(name_table)) - cls.header.size - len(name_table))
+        return b''.join([cls.header.pack(cls.MAGIC, signature, len(name_table), len(numbers)), name_table, padding]
+                        + [slots[protocol].tobytes() for protocol in cls.PROTOCOLS])
 
-        str_port = str(port)
-        if str_port in Services.ports:
-            return Services.ports[str_port]
-        else:
-            return ""
-
-    ports = {'7': "echo",
-             '9': "discard",
-             '13': "daytime",
-             '18': "message send",
-             '20': "ftp data",
-             '21': "ftp control",
-             '22': "ssh",
-             '23': "telnet",
-             '25': "smtp",
-             '37': "time",
-             '43': "whois",
-             '53': "domain",
-             '69': "tftp",
-             '80': "http",
-             '88': "kerberos",
-             '101': "nic host name",
-             '107': "rtelnet",
-             '109': "pop2",
-             '110': "pop3",
-             '115': "sftp",
-             '118': "sql",
-             '119': "nntp",
-             '137': "netbios",
-             '143': "imap",
-             '152': "bftp",
-             '156': "sql",
-             '158': "dmsp",
-             '170': "postscript",
-             '177': "x server",
-             '179': "bgp",
-             '194': "irc",
-             '220': "imap v3",
-             '389': "ldap",
-             '401': "ups",
-             '443': "https",
-             '445': "active directory / smb",
-             '464': "kerberos change/set password",
-             '514': "remote shell",
-             '515': "ldp",
-             '525': "timeserver",
-             '543': "kerberos login",
-             '544': "kerberos remote shell",
-             '546': "dhcp v6 client",
-             '547': "dhcp v6 server",
-             '587': "smtp",
-             '631': "ipp",
-             '636': "ldaps",
-             '666': "doom",
-             '749': "kerberos administration",
-             '873': "rsync",
-             '989': "ftps data",
-             '990': "ftps control",
-             }
+    @classmethod
+    def read_services_file(cls):
+        """Reads the service names of the system.
+        The first name of a port wins, like getservbyport.
+
+        Returns:
+            entries (dict) : Name of every (protocol, port), empty if there is no services file
+        """
+        entries = {}
+        try:
+            with open(cls.services_file, encoding='utf-8', errors='replace') as file:
+                for line in file:
+                    fields = line.partition('#')[0].split()
+                    if len(fields) < 2:
+                        continue
+                    port, _, protocol = fields[1].partition('/')
+                    if protocol in cls.PROTOCOLS and port.isdigit() and int(port) < cls.SLOTS:
+                        entries.setdefault((protocol, int(port)), fields[0])
+        except OSError:
+            pass
+        return entries
+
+    @staticmethod
+    def bundled():
+        """Returns the bundled service names.
+
+        Returns:
+            entries (dict) : Name of every (protocol, port)
+        """
+        entries = {}
+        for line in BUNDLED.strip().splitlines():
+            port_protocol, name = line.split(None, 1)
+            port, _, protocol = port_protocol.partition('/')
+            entries[(protocol, int(port))] = name
+        return entries
+
+    @classmethod
+    def bundled_ports(cls, protocol='tcp'):
+        """Returns the ports of the bundled table in ascending order.
+
+        Args:
+            protocol (str) : 'tcp' or 'udp'
+
+        Returns:
+            ports (list) : Port numbers
+        """
+        return sorted(port for entry_protocol, port in cls.bundled() if entry_protocol == protocol)
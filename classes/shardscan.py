@@ -0,0 +1,168 @@
+import multiprocessing
+import queue
+import signal
+import time
+
+from classes.ratelimiter import RateLimiter
+from classes.scan import Scan
+
+
+class ShardScan:
+    """This class splits a scan into shards and runs every shard in its own process.
+    The positions of the Targets are split into one contiguous range per worker. Every worker
+    scans its range with its own engine, its own sockets and its share of the rate and of the
+    connects in flight, so the scan is not limited by the interpreter lock of one process.
+    The workers send their result events in batches to the parent, which merges them into one
+    stream and one output. In random order every range is spread over the whole target space.
+    """
+
+    # Events per message of a worker and seconds until a smaller batch is sent
+    EVENT_BATCH = 1024
+    EVENT_INTERVAL = 0.5
+
+    # Seconds the parent waits for a message before it checks the workers
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, targets, workers, engine='async', concurrency=1000, timing='normal', random_src_port=False,
+                 rate_limiter=None):
+        """Initializes the ShardScan-Class with the targets.
+
+        Args:
+            targets (Targets) : Work items of the scan, hostnames are resolved already
+            workers (int) : Number of processes
+            engine (str) : TCP engine of the workers, 'async' (event loop) or 'thread' (thread per port)
+            concurrency (int) : Maximum number of connects in flight of all workers
+            timing (str) : Timing profile of the workers
+            random_src_port (bool) : Derive the source port of every SYN probe from its cookie
+            rate_limiter (RateLimiter) : Its rate and burst are split between the workers, unlimited if None
+        """
+        self.targets = targets
+        self.workers = max(1, min(workers, len(targets)))
+        self.engine = engine
+        self.concurrency = concurrency
+        self.timing = timing
+        self.random_src_port = random_src_port
+
+        rate = rate_limiter.target if rate_limiter is not None else None
+        burst = rate_limiter.burst if rate_limiter is not None and rate else None
+        self.rate = rate / self.workers if rate else None
+        self.burst = max(1, burst // self.workers) if burst else None
+
+        # Open ports of every host, merged from all workers
+        self.output = {}
+
+    def shards(self):
+        """Splits the positions of the targets into one range per worker.
+
+        Returns:
+            shards (list) : (start, stop) position of every worker
+        """
+        count = len(self.targets)
+        return [(count * index // self.workers, count * (index + 1) // self.workers)
+                for index in range(self.workers)]
+
+    def scan(self, protocol='tcp'):
+        """Runs the scan in all workers and waits until they are finished.
+
+        Args:
+            protocol (str) : 'tcp' or 'syn'
+
+        Returns:
+            output: PortSet of the opened ports of every host with open ports
+        """
+        for _ in self.stream(protocol, states=()):
+            pass
+        return self.output
+
+    def stream(self, protocol='tcp', states=None):
+        """Runs the scan in all workers and generates the merged results while they run.
+        The processes are started with spawn, the threads of the parent are not copied into them.
+
+        Args:
+            protocol (str) : 'tcp' or 'syn'
+            states (tuple) : States of the generated events, only OPEN if None
+
+        Returns:
+            events (generator) : ScanEvent of every probe with one of the states
+        """
+        context = multiprocessing.get_context('spawn')
+        messages = context.Queue()
+        options = {
+            'engine': self.engine,
+            'concurrency': max(1, self.concurrency // self.workers),
+            'timing': self.timing,
+            'random_src_port': self.random_src_port,
+        }
+        processes = [context.Process(target=run_shard, daemon=True,
+                                     args=(index, self.targets, start, stop, protocol, states, options, self.rate,
+                                           self.burst, messages))
+                     for index, (start, stop) in enumerate(self.shards())]
+
+        self.output = {}
+        running = set(range(len(processes)))
+        try:
+            for process in processes:
+                process.start()
+            while running:
+                try:
+                    index, kind, data = messages.get(timeout=self.POLL_INTERVAL)
+                except queue.Empty:
+                    # A worker that was killed sends no result
+                    for index in running:
+                        if processes[index].exitcode is not None:
+                            raise OSError('Worker of shard ' + str(index) + ' exited with code '
+                                          + str(processes[index].exitcode))
+                    continue
+                if kind == 'events':
+                    yield from data
+                elif kind == 'output':
+                    running.discard(index)
+                    for host, ports in data.items():
+                        if host in self.output:
+                            self.output[host] |= ports
+                        else:
+                            self.output[host] = ports
+                else:
+                    raise data
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for process in processes:
+                process.join()
+            messages.close()
+
+
+def run_shard(index, targets, start, stop, protocol, states, options, rate, burst, messages):
+    """Scans one shard of the targets in a worker process.
+
+    Args:
+        index (int) : Number of the shard
+        targets (Targets) : Work items of the whole scan
+        start (int) : Position of the first work item of the shard
+        stop (int) : Position after the last work item of the shard
+        protocol (str) : 'tcp' or 'syn'
+        states (tuple) : States of the sent events
+        options (dict) : Keyword arguments of the Scan
+        rate (float) : Probe rate of the worker, unlimited if None
+        burst (int) : Burst of the worker
+        messages (Queue) : Receives (shard, 'events', list), (shard, 'output', dict) or (shard, 'error', exception)
+    """
+    # Ctrl+C reaches the whole process group, the parent stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        sc = Scan(None, None, targets=targets, rate_limiter=RateLimiter(rate, burst), **options)
+        sc.start, sc.stop = start, stop
+        batch = []
+        sent = time.monotonic()
+        for event in sc.stream(protocol, states, keep_output=True):
+            batch.append(event)
+            if len(batch) >= ShardScan.EVENT_BATCH or time.monotonic() - sent >= ShardScan.EVENT_INTERVAL:
+                messages.put((index, 'events', batch))
+                batch = []
+                sent = time.monotonic()
+        if batch:
+            messages.put((index, 'events', batch))
+        messages.put((index, 'output', sc.output))
+    except Exception as e:
+        messages.put((index, 'error', e))
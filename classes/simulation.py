@@ -0,0 +1,311 @@
+import asyncio
+import errno
+import heapq
+import math
+import socket
+import threading
+import time
+from collections import deque
+from hashlib import blake2b
+from struct import pack, unpack_from
+
+from classes.portset import PortSet
+from classes.targets import Targets
+
+
+class HostProfile:
+    """This class describes how a simulated host answers the probes."""
+
+    # Answers of the closed ports
+    RST = 'rst'
+    DROP = 'drop'
+    UNREACHABLE = 'unreachable'
+
+    def __init__(self, rtt=0.02, jitter=0.2, loss=0.0, open_ports='', closed=RST, filtered_ports='',
+                 rate_limit=None):
+        """Initializes the HostProfile-Class.
+
+        Args:
+            rtt (float) : Median round trip time in seconds
+            jitter (float) : Spread of the log-normal round trip times, 0 for a constant round trip time
+            loss (float) : Probability that a probe or its answer is lost
+            open_ports (str) : Ports and Port-Ranges that accept connections, or a PortSet
+            closed (str) : Answer of the closed ports: RST, DROP (no answer) or UNREACHABLE (ICMP)
+            filtered_ports (str) : Ports and Port-Ranges that never answer, or a PortSet
+            rate_limit (float) : Answers per second of the host, the rest is dropped, unlimited if None
+        """
+        self.rtt = rtt
+        self.jitter = jitter
+        self.loss = loss
+        self.open_ports = self.port_set(open_ports)
+        self.closed = closed
+        self.filtered_ports = self.port_set(filtered_ports)
+        self.rate_limit = rate_limit
+
+    @staticmethod
+    def port_set(ports):
+        """Returns the PortSet of a port specification or the PortSet itself."""
+        if isinstance(ports, PortSet):
+            return ports
+        return PortSet.from_ranges(Targets.parse_ports(ports))
+
+
+class SimulatedNetwork:
+    """This class decides the fate of every probe of a simulated network.
+    The round trip time and the loss of a probe are derived from a keyed hash of the seed, the
+    host and the port, so the same seed gives the same network whatever order the engines probe in.
+    The same probe sent again gets the same fate. Only the rate limits of the hosts depend on the
+    time the probes arrive.
+    """
+
+    def __init__(self, hosts, default=None, seed=0):
+        """Initializes the SimulatedNetwork-Class.
+
+        Args:
+            hosts (dict) : HostProfile of every host address
+            default (HostProfile) : Profile of the other addresses, they do not answer if None
+            seed (int) : Seed of the round trip times and the losses
+        """
+        self.hosts = hosts
+        self.default = default
+        self.key = blake2b(key=str(seed).encode(), digest_size=12)
+
+        self.lock = threading.Lock()
+        # host -> [tokens, time of the last update] of the rate limited hosts
+        self.buckets = {}
+
+        # Number of probes, answers and probes dropped by loss or a rate limit
+        self.probes = 0
+        self.answers = 0
+        self.lost = 0
+        self.limited = 0
+
+    def outcome(self, host, port_number):
+        """Decides the answer to a probe.
+
+        Args:
+            host (str) : Address of the probed host
+            port_number (int) : The probed port
+
+        Returns:
+            outcome (tuple) : (SUCCESS, ECONNREFUSED or EHOSTUNREACH, round trip time),
+                              (None, None) if nothing comes back
+        """
+        profile = self.hosts.get(host, self.default)
+        with self.lock:
+            self.probes += 1
+        if profile is None:
+            return None, None
+
+        h = self.key.copy()
+        h.update(socket.inet_aton(host))
+        h.update(port_number.to_bytes(2, 'big'))
+        digest = h.digest()
+        # Three uniform numbers in (0, 1) from the hash
+        u1, u2, u3 = ((int.from_bytes(digest[index:index + 4], 'big') + 0.5) / 2 ** 32 for index in (0, 4, 8))
+
+        if u3 < profile.loss:
+            with self.lock:
+                self.lost += 1
+            return None, None
+
+        if port_number in profile.open_ports:
+            err = 0
+        elif port_number in profile.filtered_ports or profile.closed == HostProfile.DROP:
+            return None, None
+        elif profile.closed == HostProfile.UNREACHABLE:
+            err = errno.EHOSTUNREACH
+        else:
+            err = errno.ECONNREFUSED
+
+        if profile.rate_limit is not None and not self.take_token(host, profile.rate_limit):
+            return None, None
+
+        # Log-normal round trip time around the median (Box-Muller)
+        normal = math.sqrt(-2 * math.log(u1)) * math.cos(2 * math.pi * u2)
+        with self.lock:
+            self.answers += 1
+        return err, profile.rtt * math.exp(profile.jitter * normal)
+
+    def take_token(self, host, rate):
+        """Takes a token of the answers of a host, the bucket holds the answers of one second.
+
+        Args:
+            host (str) : Address of the host
+            rate (float) : Answers per second
+
+        Returns:
+            allowed (bool) : False if the answer is dropped
+        """
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = [rate, now]
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                self.limited += 1
+                return False
+            bucket[0] -= 1
+            return True
+
+
+class SimulatedTransport:
+    """This class answers the probes of the scan engines from a SimulatedNetwork.
+    It has the methods of the SocketTransport, no socket of the operating system is used for the
+    connects and the SYN-Scan runs without root privileges. The answers arrive after their
+    simulated round trip time in real time.
+    """
+
+    SUCCESS = 0
+
+    def __init__(self, network):
+        """Initializes the SimulatedTransport-Class.
+
+        Args:
+            network (SimulatedNetwork) : The network that answers the probes
+        """
+        self.network = network
+
+    async def connect_async(self, loop, host, port_number, timeout):
+        """Simulates a non-blocking TCP connect, see SocketTransport.connect_async."""
+        err, rtt = self.network.outcome(host, port_number)
+        if err is None or rtt >= timeout:
+            await asyncio.sleep(timeout)
+            return errno.ETIMEDOUT, None
+        await asyncio.sleep(rtt)
+        return err, rtt if err in (self.SUCCESS, errno.ECONNREFUSED) else None
+
+    def connect(self, host, port_number, timeout):
+        """Simulates a blocking TCP connect, see SocketTransport.connect."""
+        err, rtt = self.network.outcome(host, port_number)
+        if err is None or rtt >= timeout:
+            time.sleep(timeout)
+            return errno.ETIMEDOUT, None
+        time.sleep(rtt)
+        return err, rtt if err in (self.SUCCESS, errno.ECONNREFUSED) else None
+
+    def open_raw(self, rs):
+        """Returns the simulated raw socket of a SYN-Scan, see SocketTransport.open_raw."""
+        return SimulatedRawSocket(self.network)
+
+
+class SimulatedRawSocket:
+    """This class answers the SYN probes written to it with SYN-ACK and RST packets.
+    The answers are queued until their round trip time has passed. A socket pair signals queued
+    answers, so the receiver can wait for them with select like for a raw socket.
+    ICMP answers do not reach a raw TCP socket, unreachable ports stay silent.
+    """
+
+    # TCP flags of the answers
+    SYN_ACK = 0x12
+    RST_ACK = 0x14
+
+    def __init__(self, network):
+        """Initializes the SimulatedRawSocket-Class and starts the delivery of the answers.
+
+        Args:
+            network (SimulatedNetwork) : The network that answers the probes
+        """
+        self.network = network
+        self.bell_reader, self.bell_writer = socket.socketpair()
+        self.bell_reader.setblocking(False)
+        self.bell_writer.setblocking(False)
+
+        # Delivered answers and the heap of (due time, number, answer) of the pending ones
+        self.ready = deque()
+        self.pending = []
+        self.sequence = 0
+        self.condition = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self.deliver, daemon=True)
+        self.thread.start()
+
+    def fileno(self):
+        """Returns the descriptor that becomes readable when an answer is delivered."""
+        return self.bell_reader.fileno()
+
+    def sendto(self, packet, address):
+        """Takes a probe and queues its answer.
+
+        Args:
+            packet (memoryview) : The probe built by RawScan
+            address (tuple) : (host, port) of the probe
+
+        Returns:
+            length (int) : Number of sent bytes
+        """
+        probe = bytes(packet)
+        host = socket.inet_ntoa(probe[16:20])
+        src_port, port_number, seq_no = unpack_from('!HHL', probe, 20)
+        err, rtt = self.network.outcome(host, port_number)
+        if err == 0:
+            flags = self.SYN_ACK
+        elif err == errno.ECONNREFUSED:
+            flags = self.RST_ACK
+        else:
+            return len(probe)
+
+        answer = pack('!BBHHHBBH4s4sHHLLBBHHH', 0x45, 0, 40, 0, 0, 64, 6, 0, probe[16:20], probe[12:16],
+                      port_number, src_port, 0, (seq_no + 1) & 0xffffffff, 0x50, flags, 65535, 0, 0)
+        with self.condition:
+            heapq.heappush(self.pending, (time.monotonic() + rtt, self.sequence, answer))
+            self.sequence += 1
+            if self.pending[0][2] is answer:
+                self.condition.notify()
+        return len(probe)
+
+    def deliver(self):
+        """Moves the answers to the delivered ones once their round trip time has passed."""
+        with self.condition:
+            while not self.closed:
+                if not self.pending:
+                    self.condition.wait()
+                    continue
+                wait = self.pending[0][0] - time.monotonic()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+                self.ready.append(heapq.heappop(self.pending)[2])
+                try:
+                    self.bell_writer.send(b'\0')
+                except BlockingIOError:
+                    # The bell is rung already
+                    pass
+
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        """Copies the next delivered answer into the buffer.
+
+        Args:
+            buffer (bytearray) : Buffer of the answer
+            nbytes (int) : Maximum size of the answer, the size of the buffer if 0
+            flags (int) : Ignored, the simulated socket never blocks
+
+        Returns:
+            length (int) : Size of the answer
+
+        Raises:
+            BlockingIOError : If no answer is delivered
+        """
+        if not self.ready:
+            # The bell is emptied before the second look, an answer delivered after it rings again
+            try:
+                self.bell_reader.recv(4096)
+            except BlockingIOError:
+                pass
+            if not self.ready:
+                raise BlockingIOError(errno.EAGAIN, 'No answer delivered')
+        answer = self.ready.popleft()
+        size = min(len(answer), nbytes or len(buffer))
+        buffer[:size] = answer[:size]
+        return size
+
+    def close(self):
+        """Stops the delivery and drops the pending answers."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+        self.bell_reader.close()
+        self.bell_writer.close()
@@ -0,0 +1,303 @@
+import ipaddress
+import socket
+from bisect import bisect_right
+from itertools import accumulate, islice, zip_longest
+
+from classes.permutation import Permutation
+from classes.portset import PortSet
+
+
+class Targets:
+    """This class expands the targets of a scan into (host, port) work items.
+    Hosts can be given as single addresses, hostnames, CIDR blocks (10.0.0.0/24) or
+    address ranges (10.0.0.1-10.0.0.20 or 10.0.0.1-20), ports as ranges and lists (1-1024,8080).
+    The hosts are kept as blocks and the ports as ranges, so the work items are generated
+    lazily and the memory does not grow with the size of the target space.
+    Every work item has an index, so the items can also be visited in a seeded random order.
+    Ports that are already known can be excluded per host, and the number of visited items can
+    be limited to sample the target space.
+    """
+
+    def __init__(self, hosts, ports, seed=None, exclude=None, limit=None, resolver=None):
+        """Initializes the Targets-Class with the host and port specification.
+
+        Args:
+            hosts (str) : Comma separated hosts, CIDR blocks and address ranges
+            ports (str) : Comma separated ports and port ranges
+            seed (int) : Seed of the random order, ascending order if None
+            exclude (dict) : PortSet of the ports that are skipped for the host addresses of the targets
+            limit (int) : Maximum number of work items, all if None
+            resolver (Resolver) : Resolver of the hostnames, the system resolver if None
+        """
+        self.blocks = self.parse_hosts(hosts, resolver)
+        self.port_ranges = self.parse_ports(ports)
+
+        self.host_count = sum(count for _, count in self.blocks)
+        self.port_count = sum(len(port_range) for port_range in self.port_ranges)
+
+        # Index of the first host of every block and of the first port of every range
+        self.block_offsets = list(accumulate([count for _, count in self.blocks], initial=0))
+        self.range_offsets = list(accumulate([len(port_range) for port_range in self.port_ranges], initial=0))
+
+        self.seed = seed
+        self.permutation = Permutation(self.size(), seed) if seed is not None and self.size() > 0 else None
+
+        # Only the excluded ports within the port ranges reduce the number of items
+        self.exclude = None
+        if exclude:
+            scanned = PortSet.from_ranges(self.port_ranges)
+            self.exclude = {host: host_ports & scanned for host, host_ports in exclude.items()}
+        self.excluded = sum(len(host_ports) for host_ports in self.exclude.values()) if self.exclude else 0
+        self.limit = limit
+
+    def __len__(self):
+        """Returns the number of (host, port) work items."""
+        count = self.size() - self.excluded
+        return count if self.limit is None else min(count, self.limit)
+
+    def size(self):
+        """Returns the size of the index space, excluded items included."""
+        return self.host_count * self.port_count
+
+    def __iter__(self):
+        """Generates the (host, port) work items.
+
+        Returns:
+            items (generator) : (host, port) tuples
+        """
+        return self.items()
+
+    def items(self, start=0):
+        """Generates the (host, port) work items from a position on.
+        In ascending order the probes are interleaved across the hosts, every host gets one port
+        before the next port is probed, so no single target gets hammered. With a seed the whole
+        index space is walked in the order of the permutation.
+
+        Args:
+            start (int) : Position of the first item, to resume an interrupted scan
+
+        Returns:
+            items (generator) : (host, port) tuples
+        """
+        items = self.all_items(start)
+        if self.exclude:
+            items = ((host, port_number) for host, port_number in items
+                     if port_number not in self.exclude.get(host, ()))
+        if self.limit is not None:
+            items = islice(items, self.limit)
+        return items
+
+    def all_items(self, start=0):
+        """Generates the work items of the index space from a position on, excluded items included.
+
+        Args:
+            start (int) : Position of the first item
+
+        Returns:
+            items (generator) : (host, port) tuples
+        """
+        if self.permutation is not None:
+            for position in range(start, self.size()):
+                yield self.item(self.permutation[position])
+        elif start < self.size():
+            # The first port is continued at the host of the start position
+            port_index, host_index = divmod(start, self.host_count)
+            ports = islice(self.ports(), port_index, None)
+            first_port = next(ports)
+            for host in islice(self.hosts(), host_index, None):
+                yield host, first_port
+            for port_number in ports:
+                for host in self.hosts():
+                    yield host, port_number
+
+    def item(self, index):
+        """Returns the work item of the index.
+        The index counts the hosts first, index = port index * host count + host index.
+
+        Args:
+            index (int) : Index of the work item
+
+        Returns:
+            item (tuple) : (host, port)
+        """
+        port_index, host_index = divmod(index, self.host_count)
+
+        block = bisect_right(self.block_offsets, host_index) - 1
+        address = self.blocks[block][0] + host_index - self.block_offsets[block]
+
+        port_range = bisect_right(self.range_offsets, port_index) - 1
+        port_number = self.port_ranges[port_range][port_index - self.range_offsets[port_range]]
+
+        return socket.inet_ntoa(address.to_bytes(4, 'big')), port_number
+
+    def hosts(self):
+        """Generates the addresses of all hosts.
+
+        Returns:
+            hosts (generator) : Dotted-quad addresses
+        """
+        for first, count in self.blocks:
+            for address in range(first, first + count):
+                yield socket.inet_ntoa(address.to_bytes(4, 'big'))
+
+    def ports(self):
+        """Generates all port numbers.
+
+        Returns:
+            ports (generator) : Port numbers
+        """
+        for port_range in self.port_ranges:
+            yield from port_range
+
+    def is_single_host(self):
+        """Returns True if exactly one host is scanned."""
+        return self.host_count == 1
+
+    @staticmethod
+    def parse_hosts(hosts, resolver=None):
+        """Converts the host specification into blocks of consecutive addresses.
+        The hostnames are resolved together at the end, concurrently if a Resolver is given.
+
+        Args:
+            hosts (str) : Comma separated hosts, CIDR blocks and address ranges
+            resolver (Resolver) : Resolver of the hostnames, the system resolver if None
+
+        Returns:
+            blocks (list) : (first address as int, number of addresses) tuples
+        """
+        blocks = []
+        names = []
+        for item in hosts.split(','):
+            item = item.strip()
+            if not item:
+                continue
+
+            if '/' in item:
+                network = ipaddress.IPv4Network(item, strict=False)
+                first = int(network.network_address)
+                count = network.num_addresses
+                # Network and broadcast address are no hosts
+                if network.prefixlen < 31:
+                    first, count = first + 1, count - 2
+            # Hyphenated hostnames are no ranges, a range starts with an address
+            elif '-' in item and Targets.is_address(item.split('-', 1)[0].strip()):
+                start, end = item.split('-', 1)
+                first = int(ipaddress.IPv4Address(start.strip()))
+                end = end.strip()
+                # Short form 10.0.0.1-20 only gives the last octet
+                if '.' not in end:
+                    end = start.strip().rsplit('.', 1)[0] + '.' + end
+                count = int(ipaddress.IPv4Address(end)) - first + 1
+                if count < 1:
+                    raise ValueError('Invalid address range: ' + item)
+            else:
+                try:
+                    first, count = int(ipaddress.IPv4Address(item)), 1
+                except ValueError:
+                    # Hostnames are resolved afterwards, the block is a placeholder until then
+                    names.append((len(blocks), item))
+                    first, count = None, 1
+
+            blocks.append((first, count))
+
+        if names:
+            if resolver is not None:
+                addresses = resolver.forward_many(name for _, name in names)
+            else:
+                addresses = [socket.gethostbyname(name) for _, name in names]
+            for (index, _), address in zip(names, addresses):
+                blocks[index] = (int(ipaddress.IPv4Address(address)), 1)
+        return blocks
+
+    @staticmethod
+    def is_address(text):
+        """Returns True if the text is an IPv4 address.
+
+        Args:
+            text (str) : Address or hostname
+        """
+        try:
+            ipaddress.IPv4Address(text)
+        except ValueError:
+            return False
+        return True
+
+    @staticmethod
+    def parse_ports(ports):
+        """Converts the port specification into port ranges.
+
+        Args:
+            ports (str) : Comma separated ports and port ranges
+
+        Returns:
+            port_ranges (list) : List of ranges of port numbers
+        """
+        port_ranges = []
+        for item in str(ports).split(','):
+            item = item.strip()
+            if not item:
+                continue
+
+            if '-' in item:
+                start, end = (int(port) for port in item.split('-', 1))
+            else:
+                start = end = int(item)
+
+            if not 0 <= start <= end <= 65535:
+                raise ValueError('Invalid port range: ' + item)
+            port_ranges.append(range(start, end + 1))
+        return port_ranges
+
+
+class HostPorts:
+    """This class provides the (host, port) work items of an own set of ports per host.
+    It is used to probe the ports that are known from earlier scans before the rest of the range.
+    Like Targets the probes are interleaved across the hosts.
+    """
+
+    def __init__(self, ports):
+        """Initializes the HostPorts-Class with the ports of every host.
+
+        Args:
+            ports (dict) : PortSet of the ports to scan for every host address
+        """
+        self.ports = {host: host_ports for host, host_ports in ports.items() if host_ports}
+
+    def __len__(self):
+        """Returns the number of (host, port) work items."""
+        return sum(len(host_ports) for host_ports in self.ports.values())
+
+    def __iter__(self):
+        """Generates the (host, port) work items.
+
+        Returns:
+            items (generator) : (host, port) tuples
+        """
+        return self.items()
+
+    def items(self, start=0):
+        """Generates the (host, port) work items from a position on.
+
+        Args:
+            start (int) : Position of the first item
+
+        Returns:
+            items (generator) : (host, port) tuples
+        """
+        hosts = list(self.ports)
+        rounds = zip_longest(*[iter(self.ports[host]) for host in hosts])
+        items = ((host, port_number) for ports in rounds
+                 for host, port_number in zip(hosts, ports) if port_number is not None)
+        return islice(items, start, None)
+
+    def hosts(self):
+        """Generates the addresses of all hosts.
+
+        Returns:
+            hosts (generator) : Dotted-quad addresses
+        """
+        return iter(self.ports)
+
+    def is_single_host(self):
+        """Returns True if exactly one host is scanned."""
+        return len(self.ports) == 1
@@ -0,0 +1,161 @@
+import threading
+from array import array
+from collections import OrderedDict
+
+
+class Timing:
+    """This class derives the timeouts of the scan from the measured round trip times.
+    Every reply gives a sample of the round trip time of its host. Like the retransmission
+    timer of TCP (RFC 6298) a smoothed round trip time and its variation are kept per host,
+    the timeout is SRTT + 4 * RTTVAR within the bounds of the timing profile.
+    Hosts without samples use the estimate over all hosts, or the initial timeout of the profile.
+    """
+
+    # Timing profiles: (initial timeout, minimum timeout, maximum timeout) in seconds
+    profiles = {
+        'lan': (0.1, 0.01, 0.5),
+        'fast': (0.25, 0.03, 1.0),
+        'normal': (0.5, 0.05, 2.0),
+        'slow': (1.0, 0.1, 5.0),
+    }
+
+    # Gains of the estimator (RFC 6298)
+    alpha = 0.125
+    beta = 0.25
+    k = 4
+
+    # Number of hosts with an own estimate, the least recently updated are dropped
+    max_hosts = 65536
+
+    # Slots of the send times of the SYN probes
+    send_slots = 1 << 16
+
+    def __init__(self, profile='normal'):
+        """Initializes the Timing-Class with a timing profile.
+
+        Args:
+            profile (str) : Name of the timing profile
+        """
+        self.initial, self.minimum, self.maximum = self.profiles[profile]
+
+        # host -> [srtt, rttvar]
+        self.estimates = OrderedDict()
+        self.overall = None
+        self.lock = threading.Lock()
+
+        # Send time of the last probe in every slot, replies whose slot got
+        # overwritten in the meantime just give no sample
+        self.sent_keys = array('Q', bytes(8 * self.send_slots))
+        self.sent_times = array('d', bytes(8 * self.send_slots))
+
+    def update(self, host, rtt):
+        """Adds a sample of the round trip time of a host.
+
+        Args:
+            host (str) : Address of the host
+            rtt (float) : Measured round trip time in seconds
+        """
+        with self.lock:
+            self.overall = self.smooth(self.overall, rtt)
+
+            estimate = self.smooth(self.estimates.get(host), rtt)
+            self.estimates[host] = estimate
+            self.estimates.move_to_end(host)
+            if len(self.estimates) > self.max_hosts:
+                self.estimates.popitem(last=False)
+
+    def smooth(self, estimate, rtt):
+        """Applies one sample to an estimate.
+
+        Args:
+            estimate (list) : [srtt, rttvar] or None before the first sample
+            rtt (float) : Measured round trip time in seconds
+
+        Returns:
+            estimate (list) : The updated estimate
+        """
+        if estimate is None:
+            return [rtt, rtt / 2]
+        srtt, rttvar = estimate
+        rttvar = (1 - self.beta) * rttvar + self.beta * abs(srtt - rtt)
+        srtt = (1 - self.alpha) * srtt + self.alpha * rtt
+        return [srtt, rttvar]
+
+    def bounded(self, estimate):
+        """Calculates the timeout of an estimate within the bounds of the profile.
+
+        Args:
+            estimate (list) : [srtt, rttvar] or None
+
+        Returns:
+            timeout (float) : Timeout in seconds
+        """
+        if estimate is None:
+            return self.initial
+        srtt, rttvar = estimate
+        return min(self.maximum, max(self.minimum, srtt + self.k * rttvar))
+
+    def timeout(self, host):
+        """Returns the timeout of a probe to the host.
+
+        Args:
+            host (str) : Address of the host
+
+        Returns:
+            timeout (float) : Timeout in seconds
+        """
+        estimate = self.estimates.get(host)
+        return self.bounded(estimate if estimate is not None else self.overall)
+
+    def drain_timeout(self):
+        """Returns how long to wait for replies after the last probe.
+        The slowest host decides, so the largest timeout of all hosts is used.
+
+        Returns:
+            timeout (float) : Timeout in seconds
+        """
+        with self.lock:
+            timeouts = [self.bounded(estimate) for estimate in self.estimates.values()]
+        return max(timeouts, default=self.bounded(self.overall))
+
+    def slot(self, key):
+        """Returns the slot of the send time of a probe.
+
+        Args:
+            key (int) : Address of the host << 16 | port
+
+        Returns:
+            slot (int) : Index into the send times
+        """
+        return ((key >> 16) * 2654435761 + key) % self.send_slots
+
+    def probe_sent(self, key, now):
+        """Remembers the send time of a SYN probe.
+
+        Args:
+            key (int) : Address of the host << 16 | port
+            now (float) : Monotonic send time
+        """
+        slot = self.slot(key)
+        self.sent_keys[slot] = key
+        self.sent_times[slot] = now
+
+    def probe_answered(self, host, key, now):
+        """Takes a sample from the reply to a SYN probe, if its send time is still known.
+
+        Args:
+            host (str) : Address of the host
+            key (int) : Address of the host << 16 | port
+            now (float) : Monotonic receive time
+
+        Returns:
+            rtt (float) : The round trip time of the probe, None if its send time is not known
+        """
+        slot = self.slot(key)
+        if self.sent_keys[slot] != key:
+            return None
+        rtt = now - self.sent_times[slot]
+        self.update(host, rtt)
+        # A retransmitted reply must not give a second sample
+        self.sent_keys[slot] = 0
+        return rtt
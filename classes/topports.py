@@ -0,0 +1,95 @@
+from classes.services import Services
+
+
+class TopPorts:
+    """This class provides port lists ranked by how often the ports are open.
+    The ranking starts with the ports counted in the logged scans. Ports that were never found
+    open follow in a bundled default order of commonly open TCP ports, then the TCP ports of the
+    bundled Services table and at last all other ports in ascending order, so the ranking also works
+    before the first scan is logged.
+    A port specification can contain the preset top:N for the N highest ranked ports.
+    """
+
+    # Prefix of the preset in a port specification
+    PRESET = 'top:'
+
+    # Commonly open TCP ports, the most frequently open first
+    default_ranking = [
+        80, 23, 443, 21, 22, 25, 3389, 110, 445, 139, 143, 53, 135, 3306, 8080, 1723, 111, 995, 993, 5900,
+        1025, 587, 8888, 199, 1720, 465, 548, 113, 81, 6001, 10000, 514, 5060, 179, 1026, 2000, 8443, 8000,
+        32768, 554, 26, 1433, 49152, 2001, 515, 8008, 49154, 1027, 5666, 646, 5000, 5631, 631, 49153, 8081,
+        2049, 88, 79, 5800, 106, 2121, 1110, 49155, 6000, 513, 990, 5357, 427, 49156, 543, 544, 5101, 144,
+        7, 389, 8009, 3128, 444, 9999, 5009, 7070, 5190, 3000, 5432, 1900, 3986, 13, 1029, 9, 5051, 6646,
+        49157, 1028, 873, 1755, 2717, 4899, 9100, 119, 37, 1000, 3001, 5001, 82, 10010, 1030, 9090, 2107,
+        1024, 2103, 6004, 1801, 5050, 19, 8031, 1041, 255, 1048, 1049, 1053, 1054, 1056, 1064, 1065, 2967,
+        3703, 17, 808, 3689, 1031, 1044, 1071, 5901, 100, 9102, 8010, 2869, 1039, 5120, 4001, 9000, 2105,
+        636, 1038, 2601, 1, 7000, 1066, 1069, 625, 311, 280, 254, 4000, 1761, 5003, 2002, 2005, 1998, 1032,
+        1050, 6112, 3690, 1521, 2161, 6002, 1080, 2401, 4045, 902, 7937, 787, 1058, 2383, 32771, 1033, 1040,
+        1059, 50000, 5555, 10001, 1494, 593, 2301, 3, 6379, 27017, 9200, 11211, 5672, 6443, 2375, 8086,
+    ]
+
+    @classmethod
+    def expand(cls, port_spec, controller):
+        """Replaces the presets of a port specification with the ranked ports.
+
+        Args:
+            port_spec (str) : Comma separated ports, port ranges and top:N presets
+            controller (DBController) : The database with the port statistics
+
+        Returns:
+            port_spec (str) : Comma separated ports and port ranges
+        """
+        items = []
+        for item in str(port_spec).split(','):
+            item = item.strip()
+            if item.startswith(cls.PRESET):
+                items.append(cls.to_port_string(cls.ranking(int(item[len(cls.PRESET):]), controller)))
+            elif item:
+                items.append(item)
+        return ','.join(items)
+
+    @classmethod
+    def ranking(cls, count, controller):
+        """Returns the highest ranked ports.
+
+        Args:
+            count (int) : Number of ports
+            controller (DBController) : The database with the port statistics
+
+        Returns:
+            ports (list) : Port numbers, the most frequently open first
+        """
+        ranked = list(controller.top_ports(count))
+        seen = set(ranked)
+        for candidates in (cls.default_ranking, Services.bundled_ports('tcp'), range(1, 65536)):
+            for port_number in candidates:
+                if len(ranked) >= count:
+                    return ranked
+                if port_number not in seen:
+                    seen.add(port_number)
+                    ranked.append(port_number)
+        return ranked
+
+    @staticmethod
+    def to_port_string(ports):
+        """Converts a list of ports to a port specification in the same order.
+        Runs of consecutive ports are written as one range.
+
+        Args:
+            ports (list) : Port numbers
+
+        Returns:
+            port_spec (str) : Comma separated ports and port ranges
+        """
+        items = []
+        start = end = None
+        for port_number in ports:
+            if end is not None and port_number == end + 1:
+                end = port_number
+                continue
+            if start is not None:
+                items.append(str(start) if start == end else str(start) + '-' + str(end))
+            start = end = port_number
+        if start is not None:
+            items.append(str(start) if start == end else str(start) + '-' + str(end))
+        return ','.join(items)
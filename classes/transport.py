@@ -0,0 +1,136 @@
+import errno
+import socket
+import time
+
+# Not exported by the socket module, value of linux/asm-generic/socket.h
+SO_RCVBUFFORCE = getattr(socket, 'SO_RCVBUFFORCE', 33)
+
+
+class SocketTransport:
+    """This class sends the probes of the scan engines through the sockets of the operating system.
+    The engines only decide what to probe and when, the transport performs the connects and opens
+    the raw socket of the SYN-Scan. The SimulatedTransport has the same methods.
+    """
+
+    SUCCESS = 0
+
+    # Receive buffer of the raw socket in bytes
+    RECV_BUFFER = 8 * 1024 * 1024
+
+    async def connect_async(self, loop, host, port_number, timeout):
+        """Performs a single non-blocking TCP connect.
+        The connect is started without blocking and the event loop reports when the socket
+        becomes writable. A timer on the loop enforces the deadline.
+
+        Args:
+            loop (AbstractEventLoop) : The running event loop
+            host (str) : The Host IP-Address
+            port_number (int) : The Port number
+            timeout (float) : Seconds until the connect counts as unanswered
+
+        Returns:
+            result (tuple) : (error number or SUCCESS, round trip time if the host answered or None),
+                             ETIMEDOUT if the deadline passed
+        """
+        tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        tcp_sock.setblocking(False)
+        fd = tcp_sock.fileno()
+        try:
+            start = loop.time()
+            err = tcp_sock.connect_ex((host, port_number))
+            if err == self.SUCCESS:
+                return err, loop.time() - start
+            if err not in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                return err, None
+
+            # Wait until the handshake is finished or the deadline is reached
+            done = loop.create_future()
+            loop.add_writer(fd, self.set_future, done, True)
+            deadline = loop.call_later(timeout, self.set_future, done, False)
+            try:
+                finished = await done
+            finally:
+                loop.remove_writer(fd)
+                deadline.cancel()
+
+            if not finished:
+                return errno.ETIMEDOUT, None
+            # Result of the connect is stored in SO_ERROR
+            err = tcp_sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            # A SYN-ACK and a RST both took one round trip
+            if err in (self.SUCCESS, errno.ECONNREFUSED):
+                return err, loop.time() - start
+            return err, None
+        finally:
+            tcp_sock.close()
+
+    @staticmethod
+    def set_future(future, value):
+        """Resolves the future of a connect, if nothing resolved it before.
+
+        Args:
+            future (Future) : The future of the connect
+            value (bool) : True if the socket became writable, False on timeout
+        """
+        if not future.done():
+            future.set_result(value)
+
+    def connect(self, host, port_number, timeout):
+        """Performs a single blocking TCP connect.
+
+        Args:
+            host (str) : The Host IP-Address
+            port_number (int) : The Port number
+            timeout (float) : Seconds until the connect counts as unanswered
+
+        Returns:
+            result (tuple) : (error number or SUCCESS, round trip time if the host answered or None)
+        """
+        # Creation of the socket
+        tcp_sock = socket.socket(socket.AF_INET,      # IPv4
+                                 socket.SOCK_STREAM)  # TCP
+        try:
+            # Sets the timeout for the socket
+            tcp_sock.settimeout(timeout)
+
+            # Like connect(address), but return an error indicator instead
+            # of raising an exception for errors returned by the C-level connect()
+            start = time.monotonic()
+            err = tcp_sock.connect_ex((host, port_number))
+            if err in (self.SUCCESS, errno.ECONNREFUSED):
+                return err, time.monotonic() - start
+            # A blocking connect returns EAGAIN when the timeout of the socket passed
+            if err == errno.EAGAIN:
+                return errno.ETIMEDOUT, None
+            return err, None
+        finally:
+            tcp_sock.close()
+
+    def open_raw(self, rs):
+        """Creates the raw socket used for sending and receiving the SYN probes.
+
+        Args:
+            rs (RawScan) : Packet builder of the scan
+
+        Returns:
+            syn_sock (socket) : Raw TCP socket with IP_HDRINCL set and the filter of the probes attached
+        """
+
+        # Initialization of socket in IPv4, Raw Socket, TCP Mode
+        syn_sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+
+        # Set IP Headers and for Raw Sockets IP_HDRINCL is necessary
+        syn_sock.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
+
+        # Replies arrive in bursts while the sender is still running, a small
+        # receive buffer would drop them. SO_RCVBUFFORCE ignores rmem_max as root.
+        try:
+            syn_sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, self.RECV_BUFFER)
+        except OSError:
+            syn_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.RECV_BUFFER)
+
+        # Bind the socket to address
+        syn_sock.bind(('0.0.0.0', rs.src_port))
+
+        rs.attach_filter(syn_sock)
+        return syn_sock
@@ -0,0 +1,250 @@
+import csv
+import io
+import json
+import socket
+import struct
+import sys
+import threading
+
+from classes.services import Services
+
+
+class ResultWriter:
+    """Base class of the writers of the result events.
+    The events are collected and written in batches. A batch is written once it is full or
+    flush_interval seconds after its first event, so results reach the output within seconds
+    while the writer does not issue one write per event.
+    """
+
+    # Events per batch and seconds until a batch is written at the latest
+    batch_size = 256
+    flush_interval = 1.0
+
+    # Writers of binary records need a file opened in binary mode
+    binary = False
+
+    def __init__(self, file):
+        """Initializes the writer with the output file.
+
+        Args:
+            file (file) : Opened output file, text or binary mode as the writer needs it
+        """
+        self.file = file
+        self.batch = []
+        self.lock = threading.Lock()
+        self.timer = None
+        self.header_written = False
+
+    @staticmethod
+    def create(output_format, path=None):
+        """Creates the writer of an output format.
+
+        Args:
+            output_format (str) : 'console', 'ndjson', 'csv' or 'binary'
+            path (str) : Path of the output file, stdout if None
+
+        Returns:
+            writer (ResultWriter) : The writer
+        """
+        writer_class = writers[output_format]
+        if path is None:
+            file = sys.stdout.buffer if writer_class.binary else sys.stdout
+        elif writer_class.binary:
+            file = open(path, 'wb')
+        else:
+            file = open(path, 'w', newline='')
+        return writer_class(file)
+
+    def write(self, event):
+        """Adds an event to the batch.
+
+        Args:
+            event (ScanEvent) : The result of a probe or a BannerEvent
+        """
+        with self.lock:
+            self.batch.append(event)
+            if len(self.batch) >= self.batch_size:
+                self.write_batch()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        """Writes the collected events."""
+        with self.lock:
+            self.write_batch()
+
+    def write_batch(self):
+        """Writes the batch to the file, the lock has to be held."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.header_written:
+            self.file.write(self.header())
+            self.header_written = True
+        if self.batch:
+            self.file.write(self.format(self.batch))
+            self.batch = []
+        self.file.flush()
+
+    def close(self):
+        """Writes the remaining events and closes the file unless it is stdout."""
+        self.flush()
+        if self.file not in (sys.stdout, sys.stdout.buffer):
+            self.file.close()
+
+    def header(self):
+        """Returns the data written before the first batch."""
+        return b'' if self.binary else ''
+
+    def format(self, events):
+        """Formats a batch of events.
+
+        Args:
+            events (list) : ScanEvents
+
+        Returns:
+            data (str) : The formatted events, bytes for binary writers
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def rtt_ms(event):
+        """Returns the round trip time of an event in milliseconds, None if unknown."""
+        return None if event.rtt is None else round(event.rtt * 1000, 3)
+
+    @staticmethod
+    def is_banner(event):
+        """Returns True for a BannerEvent, its state is 'banner'."""
+        return event.state == 'banner'
+
+    @classmethod
+    def service(cls, event):
+        """Returns the detected service of a banner or the service name of the port."""
+        return event.service if cls.is_banner(event) else Services.get_service(event.port)
+
+
+class ConsoleWriter(ResultWriter):
+    """Writes the events as lines of text like the Scan-Report, banners with their version and text."""
+
+    def header(self):
+        return 'HOST\tPORT\tSTATE\tSERVICE\tRTT\n'
+
+    def format(self, events):
+        lines = []
+        for event in events:
+            rtt = self.rtt_ms(event)
+            line = (event.host + '\t' + str(event.port) + '\\tcp\t' + event.state + '\t' + self.service(event) + '\t'
+                    + ('' if rtt is None else str(rtt) + 'ms'))
+            if self.is_banner(event):
+                line += '\t' + event.version + '\t' + event.banner
+            lines.append(line + '\n')
+        return ''.join(lines)
+
+
+class NDJSONWriter(ResultWriter):
+    """Writes every event as JSON object on its own line, banners also with their version and text."""
+
+    def format(self, events):
+        lines = []
+        for event in events:
+            record = {'host': event.host, 'port': event.port, 'state': event.state, 'rtt_ms': self.rtt_ms(event),
+                      'service': self.service(event)}
+            if self.is_banner(event):
+                record['version'] = event.version
+                record['banner'] = event.banner
+            lines.append(json.dumps(record) + '\n')
+        return ''.join(lines)
+
+
+class CSVWriter(ResultWriter):
+    """Writes the events as comma separated values with a header line.
+    The version and banner columns are only filled for banners.
+    """
+
+    columns = ['host', 'port', 'state', 'rtt_ms', 'service', 'version', 'banner']
+
+    def header(self):
+        return self.format_rows([self.columns])
+
+    def format(self, events):
+        return self.format_rows([event.host, event.port, event.state, self.rtt_ms(event), self.service(event)]
+                                + ([event.version, event.banner] if self.is_banner(event) else ['', ''])
+                                for event in events)
+
+    @staticmethod
+    def format_rows(rows):
+        """Formats rows as CSV.
+
+        Args:
+            rows (iterable) : Lists of values
+
+        Returns:
+            data (str) : The CSV lines
+        """
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(rows)
+        return buffer.getvalue()
+
+
+class BinaryWriter(ResultWriter):
+    """Writes the events as fixed-width binary records after a magic header.
+    Every record has 12 bytes in network byte order: IPv4 address (4), port (2), state (1),
+    reserved (1) and the round trip time in microseconds (4), 0xffffffff if unknown.
+    Banners do not fit into the records and are not written.
+    """
+
+    binary = True
+
+    MAGIC = b'PSR1'
+    record = struct.Struct('!4sHBxI')
+
+    # State codes of the records
+    states = {'open': 1, 'closed': 2, 'filtered': 3}
+    UNKNOWN_RTT = 0xffffffff
+
+    def header(self):
+        return self.MAGIC
+
+    def format(self, events):
+        events = [event for event in events if event.state in self.states]
+        data = bytearray(self.record.size * len(events))
+        for index, event in enumerate(events):
+            rtt = self.UNKNOWN_RTT if event.rtt is None else min(self.UNKNOWN_RTT - 1, int(event.rtt * 1000000))
+            self.record.pack_into(data, index * self.record.size, socket.inet_aton(event.host), event.port,
+                                  self.states[event.state], rtt)
+        return bytes(data)
+
+    @classmethod
+    def read(cls, file):
+        """Reads the events of a record file.
+
+        Args:
+            file (file) : Record file opened in binary mode
+
+        Returns:
+            events (generator) : ScanEvent of every record
+        """
+        # Imported here, the writers do not need the scan engines
+        from classes.scan import ScanEvent
+
+        if file.read(len(cls.MAGIC)) != cls.MAGIC:
+            raise ValueError('Not a PenScan record file')
+        names = {code: state for state, code in cls.states.items()}
+        while True:
+            data = file.read(cls.record.size * 1024)
+            if not data:
+                break
+            for addr, port_number, state, rtt in cls.record.iter_unpack(data[:len(data) - len(data) % cls.record.size]):
+                yield ScanEvent(socket.inet_ntoa(addr), port_number, names[state],
+                                None if rtt == cls.UNKNOWN_RTT else rtt / 1000000)
+
+
+# Writer of every output format
+writers = {
+    'console': ConsoleWriter,
+    'ndjson': NDJSONWriter,
+    'csv': CSVWriter,
+    'binary': BinaryWriter,
+}
@@ -1,13 +1,23 @@
+import contextlib
 import os
+import random
 import socket
+import sys
 import time
 
 import click
 
-from classes.scan import Scan
 from classes.dbcontroller import DBController
-from classes.configcontroller import ConfigController
+from classes.portset import PortSet
 from classes.services import Services
+from classes.topports import TopPorts
+from classes.writers import ResultWriter, writers
+
+# The scan engines pull in asyncio, ctypes and thread pools. They are imported in the
+# functions that scan, so the help and the queries of the database start without them.
+
+# Characters of a banner printed in the Scan-Report
+BANNER_WIDTH = 60
 
 
 @click.command()
@@ -15,124 +25,643 @@ from classes.services import Services
 @click.option('-s', is_flag=True, help='SYN Scan with TCP-Protocol')
 @click.option('-l', is_flag=True, help='Log Scan-Results to DB')
 @click.option('-f', type=click.STRING, help='Enter filepath where *.ini file is located for batch scanning')
-@click.option('-ip', type=click.STRING, help='IP-Address/Hostname to scan')
+@click.option('-ip', type=click.STRING,
+              help='IP-Address/Hostname, CIDR block(10.0.0.0/24), address range(10.0.0.1-20) '
+                   'or a comma separated list of them to scan')
 @click.option('-r', type=click.STRING,
-              help='Defines the Range(50-80) or a comma separated list(80,443) of ports to scan')
+              help='Defines the Range(50-80) or a comma separated list(80,443,8000-8100) of ports to scan, '
+                   'top:N adds the N most frequently open ports')
+@click.option('--top', type=click.IntRange(1, 65535),
+              help='Scans the N most frequently open ports of the logged entries (same as -r top:N)')
 @click.option('-p', type=int, help='Prints the last X logged entries')
-def main(t, s, l, f, ip, r, p):
+@click.option('--history', type=click.STRING, help='Prints the logged entries of a host (the last X with -p)')
+@click.option('--open-port', type=int, help='Prints the hosts whose last logged entry has the port open')
+@click.option('--changes', type=click.STRING, help='Prints the ports that opened/closed between the last two '
+                                                   'logged entries of a host')
+@click.option('-e', type=click.Choice(['async', 'thread']), default='async', show_default=True,
+              help='Engine of the TCP-Scan: event loop or one thread per port')
+@click.option('-c', type=int, default=1000, show_default=True,
+              help='Maximum number of connects in flight with the async engine, shared by all sections of -f')
+@click.option('--parallel', type=click.IntRange(1), default=16, show_default=True,
+              help='Maximum number of sections of -f that are scanned at the same time')
+@click.option('--host-limit', type=click.IntRange(1), default=100, show_default=True,
+              help='Maximum number of connects in flight per host with -f')
+@click.option('--timing', type=click.Choice(['lan', 'fast', 'normal', 'slow']), default='normal', show_default=True,
+              help='Timing profile, the timeouts adapt to the measured round trip times within its bounds')
+@click.option('--rate', type=click.IntRange(min=1), help='Maximum probes per second of all scans, backs off on packet loss')
+@click.option('--burst', type=click.IntRange(min=1), help='Probes that may be sent at once with --rate (default: rate/100)')
+@click.option('--randomize', is_flag=True, help='Probes the hosts and ports in a random order')
+@click.option('--seed', type=int, help='Seed of the random order, repeats the order of a previous scan')
+@click.option('-n', is_flag=True, help='Skips the reverse DNS lookups of the Scan-Report')
+@click.option('--resumable', is_flag=True,
+              help='Stores checkpoints while scanning, so an interrupted scan can be continued with --resume')
+@click.option('--resume', type=int, help='Continues the interrupted scan of the checkpoint with the id')
+@click.option('-o', type=click.Choice(sorted(writers)),
+              help='Streams the results while scanning in the output format instead of printing the Scan-Report')
+@click.option('--output-file', type=click.Path(dir_okay=False), help='File of the streamed results (default: stdout)')
+@click.option('--states', type=click.STRING, default='open', show_default=True,
+              help='Comma separated states (open,closed,filtered) of the streamed results')
+@click.option('--since-last', is_flag=True,
+              help='Probes the ports of the last logged entry first and prints the changes (new, closed, unchanged)')
+@click.option('--sweep', type=click.IntRange(0, 100), default=100, show_default=True,
+              help='Percentage of the remaining ports that is swept with --since-last, a random sample if below 100')
+@click.option('--workers', type=click.IntRange(1), default=1, show_default=True,
+              help='Splits the scan of -ip into shards scanned by this many processes, -c and --rate are split '
+                   'between them')
+@click.option('--progress', is_flag=True, help='Prints the sent probes, the probe rate and the ETA to stderr')
+@click.option('--stats-json', type=click.Path(dir_okay=False),
+              help='Writes the counters, phase timers and round trip times to a JSON file')
+@click.option('--stats-prom', type=click.Path(dir_okay=False),
+              help='Writes the counters, phase timers and round trip times to a Prometheus textfile while scanning')
+@click.option('--banners', is_flag=True,
+              help='Grabs the banners of the open ports while scanning and detects their services')
+@click.option('--banner-connections', type=click.IntRange(1), default=100, show_default=True,
+              help='Maximum number of banner connections open at the same time')
+@click.option('--banner-timeout', type=click.FloatRange(0, min_open=True), default=5.0, show_default=True,
+              help='Seconds until a banner connection is closed')
+def main(t, s, l, f, ip, r, top, p, history, open_port, changes, e, c, parallel, host_limit, timing, rate, burst,
+         randomize, seed, n, resumable, resume, o, output_file, states, since_last, sweep, workers, progress, stats_json,
+         stats_prom, banners, banner_connections, banner_timeout):
     """PenScan - Port-Scanner written in Python to scan Hosts and exploit them afterwards."""
 
-    if t is False and s is False and f is None and p is None:
+    queries = history is not None or open_port is not None or changes is not None
+    if t is False and s is False and f is None and p is None and resume is None and not queries:
         print("missing argument!\npenscan --help\tfor more information")
         quit(1)
 
     start_time = time.time()
 
+    if top:
+        r = TopPorts.PRESET + str(top) if r is None else r + ',' + TopPorts.PRESET + str(top)
+
+    # the streamed results own stdout, the status and diagnostic lines go to stderr then
+    status = sys.stderr if o and output_file is None else sys.stdout
+
+    # the seed is printed so the order of the scan can be repeated
+    if randomize and seed is None:
+        seed = random.getrandbits(32)
+    if seed is not None:
+        print('Random scan order with seed ' + str(seed), file=status)
+
+    # one database connection for all scans
+    controller = DBController()
+    metrics = None
+    try:
+        if queries:
+            query(p, history, open_port, changes, controller)
+        elif p and not f:
+            print_scans(controller.last_scans(p))
+        else:
+            from classes.ratelimiter import RateLimiter
+            from classes.resolver import Resolver
+
+            # one rate limiter, one writer for the streamed results and one resolver for all scans
+            # the counters and timers are only collected if they are shown or exported
+            if progress or stats_json or stats_prom:
+                from classes.metrics import Metrics
+
+                metrics = Metrics()
+                controller.metrics = metrics
+                metrics.start_reporting(progress=progress, prometheus_path=stats_prom)
+
+            rate_limiter = RateLimiter(rate, burst)
+            writer = ResultWriter.create(o, output_file) if o else None
+            resolver = Resolver(reverse_dns=not n, metrics=metrics)
+
+            # the banners are grabbed in the background while the scans run
+            grabber = None
+            if banners:
+                from classes.banners import BannerGrabber
+
+                grabber = BannerGrabber(banner_connections, banner_timeout,
+                                        listener=writer.write if writer is not None else None,
+                                        controller=controller, metrics=metrics)
+                grabber.start()
+            try:
+                with contextlib.redirect_stdout(status):
+                    run(t, s, l, f, ip, r, p, e, c, timing, seed, rate_limiter, controller, since_last, sweep,
+                        parallel, host_limit, writer, states.split(','), resume, resolver, workers, metrics, grabber,
+                        resumable)
+            except BaseException:
+                # an interrupted scan does not wait for its banners
+                if grabber is not None:
+                    grabber.close(cancel=True)
+                raise
+            finally:
+                if grabber is not None:
+                    grabber.close()
+                resolver.close()
+                if writer is not None:
+                    writer.close()
+    finally:
+        # waits until the background writer has stored all scans
+        controller.close()
+        if metrics is not None:
+            metrics.stop_reporting()
+            metrics.export(stats_json, stats_prom)
+
+    # calculates the total time of the scans and prints it
+    duration = time.time()-start_time
+    print('Scan completed in ' + str(round(duration, 2)) + 's', file=status)
+
+
+def run(t, s, l, f, ip, r, p, e, c, timing, seed, rate_limiter, controller, since_last=False, sweep=100,
+        parallel=16, host_limit=100, writer=None, states=('open',), resume=None, resolver=None, workers=1,
+        metrics=None, grabber=None, resumable=False):
+    """Runs the batch file, prints the logged entries or scans the selected target.
+
+    Args:
+        t, s, l, f, ip, r, p, e, c, timing, seed, since_last, sweep, parallel, host_limit, workers : The command line
+                                                                                                    options
+        rate_limiter (RateLimiter) : The probe rate shared by all scans
+        controller (DBController)  : The database shared by all scans
+        writer (ResultWriter)      : Streams the results instead of the Scan-Report, None for the report
+        states (list)              : States of the streamed results
+        resume (int)               : Id of the checkpoint of the scan to continue
+        resolver (Resolver)        : The resolver shared by all scans
+        metrics (Metrics)          : Collects the counters and timers of all scans, nothing is collected if None
+        grabber (BannerGrabber)    : Grabs the banners of the open ports, no banners if None
+        resumable (bool)           : Switch for the checkpoints of the scan of -ip
+    """
+
+    # continue an interrupted scan
+    if resume is not None:
+        checkpoint = controller.load_checkpoint(resume)
+        if checkpoint is None:
+            print('Checkpoint ' + str(resume) + ' not found')
+        elif checkpoint[5]:
+            print('Scan of checkpoint ' + str(resume) + ' is already finished')
+        else:
+            hosts, ports, protocol, seed, position, _, results = checkpoint
+            print('Resuming scan of ' + hosts + ' at position ' + str(position))
+            scan(protocol == 'tcp', protocol == 'syn', l, hosts, ports, e, c, seed, timing, rate_limiter, controller,
+                 writer=writer, states=states, resume=(resume, position, results), resolver=resolver,
+                 metrics=metrics, grabber=grabber)
+        return
+
     # config batch scanning was selected
     if f:
-        # read the config
-        config = ConfigController.read_config(f)
-        # determines the scan type
-        for item in config:
-            if not item[1].find('syn'):
-                s = True
-                t = False
-            if not item[1].find('tcp'):
-                t = True
-                s = False
-            if not s and not t:
-                print('Protocol ' + item[1] + ' unknown!')
-
-            # set log flag
-            if item[3] is 'yes':
-                l = True
-            else:
-                l = False
-
-            # run the scan
-            scan(t, s, l, item[0], item[2])
-            print('')
+        batch(f, e, c, timing, seed, rate_limiter, controller, since_last, sweep, parallel, host_limit, writer,
+              resolver, metrics, grabber)
     # print saved scans from database
     if p:
-        p = p+1
-        controller = DBController()
-        for item in controller.load_scans():
-            if p > 1:
-                print('Scan for ' + item[1] + ' Date: ' + item[0])
-                print_ports(item[2], 'tcp')
-                p = p-1
+        print_scans(controller.last_scans(p))
     # scan the selected target
     if not f and not p:
-        scan(t, s, l, ip, r)
+        scan(t, s, l, ip, r, e, c, seed, timing, rate_limiter, controller, since_last, sweep, writer, states,
+             resolver=resolver, workers=workers, metrics=metrics, grabber=grabber, resumable=resumable)
 
-    # calculates the total time of the scans and prints it
-    duration = time.time()-start_time
-    print('Scan completed in ' + str(duration)[:4] + 's')
+
+def batch(f, e, c, timing, seed, rate_limiter, controller, since_last, sweep, parallel, host_limit, writer=None,
+          resolver=None, metrics=None, grabber=None):
+    """Scans the sections of the config file, the reports are printed as the sections complete.
+
+    Args:
+        f, e, c, timing, seed, since_last, sweep, parallel, host_limit : The command line options
+        rate_limiter (RateLimiter) : The probe rate shared by all scans
+        controller (DBController)  : The database shared by all scans
+        writer (ResultWriter)      : Writes the open ports of every completed section instead of the report
+        resolver (Resolver)        : The resolver shared by all scans
+        metrics (Metrics)          : Collects the counters and timers of all scans, nothing is collected if None
+        grabber (BannerGrabber)    : Grabs the banners of the open ports while the sections run, not with since_last
+    """
+    from classes.batch import BatchScan
+    from classes.configcontroller import ConfigController
+    from classes.scan import Scan, ScanEvent
+
+    sections = []
+    for host, protocol, ports, log in ConfigController.read_config(f):
+        # determines the scan type
+        if protocol.startswith('syn'):
+            protocol = 'syn'
+        elif protocol.startswith('tcp'):
+            protocol = 'tcp'
+        else:
+            print('Protocol ' + protocol + ' unknown!')
+            continue
+
+        # for syn-scan root permissions are needed
+        if protocol == 'syn' and os.geteuid() != 0:
+            print('Syn scan of ' + host + ' requires root privileges.')
+            continue
+
+        sections.append((host, protocol, TopPorts.expand(ports, controller), log == 'yes'))
+
+    # the rescans compare every section with its history one after another
+    if since_last:
+        for host, protocol, ports, log in sections:
+            scan(protocol == 'tcp', protocol == 'syn', log, host, ports, e, c, seed, timing, rate_limiter,
+                 controller, since_last, sweep, resolver=resolver, metrics=metrics)
+            print('')
+        return
+
+    def report(section, sc, results):
+        host, _, _, log = section
+        if isinstance(results, Exception):
+            print('Scan of ' + host + ' failed: ' + str(results))
+        elif writer is not None:
+            for result_host, ports in results.items():
+                for port in ports:
+                    writer.write(ScanEvent(result_host, port, Scan.OPEN, None))
+            save_results(sc, results, log, controller)
+            return
+        else:
+            print_report(sc, results, log, controller, resolver, grabber)
+        print('')
+
+    # the open ports of every section are grabbed while it is scanned, banners of logged sections are saved
+    def grab_banners(section, event):
+        grabber.submit(event, section[3])
+
+    listener = grab_banners if grabber is not None else None
+
+    BatchScan(sections, e, c, host_limit, parallel, seed, timing, rate_limiter, resolver, metrics,
+              listener).run(report)
 
 
-def scan(t, s, l, ip, r):
+def query(p, history, open_port, changes, controller):
+    """Prints the results of the history queries.
+
+    Args:
+        p (int)         : The maximum number of logged entries of the host history
+        history (str)   : The host of the history
+        open_port (int) : The port to find the hosts with
+        changes (str)   : The host to compare the last two logged entries of
+        controller (DBController) : The database
+    """
+    if history is not None:
+        print_scans(controller.host_history(history, p))
+
+    if open_port is not None:
+        print('HOST\tDATE')
+        for date, host in controller.hosts_with_port(open_port):
+            print(host + '\t' + date)
+
+    if changes is not None:
+        result = controller.port_changes(changes)
+        if result is None:
+            print('Less than two logged entries for ' + changes)
+            return
+        old_date, new_date, opened, closed = result
+        print('Changes for ' + changes + ' from ' + old_date + ' to ' + new_date)
+        print('PORT\tSTATE\tSERVICE')
+        print_ports(opened, 'tcp', 'opened')
+        print_ports(closed, 'tcp', 'closed')
+
+
+def print_scans(scans):
+    """Prints logged entries.
+
+    Args:
+        scans (iterable) : (date, host, PortSet) of every scan
+    """
+    for date, host, ports in scans:
+        print('Scan for ' + host + ' Date: ' + date)
+        print_ports(ports, 'tcp')
+
+
+def scan(t, s, l, ip, r, e='async', c=1000, seed=None, timing='normal', rate_limiter=None, controller=None,
+         since_last=False, sweep=100, writer=None, states=('open',), resume=None, resolver=None, workers=1,
+         metrics=None, grabber=None, resumable=False):
     """Initialises the necessary classes and starts the scans.
 
     Args:
         t (bool)    : Switch for TCP-Scan
         s (bool)    : Switch for SYN-Scan
         l (bool)    : Switch for Saving the Results to Database
-        ip (str)    : The Host IP-Address
-        r (str)     : The Port-Range
+        ip (str)    : The Host IP-Addresses, CIDR blocks or address ranges
+        r (str)     : The Port-Range, may contain top:N presets
+        e (str)     : The TCP-Engine ('async' or 'thread')
+        c (int)     : The maximum number of connects in flight
+        seed (int)  : The seed of the random scan order, ascending order if None
+        timing (str): The timing profile
+        rate_limiter (RateLimiter) : The probe rate shared by all scans, unlimited if None
+        controller (DBController)  : The database shared by all scans, a new connection if None
+        since_last (bool)          : Switch for the rescan against the last logged entries
+        sweep (int)                : Percentage of the remaining ports swept with since_last
+        writer (ResultWriter)      : Streams the results instead of the Scan-Report, None for the report
+        states (list)              : States of the streamed results
+        resume (tuple)             : (checkpoint id, position, PortSet of every host) of the scan to continue
+        resolver (Resolver)        : The resolver shared by all scans, a new one if None
+        workers (int)              : Number of processes that scan shards of the targets, resumed scans use one
+        metrics (Metrics)          : Collects the counters and timers of the scans, not of sharded scans
+        grabber (BannerGrabber)    : Grabs the banners of the open ports while scanning, not with since_last
+        resumable (bool)           : Switch for the checkpoints, resumed scans always store them
     """
 
     if ip is None and r is None:
         print('Argument: "ip" or "r" or both are missing')
         quit(2)
 
-    controller = DBController()
-    sc = Scan(r, ip)
-    open_ports_tcp = {}
-    # resolve the hostname if possible
-    dns = socket.getfqdn(ip)
-    if dns is not ip:
-        print('Scan-Report for ' + dns + ' (' + ip + ')')
-    else:
-        print('Scan-Report for ' + dns)
-    print('PORT\tSTATE\tSERVICE')
+    from classes.diffscan import DiffScan
+    from classes.resolver import Resolver
+    from classes.scan import Scan
+
+    if controller is None:
+        controller = DBController()
+    if resolver is None:
+        resolver = Resolver()
+
+    # replace the top:N presets with the ranked ports
+    if r is not None:
+        r = TopPorts.expand(r, controller)
+
+    if since_last:
+        diff_scan = DiffScan(r, ip, controller, sweep, seed, engine=e, concurrency=c, timing=timing,
+                             rate_limiter=rate_limiter, resolver=resolver, metrics=metrics)
+        if t:
+            print_diff(diff_scan, 'tcp', l, controller)
+        if s:
+            if os.geteuid() == 0:
+                print_diff(diff_scan, 'syn', l, controller)
+            else:
+                print('Syn scan requires root privileges.')
+                print('Doing nothing!')
+        return
+
+    if workers > 1 and resume is None:
+        from classes.shardscan import ShardScan
+        from classes.targets import Targets
+
+        sc = ShardScan(Targets(ip, r, seed, resolver=resolver), workers, engine=e, concurrency=c, timing=timing,
+                       rate_limiter=rate_limiter)
+        if t:
+            scan_sharded(sc, 'tcp', l, controller, writer, states, resolver, grabber)
+        if s:
+            if os.geteuid() == 0:
+                scan_sharded(sc, 'syn', l, controller, writer, states, resolver, grabber)
+            else:
+                print('Syn scan requires root privileges.')
+                print('Doing nothing!')
+        return
+
+    sc = Scan(r, ip, engine=e, concurrency=c, timing=timing, seed=seed, rate_limiter=rate_limiter, resolver=resolver,
+              metrics=metrics)
+    checkpoint_id = None
+    if resume is not None:
+        checkpoint_id, sc.start, sc.initial_output = resume
 
     # run tcp-scan on target
     if t:
-        open_ports_tcp = sc.scan_tcp()
-        print_ports(open_ports_tcp, 'tcp')
+        scan_checkpointed(sc, 'tcp', ip, r, seed, l, controller, writer, states, checkpoint_id, resolver, grabber,
+                          resumable)
     # run syn-scan on target
     if s:
         # for syn-scan root permissions are needed
         if os.geteuid() == 0:
-            open_ports_tcp = sc.scan_syn()
-            print_ports(open_ports_tcp, 'tcp')
+            scan_checkpointed(sc, 'syn', ip, r, seed, l, controller, writer, states, checkpoint_id, resolver,
+                              grabber, resumable)
         else:
             print('Syn scan requires root privileges.')
             print('Doing nothing!')
-    # save the scan results to database
+
+
+def scan_checkpointed(sc, protocol, ip, r, seed, l, controller, writer, states, checkpoint_id=None, resolver=None,
+                      grabber=None, resumable=False):
+    """Runs the scan and prints or streams its results.
+    A resumable or resumed scan stores checkpoints. If it is interrupted, the last checkpoint is stored
+    and it can be continued with --resume. The checkpoint of a finished scan is deleted.
+
+    Args:
+        sc (Scan)                 : The scan
+        protocol (str)            : 'tcp' or 'syn'
+        ip, r, seed, l            : The command line options of the scan
+        controller (DBController) : The database
+        writer (ResultWriter)     : Streams the results instead of the Scan-Report, None for the report
+        states (list)             : States of the streamed results
+        checkpoint_id (int)       : Id of the checkpoint of a resumed scan, None for a new scan
+        resolver (Resolver)       : The resolver of the Scan-Report
+        grabber (BannerGrabber)   : Grabs the banners of the open ports while scanning, no banners if None
+        resumable (bool)          : Switch for the checkpoints of a new scan
+    """
+    from classes.checkpoint import Checkpoint
+
+    checkpoint = None
+    if checkpoint_id is not None:
+        checkpoint = Checkpoint(controller, checkpoint_id, sc, protocol)
+    elif resumable:
+        checkpoint = Checkpoint.create(controller, sc, ip, r, protocol, seed)
+    if checkpoint is not None:
+        sc.checkpoint = checkpoint
+        checkpoint.start()
+    try:
+        if writer is not None:
+            stream_report(sc, protocol, l, controller, writer, states, grabber)
+        else:
+            if grabber is not None:
+                sc.listener = lambda event: grabber.submit(event, l)
+            results = sc.scan_syn() if protocol == 'syn' else sc.scan_tcp()
+            print_report(sc, results, l, controller, resolver, grabber)
+    except BaseException:
+        if checkpoint is not None:
+            checkpoint.stop(False)
+            print('Scan interrupted, continue with --resume ' + str(checkpoint.checkpoint_id), file=sys.stderr)
+        raise
+    finally:
+        sc.checkpoint = None
+        sc.listener = None
+    if checkpoint is not None:
+        checkpoint.stop(True)
+
+
+def scan_sharded(sc, protocol, l, controller, writer, states, resolver=None, grabber=None):
+    """Runs the scan in worker processes and prints or streams its merged results.
+    Sharded scans write no checkpoints.
+
+    Args:
+        sc (ShardScan)            : The sharded scan
+        protocol (str)            : 'tcp' or 'syn'
+        l (bool)                  : Switch for Saving the Results to Database
+        controller (DBController) : The database
+        writer (ResultWriter)     : Streams the results instead of the Scan-Report, None for the report
+        states (list)             : States of the streamed results
+        resolver (Resolver)       : The resolver of the Scan-Report
+        grabber (BannerGrabber)   : Grabs the banners of the open ports while scanning, no banners if None
+    """
+    if writer is not None:
+        stream_events(sc.stream(protocol, stream_states(states, grabber)), l, writer, states, grabber)
+        save_results(sc, sc.output, l, controller)
+    elif grabber is not None:
+        # the report needs the open ports while the workers run
+        stream_events(sc.stream(protocol, ('open',)), l, None, (), grabber)
+        print_report(sc, sc.output, l, controller, resolver, grabber)
+    else:
+        print_report(sc, sc.scan(protocol), l, controller, resolver)
+
+
+def stream_report(sc, protocol, l, controller, writer, states, grabber=None):
+    """Writes the results while the scan runs and saves them afterwards if selected.
+
+    Args:
+        sc (Scan)                 : The scan
+        protocol (str)            : 'tcp' or 'syn'
+        l (bool)                  : Switch for Saving the Results to Database
+        controller (DBController) : The database
+        writer (ResultWriter)     : Writer of the results
+        states (list)             : States of the written results
+        grabber (BannerGrabber)   : Grabs the banners of the open ports, their banners are written as they arrive
+    """
+    stream_events(sc.stream(protocol, stream_states(states, grabber), keep_output=l), l, writer, states, grabber)
+    save_results(sc, sc.output, l, controller)
+
+
+def stream_states(states, grabber):
+    """Returns the states of the streamed events, the open ports are always streamed to the grabber.
+
+    Args:
+        states (list)           : States of the written results
+        grabber (BannerGrabber) : Grabs the banners of the open ports, None if no banners are grabbed
+
+    Returns:
+        states (list) : States of the events of the scan
+    """
+    if grabber is None or 'open' in states:
+        return states
+    return list(states) + ['open']
+
+
+def stream_events(events, l, writer, states, grabber=None):
+    """Writes the events of a running scan and submits its open ports to the grabber.
+
+    Args:
+        events (generator)      : ScanEvents of the scan
+        l (bool)                : Switch for Saving the banners to Database
+        writer (ResultWriter)   : Writer of the results, None to only grab the banners
+        states (list)           : States of the written results
+        grabber (BannerGrabber) : Grabs the banners of the open ports, None if no banners are grabbed
+    """
+    for event in events:
+        if writer is not None and event.state in states:
+            writer.write(event)
+        if grabber is not None and event.state == 'open':
+            grabber.submit(event, l)
+    if writer is not None:
+        writer.flush()
+
+
+def save_results(sc, results, l, controller):
+    """Saves the open ports of every host if selected.
+    A single host is saved even without open ports.
+
+    Args:
+        sc (Scan)                 : The finished scan
+        results (dict)            : The PortSet of the opened ports of every host
+        l (bool)                  : Switch for Saving the Results to Database
+        controller (DBController) : The database
+    """
+    if not l:
+        return
+    hosts = sorted(results, key=socket.inet_aton)
+    if not hosts and sc.targets.is_single_host():
+        hosts = list(sc.targets.hosts())
+    for host in hosts:
+        controller.save_scan(host, results.get(host, PortSet()))
+
+
+def print_report(sc, results, l, controller, resolver=None, grabber=None):
+    """Prints the Scan-Report of every host with open ports and saves it if selected.
+    A single host gets a report even without open ports.
+
+    Args:
+        sc (Scan)               : The finished scan
+        results (dict)          : The PortSet of the opened ports of every host
+        l (bool)                : Switch for Saving the Results to Database
+        controller (DBController) : The database
+        resolver (Resolver)     : Resolver of the hostnames, a new one if None
+        grabber (BannerGrabber) : Grabs the banners of the open ports, the report waits for those of its hosts
+    """
+    hosts = sorted(results, key=socket.inet_aton)
+    if not hosts and sc.targets.is_single_host():
+        hosts = list(sc.targets.hosts())
+
+    # the banners of other scans are still grabbed while the report is printed
+    banners = grabber.join(hosts) if grabber is not None else None
+
+    # resolve the hostnames of all hosts at once
+    if resolver is None:
+        from classes.resolver import Resolver
+        resolver = Resolver()
+    names = resolver.reverse_many(hosts)
+
+    for host in hosts:
+        # resolve the hostname if possible
+        dns = names[host]
+        if dns != host:
+            print('Scan-Report for ' + dns + ' (' + host + ')')
+        else:
+            print('Scan-Report for ' + dns)
+        ports = results.get(host, PortSet())
+        if banners is None:
+            print('PORT\tSTATE\tSERVICE')
+            print_ports(ports, 'tcp')
+        else:
+            print('PORT\tSTATE\tSERVICE\tVERSION\tBANNER')
+            print_ports(ports, 'tcp', banners=banners.get(host, {}))
+
+        # save the scan results to database
+        if l:
+            controller.save_scan(host, ports)
+
+
+def print_diff(diff_scan, protocol, l, controller):
+    """Prints the changes since the last logged entries and saves the new results if selected.
+    The changes of the known ports are printed before the rest of the range is swept.
+
+    Args:
+        diff_scan (DiffScan)      : The rescan of the targets
+        protocol (str)            : 'tcp' or 'syn'
+        l (bool)                  : Switch for Saving the Results to Database
+        controller (DBController) : The database
+    """
+    found = diff_scan.scan_known(protocol)
+    for host in sorted(diff_scan.known, key=socket.inet_aton):
+        known = diff_scan.known[host]
+        still_open = found.get(host, PortSet())
+        print('Changes for ' + host + ' since the last scan')
+        print('PORT\tSTATE\tSERVICE')
+        print_ports(known - still_open, 'tcp', 'closed')
+        print_ports(still_open, 'tcp', 'unchanged')
+
+    new = diff_scan.scan_rest(protocol)
+    for host in sorted(new, key=socket.inet_aton):
+        print('New ports of ' + host)
+        print('PORT\tSTATE\tSERVICE')
+        print_ports(new[host], 'tcp', 'new')
+
+    # save the scan results to database, hosts without open ports keep their history
     if l:
-        controller.save_scan(ip, open_ports_tcp)
+        for host in sorted(set(diff_scan.known) | set(new), key=socket.inet_aton):
+            controller.save_scan(host, found.get(host, PortSet()) | new.get(host, PortSet()))
 
 
-def print_ports(open_ports, protocol):
+def print_ports(open_ports, protocol, state='open', banners=None):
     """Prints the port-array formatted on the screen.
 
     Args:
-        open_ports (list) : List of the opened ports of the host
-        protocol (str)    : The protocol of the opened ports
+        open_ports (PortSet) : The opened ports of the host
+        protocol (str)       : The protocol of the opened ports
+        state (str)          : The state printed for the ports
+        banners (dict)       : BannerEvent of the ports, the detected service, version and banner are printed if set
     """
     if protocol == 'tcp':
-        text = '\\tcp\topen\t'
+        text = '\\tcp\t' + state + '\t'
     elif protocol == 'udp':
-        text = '\\udp\topen\t'
+        text = '\\udp\t' + state + '\t'
     else:
         text = '\tprotocol unknown'
 
     # print all open ports
-    if len(open_ports) > 0:
-        for port, value in open_ports.items():
-            if value == 1:
-                print(str(port) + text + Services.get_service(port))
+    if banners is None:
+        for port in open_ports:
+            print(str(port) + text + Services.get_service(port, protocol))
+        return
+
+    for port in open_ports:
+        banner = banners.get(port)
+        if banner is None:
+            print(str(port) + text + Services.get_service(port, protocol))
+        else:
+            print(str(port) + text + banner.service + '\t' + banner.version + '\t' + banner.banner[:BANNER_WIDTH])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,12 @@
+import pytest
+
+from classes.dbcontroller import DBController
+
+
+@pytest.fixture
+def controller(tmp_path, monkeypatch):
+    """A database in the temporary directory of the test."""
+    monkeypatch.setattr(DBController, 'file_name', str(tmp_path / 'penscan.db'))
+    controller = DBController()
+    yield controller
+    controller.close()
@@ -0,0 +1,116 @@
+import socket
+import threading
+
+import pytest
+
+from classes.banners import BannerGrabber, Signatures
+from classes.metrics import Metrics
+from classes.scan import ScanEvent
+
+
+@pytest.mark.parametrize('banner, expected', [
+    (b'SSH-2.0-OpenSSH_9.6p1 Ubuntu-3\r\n', ('ssh', b'OpenSSH_9.6p1 Ubuntu-3')),
+    (b'HTTP/1.1 400 Bad Request\r\nContent-Type: text/html\r\nServer: nginx/1.24.0\r\n\r\n',
+     ('http', b'nginx/1.24.0')),
+    (b'HTTP/1.0 200 OK\r\n\r\n', ('http', None)),
+    (b'220 ProFTPD Server (Debian FTP)\r\n', ('ftp', b'ProFTPD Server (Debian FTP)')),
+    (b'220 mail.example.org ESMTP Postfix\r\n', ('smtp', b'mail.example.org ESMTP Postfix')),
+    (b'+PONG\r\n', ('redis', None)),
+    (b'J\x00\x00\x00\x0a8.0.36\x00\x08\x00\x00\x00', ('mysql', b'8.0.36')),
+    (b'RFB 003.008\n', ('vnc', b'003.008')),
+    (b'\x15\x03\x03\x00\x02\x02\x46', ('tls', None)),
+    (b'hello world\r\n', None),
+    (b'', None),
+])
+def test_default_signatures(banner, expected):
+    assert Signatures().match(banner) == expected
+
+
+def test_first_matching_signature_wins():
+    signatures = Signatures([('first', rb'OK (\w+)'), ('second', rb'OK')])
+    assert signatures.match(b'OK ready') == ('first', b'ready')
+    assert Signatures([('second', rb'OK'), ('first', rb'OK (\w+)')]).match(b'OK ready') == ('second', None)
+
+
+def test_banners_are_escaped():
+    assert BannerGrabber.text(b'SSH-2.0\x00\x1b[1m\tx\r\n') == 'SSH-2.0\\x00\\x1b[1m\\tx'
+
+
+class BannerServer:
+    """Listens on the loopback interface and answers every connection with the handler."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.socket = socket.socket()
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.listen()
+        self.port = self.socket.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                connection, _ = self.socket.accept()
+            except OSError:
+                return
+            with connection:
+                self.handler(connection)
+
+    def close(self):
+        self.socket.close()
+
+
+def greeting(connection):
+    connection.sendall(b'SSH-2.0-OpenSSH_9.6\r\n')
+    connection.recv(100)
+
+
+def answer_probe(connection):
+    if connection.recv(100).startswith(b'HEAD /'):
+        connection.sendall(b'HTTP/1.0 400 Bad Request\r\nServer: test/1.0\r\n\r\n')
+
+
+def silent(connection):
+    connection.recv(100)
+
+
+class Controller:
+    """Keeps the saved banners."""
+
+    def __init__(self):
+        self.banners = []
+
+    def save_banner(self, *banner):
+        self.banners.append(banner)
+
+
+def test_banners_are_grabbed(monkeypatch):
+    monkeypatch.setattr(BannerGrabber, 'GREETING_WAIT', 0.05)
+    servers = [BannerServer(handler) for handler in (greeting, answer_probe, silent)]
+    unused = socket.socket()
+    unused.bind(('127.0.0.1', 0))
+    closed_port = unused.getsockname()[1]
+    unused.close()
+
+    events, controller, metrics = [], Controller(), Metrics()
+    grabber = BannerGrabber(connections=2, timeout=0.5, listener=events.append, controller=controller,
+                            metrics=metrics)
+    grabber.start()
+    try:
+        for server in servers:
+            grabber.submit(ScanEvent('127.0.0.1', server.port, 'open', None), log=server is servers[0])
+        grabber.submit(ScanEvent('127.0.0.1', closed_port, 'open', None))
+        results = grabber.join()['127.0.0.1']
+    finally:
+        grabber.close()
+        for server in servers:
+            server.close()
+
+    ssh, http = results[servers[0].port], results[servers[1].port]
+    assert (ssh.state, ssh.service, ssh.version, ssh.banner) == ('banner', 'ssh', 'OpenSSH_9.6', 'SSH-2.0-OpenSSH_9.6')
+    assert (http.service, http.version) == ('http', 'test/1.0')
+    assert ssh.rtt is not None
+    assert servers[2].port not in results and closed_port not in results
+    assert sorted(events) == sorted(results.values())
+    assert controller.banners == [('127.0.0.1', servers[0].port, 'ssh', 'OpenSSH_9.6', 'SSH-2.0-OpenSSH_9.6')]
+    assert metrics.counters['banners'] == 2 and metrics.counters['banner_errors'] == 2
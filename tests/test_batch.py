@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+from classes import batch
+from classes.batch import BatchScan
+from classes.portset import PortSet
+from classes.scan import Scan
+from classes.simulation import HostProfile, SimulatedNetwork, SimulatedTransport
+
+NETWORK = SimulatedNetwork({}, default=HostProfile(rtt=0.001, jitter=0, open_ports='1-5'))
+
+
+class SimulatedScan(Scan):
+    """Scans the simulated network, the address 10.9.9.9 fails."""
+
+    barrier = None
+
+    def __init__(self, ports, ip, **options):
+        if self.barrier is not None:
+            self.barrier.wait()
+        if ip == '10.9.9.9':
+            raise RuntimeError('section failed')
+        super().__init__(ports, ip, transport=SimulatedTransport(NETWORK), **options)
+
+
+@pytest.fixture
+def simulated(monkeypatch):
+    monkeypatch.setattr(batch, 'Scan', SimulatedScan)
+    monkeypatch.setattr(SimulatedScan, 'barrier', None)
+
+
+def run(sections, **options):
+    reports = {}
+    BatchScan(sections, timing='lan', **options).run(
+        lambda section, sc, results: reports.__setitem__(section[0], results))
+    return reports
+
+
+@pytest.mark.parametrize('engine', ['async', 'thread'])
+def test_sections_are_scanned(simulated, engine):
+    sections = [('10.0.0.%d' % index, 'tcp', '1-10', False) for index in range(1, 6)]
+    reports = run(sections, engine=engine, parallel=2)
+    assert reports == {host: {host: PortSet(range(1, 6))} for host, _, _, _ in sections}
+
+
+def test_failed_section_does_not_stop_the_others(simulated):
+    reports = run([('10.0.0.1', 'tcp', '1-10', False), ('10.9.9.9', 'tcp', '1-10', False)])
+    assert reports['10.0.0.1'] == {'10.0.0.1': PortSet(range(1, 6))}
+    assert isinstance(reports['10.9.9.9'], RuntimeError)
+
+
+def test_parallel_sections_get_their_own_workers(simulated, monkeypatch):
+    # All sections have to be built at the same time, more than the default executor has workers
+    parallel = 40
+    monkeypatch.setattr(SimulatedScan, 'barrier', threading.Barrier(parallel, timeout=10))
+    sections = [('10.0.1.%d' % index, 'tcp', '1-3', False) for index in range(1, parallel + 1)]
+    reports = run(sections, engine='thread', parallel=parallel)
+    assert all(not isinstance(results, Exception) for results in reports.values())
+    assert len(reports) == parallel
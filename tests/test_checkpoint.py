@@ -0,0 +1,78 @@
+import pytest
+
+from classes.checkpoint import Checkpoint
+from classes.portset import PortSet
+from classes.scan import Scan
+from classes.simulation import HostProfile, SimulatedNetwork, SimulatedTransport
+
+HOSTS = '10.0.0.1-3'
+PORTS = '1-40'
+
+
+def new_scan(seed):
+    network = SimulatedNetwork({}, default=HostProfile(rtt=0.001, jitter=0, open_ports='5-15,33'))
+    return Scan(PORTS, HOSTS, timing='lan', seed=seed, transport=SimulatedTransport(network))
+
+
+@pytest.mark.parametrize('seed', [None, 11])
+def test_interrupted_scan_resumes_at_the_checkpoint(controller, seed):
+    sc = new_scan(seed)
+    checkpoint = Checkpoint.create(controller, sc, HOSTS, PORTS, 'tcp', seed)
+    sc.checkpoint = checkpoint
+    # The scan stops after 50 of the 120 work items, like an interrupted scan
+    sc.stop = 50
+    sc.scan_tcp()
+    checkpoint.stop(False)
+    controller.flush()
+
+    hosts, ports, protocol, saved_seed, position, finished, results = controller.load_checkpoint(
+        checkpoint.checkpoint_id)
+    assert (hosts, ports, protocol, saved_seed, position, finished) == (HOSTS, PORTS, 'tcp', seed, 50, 0)
+    assert results == sc.output
+
+    resumed = new_scan(saved_seed)
+    resumed.start, resumed.initial_output = position, results
+    resumed.checkpoint = Checkpoint(controller, checkpoint.checkpoint_id, resumed, protocol)
+    output = resumed.scan_tcp()
+    resumed.checkpoint.stop(True)
+    controller.flush()
+
+    expected = PortSet(list(range(5, 16)) + [33])
+    assert output == {host: expected for host in ('10.0.0.1', '10.0.0.2', '10.0.0.3')}
+    # The checkpoint of a finished scan is deleted
+    assert controller.load_checkpoint(checkpoint.checkpoint_id) is None
+
+
+class RecordingController:
+    """Keeps the checkpoints instead of handing them to the background writer."""
+
+    def __init__(self):
+        self.checkpoints = []
+
+    def save_checkpoint(self, checkpoint_id, position, results):
+        self.checkpoints.append((position, results))
+
+
+def test_saved_ports_are_a_snapshot():
+    sc = new_scan(None)
+    sc.record('10.0.0.1', 5, 'open')
+    controller = RecordingController()
+    Checkpoint(controller, 1, sc, 'tcp').save()
+    sc.record('10.0.0.1', 6, 'open')
+    assert controller.checkpoints == [(0, {'10.0.0.1': PortSet([5])})]
+
+
+@pytest.mark.parametrize('resumable', [False, True])
+def test_only_resumable_scans_store_checkpoints(controller, monkeypatch, capsys, resumable):
+    penscan = pytest.importorskip('penscan')
+    created = []
+    create_checkpoint = controller.create_checkpoint
+
+    def counting_create(*args):
+        created.append(create_checkpoint(*args))
+        return created[-1]
+
+    monkeypatch.setattr(controller, 'create_checkpoint', counting_create)
+    penscan.scan_checkpointed(new_scan(None), 'tcp', HOSTS, PORTS, None, False, controller, None, ['open'],
+                              resumable=resumable)
+    assert len(created) == (1 if resumable else 0)
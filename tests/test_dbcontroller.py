@@ -0,0 +1,139 @@
+import sqlite3
+
+import pytest
+
+from classes.dbcontroller import DBController
+from classes.metrics import Metrics
+from classes.portset import PortSet
+
+
+@pytest.fixture(autouse=True)
+def no_retry_wait(monkeypatch):
+    monkeypatch.setattr(DBController, 'retry_wait', 0)
+
+
+def test_database_uses_write_ahead_logging(controller):
+    assert controller.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_saved_scans_share_transactions(controller):
+    controller.metrics = Metrics()
+    for index in range(500):
+        controller.save_scan('10.0.%d.%d' % divmod(index, 256), PortSet([22, 80 + index % 2]))
+    controller.flush()
+    assert len(controller.load_scans()) == 500
+    assert controller.metrics.counters['db_transactions'] < 10
+    # host, scan, two open ports and two port statistics per scan
+    assert controller.metrics.counters['db_rows'] == 500 * 6
+    assert controller.top_ports(3) == [22, 80, 81]
+
+
+def test_scans_of_older_versions_are_migrated(tmp_path, monkeypatch):
+    file_name = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(file_name)
+    with conn:
+        conn.execute('CREATE TABLE scans (date TEXT, host TEXT, open_tcp TEXT)')
+        conn.execute("INSERT INTO scans VALUES ('01/02/20 10:00:00', '10.0.0.1', '22,80')")
+        conn.execute("INSERT INTO scans VALUES ('unreadable', '10.0.0.1', '443')")
+    conn.close()
+
+    monkeypatch.setattr(DBController, 'file_name', file_name)
+    controller = DBController()
+    try:
+        assert controller.last_scan('10.0.0.1') == PortSet([443])
+        assert [ports for _, _, ports in controller.host_history('10.0.0.1')] == [PortSet([443]), PortSet([22, 80])]
+        assert controller.top_ports(None) == [22, 80, 443]
+        tables = {row[0] for row in controller.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert 'scans' not in tables and 'scans_migrated' in tables
+    finally:
+        controller.close()
+
+    # The migration runs once
+    controller = DBController()
+    try:
+        assert len(controller.load_scans()) == 2
+    finally:
+        controller.close()
+
+
+def failing_write(errors):
+    """Returns a write that raises the errors one after another and then succeeds."""
+    errors = list(errors)
+
+    def write(c, host_ids):
+        if errors:
+            raise errors.pop(0)
+    return write
+
+
+def test_faulty_write_loses_only_itself(controller):
+    controller.save_scan('10.0.0.1', PortSet([22]))
+    controller.enqueue(failing_write([sqlite3.IntegrityError('faulty'), sqlite3.IntegrityError('faulty')]))
+    controller.save_scan('10.0.0.2', PortSet([80]))
+    with pytest.raises(sqlite3.IntegrityError):
+        controller.flush()
+    assert controller.last_scan('10.0.0.1') == PortSet([22])
+    assert controller.last_scan('10.0.0.2') == PortSet([80])
+    # The error is raised again until the controller is closed
+    with pytest.raises(sqlite3.IntegrityError):
+        controller.save_scan('10.0.0.3', PortSet())
+    controller.error = None
+
+
+def test_locked_database_is_retried(controller):
+    controller.save_scan('10.0.0.1', PortSet([22]))
+    controller.enqueue(failing_write([sqlite3.OperationalError('database is locked')] * 2))
+    controller.flush()
+    assert controller.last_scan('10.0.0.1') == PortSet([22])
+
+
+def test_persistent_operational_error_is_raised(controller):
+    controller.save_scan('10.0.0.1', PortSet([22]))
+    controller.enqueue(failing_write([sqlite3.OperationalError('disk I/O error')] * controller.write_attempts))
+    with pytest.raises(sqlite3.OperationalError):
+        controller.flush()
+    controller.error = None
+
+
+def test_last_scans_of_many_hosts(controller):
+    controller.save_scan('10.0.0.1', PortSet([22]))
+    controller.save_scan('10.0.0.2', PortSet([80]))
+    controller.save_scan('10.0.0.1', PortSet([443]))
+    controller.flush()
+    hosts = ['10.0.0.1', '10.0.0.2', '10.0.0.3'] + ['10.1.%d.%d' % divmod(index, 256) for index in range(40000)]
+    assert controller.last_scans_of(hosts) == {'10.0.0.1': PortSet([443]), '10.0.0.2': PortSet([80])}
+    assert controller.last_scans_of([]) == {}
+
+
+def test_history_queries(controller):
+    controller.save_scan('10.0.0.1', PortSet([22, 80]))
+    controller.save_scan('10.0.0.2', PortSet([80]))
+    controller.save_scan('10.0.0.1', PortSet([22, 443]))
+    controller.save_scan('10.0.0.3', PortSet())
+    controller.flush()
+
+    assert [host for _, host, _ in controller.last_scans()] == ['10.0.0.3', '10.0.0.1', '10.0.0.2', '10.0.0.1']
+    assert [host for _, host, _ in controller.last_scans(2)] == ['10.0.0.3', '10.0.0.1']
+    assert [ports for _, _, ports in controller.host_history('10.0.0.1')] == [PortSet([22, 443]), PortSet([22, 80])]
+    assert len(list(controller.host_history('10.0.0.1', 1))) == 1
+    assert list(controller.host_history('10.9.9.9')) == []
+    assert controller.last_scan('10.9.9.9') is None
+
+    # Only the latest scan of every host counts
+    assert [host for _, host in controller.hosts_with_port(80)] == ['10.0.0.2']
+    assert [host for _, host in controller.hosts_with_port(22)] == ['10.0.0.1']
+
+    _, _, opened, closed = controller.port_changes('10.0.0.1')
+    assert (opened, closed) == (PortSet([443]), PortSet([80]))
+    assert controller.port_changes('10.0.0.2') is None
+
+
+def test_history_queries_use_the_indexes(controller):
+    plans = [
+        ('SELECT scan.date, scan.open_tcp FROM scan WHERE scan.host_id = 1 ORDER BY scan.id DESC', 'scan_host'),
+        ('SELECT scan_id FROM open_port WHERE port = 80', 'open_port_port'),
+        ('SELECT port FROM port_stats ORDER BY open_count DESC, port', 'port_stats_count'),
+    ]
+    for statement, index in plans:
+        plan = ' '.join(row[-1] for row in controller.conn.execute('EXPLAIN QUERY PLAN ' + statement))
+        assert index in plan, plan
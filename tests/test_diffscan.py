@@ -0,0 +1,68 @@
+import pytest
+
+from classes.diffscan import DiffScan
+from classes.portset import PortSet
+from classes.simulation import HostProfile, SimulatedNetwork, SimulatedTransport
+
+
+def test_known_ports_are_loaded_in_one_query(controller, monkeypatch):
+    controller.save_scan('10.0.0.1', PortSet([22, 8080]))
+    controller.save_scan('10.0.0.2', PortSet([80]))
+    controller.save_scan('10.0.0.1', PortSet([22, 443]))
+    controller.flush()
+    monkeypatch.setattr(controller, 'last_scan', None)
+    known = DiffScan('1-1000', '10.0.0.1-3', controller).known
+    assert known == {'10.0.0.1': PortSet([22, 443]), '10.0.0.2': PortSet([80])}
+
+
+def rescan(controller, sweep=100, seed=None):
+    network = SimulatedNetwork({
+        '10.0.0.1': HostProfile(rtt=0.001, jitter=0, open_ports='22,443'),
+        '10.0.0.2': HostProfile(rtt=0.001, jitter=0, open_ports='80'),
+    })
+    controller.save_scan('10.0.0.1', PortSet([22, 80, 8080]))
+    controller.flush()
+    return DiffScan('1-1000', '10.0.0.1-2', controller, sweep, seed, timing='lan',
+                    transport=SimulatedTransport(network))
+
+
+def test_known_ports_are_probed_first(controller):
+    diff_scan = rescan(controller)
+    # 8080 is outside the port range
+    assert diff_scan.known == {'10.0.0.1': PortSet([22, 80])}
+    assert diff_scan.scan_known('tcp') == {'10.0.0.1': PortSet([22])}
+    assert diff_scan.scan_rest('tcp') == {'10.0.0.1': PortSet([443]), '10.0.0.2': PortSet([80])}
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    """Keeps the scans of the DiffScan instead of running them."""
+    scans = []
+
+    def run(sc, protocol):
+        scans.append(sc)
+        return {}
+
+    monkeypatch.setattr(DiffScan, 'run', staticmethod(run))
+    return scans
+
+
+def test_rest_excludes_the_known_ports(controller, scans):
+    diff_scan = rescan(controller)
+    diff_scan.scan_rest('tcp')
+    assert len(scans[0].targets) == 2000 - 2
+    assert ('10.0.0.1', 22) not in list(scans[0].targets)
+
+
+def test_partial_sweep_samples_the_rest(controller, scans):
+    rescan(controller, sweep=10, seed=7).scan_rest('tcp')
+    rescan(controller, sweep=10, seed=7).scan_rest('tcp')
+    assert len(scans[0].targets) == 200
+    assert list(scans[0].targets) == list(scans[1].targets)
+    assert len({host for host, _ in scans[0].targets}) == 2
+
+
+def test_hosts_without_history_have_nothing_known(controller):
+    diff_scan = DiffScan('1-100', '10.0.0.1', controller)
+    assert diff_scan.known == {}
+    assert diff_scan.scan_known('tcp') == {}
@@ -0,0 +1,203 @@
+import asyncio
+import errno
+import sys
+import threading
+
+import pytest
+
+from classes.batch import ProbeBudget
+from classes.metrics import Metrics
+from classes.portset import PortSet
+from classes.scan import Scan
+from classes.simulation import HostProfile, SimulatedNetwork, SimulatedTransport
+
+HOSTS = ('10.0.0.1', '10.0.0.2', '10.0.0.3')
+OPEN = PortSet(list(range(1, 21)) + [443])
+
+
+def network(closed=HostProfile.RST):
+    profile = HostProfile(rtt=0.002, jitter=0, open_ports='1-20,443', closed=closed)
+    return SimulatedNetwork({host: profile for host in HOSTS})
+
+
+def new_scan(engine='async', closed=HostProfile.RST, transport=None, **options):
+    transport = transport if transport is not None else SimulatedTransport(network(closed))
+    return Scan('1-40,443', '10.0.0.1-3', engine=engine, timing='lan', transport=transport, **options)
+
+
+def run(sc, protocol):
+    return sc.scan_syn() if protocol == 'syn' else sc.scan_tcp()
+
+
+@pytest.mark.parametrize('engine, protocol', [('async', 'tcp'), ('thread', 'tcp'), ('async', 'syn')])
+def test_engines_find_the_open_ports(engine, protocol):
+    metrics = Metrics()
+    sc = new_scan(engine, metrics=metrics)
+    assert run(sc, protocol) == {host: OPEN for host in HOSTS}
+    assert metrics.counters['open'] == len(HOSTS) * len(OPEN)
+
+
+@pytest.mark.parametrize('engine, protocol', [('async', 'tcp'), ('thread', 'tcp'), ('async', 'syn')])
+def test_stream_generates_every_state(engine, protocol):
+    sc = new_scan(engine)
+    events = list(sc.stream(protocol, states=(Scan.OPEN, Scan.CLOSED)))
+    assert len(events) == len(HOSTS) * 41
+    assert sorted(event[:2] for event in events if event.state == Scan.OPEN) == \
+        sorted((host, port_number) for host in HOSTS for port_number in OPEN)
+
+
+@pytest.mark.parametrize('engine, protocol', [('async', 'tcp'), ('thread', 'tcp'), ('async', 'syn')])
+def test_dropped_ports_are_filtered(engine, protocol):
+    metrics = Metrics()
+    sc = new_scan(engine, closed=HostProfile.DROP, metrics=metrics)
+    events = list(sc.stream(protocol, states=(Scan.FILTERED,)))
+    assert sorted(event[:2] for event in events) == \
+        sorted((host, port_number) for host in HOSTS for port_number in range(21, 41))
+    assert all(event.state == Scan.FILTERED for event in events)
+    assert metrics.counters['filtered'] == len(HOSTS) * 20
+
+
+@pytest.mark.parametrize('engine, protocol', [('async', 'tcp'), ('thread', 'tcp'), ('async', 'syn')])
+def test_stream_stops_the_scan_when_closed_early(engine, protocol):
+    profile = HostProfile(rtt=0.001, jitter=0, open_ports='1-65535')
+    sc = Scan('1-65535', '10.0.0.0/24', engine=engine, timing='lan',
+              transport=SimulatedTransport(SimulatedNetwork({}, default=profile)))
+    sc.STREAM_BUFFER = 16
+    events = sc.stream(protocol)
+    next(events)
+    events.close()
+    assert threading.active_count() < 10
+    assert not sc.stopped.is_set()
+
+
+class FailingTransport(SimulatedTransport):
+    """Fails the SYN probes of one host with an error of sendto."""
+
+    def __init__(self, network, host, error):
+        super().__init__(network)
+        self.host = host
+        self.error = error
+
+    def open_raw(self, rs):
+        sock = super().open_raw(rs)
+        sendto = sock.sendto
+
+        def failing_sendto(packet, address):
+            if address[0] == self.host:
+                raise OSError(self.error, 'sendto failed')
+            return sendto(packet, address)
+
+        sock.sendto = failing_sendto
+        return sock
+
+
+def test_syn_probes_of_unreachable_destinations_are_dropped():
+    metrics = Metrics()
+    sc = new_scan(transport=FailingTransport(network(), '10.0.0.2', errno.EACCES), metrics=metrics)
+    assert sc.scan_syn() == {'10.0.0.1': OPEN, '10.0.0.3': OPEN}
+    assert metrics.counters['send_errors'] == 41
+    assert metrics.counters['probes_sent'] == 2 * 41
+
+
+def test_syn_sender_errors_are_raised():
+    sc = new_scan(transport=FailingTransport(network(), '10.0.0.2', errno.EINVAL))
+    with pytest.raises(OSError):
+        sc.scan_syn()
+
+
+class RepeatingTransport(SimulatedTransport):
+    """Answers every SYN probe twice, like a host that retransmits its SYN-ACKs and RSTs."""
+
+    def open_raw(self, rs):
+        sock = super().open_raw(rs)
+        sendto = sock.sendto
+
+        def repeating_sendto(packet, address):
+            sendto(packet, address)
+            return sendto(packet, address)
+
+        sock.sendto = repeating_sendto
+        return sock
+
+
+def test_syn_replies_are_counted_once():
+    metrics = Metrics()
+    sc = new_scan(transport=RepeatingTransport(network()), metrics=metrics)
+    events = list(sc.stream('syn', states=(Scan.OPEN, Scan.CLOSED)))
+    assert len(events) == len(HOSTS) * 41
+    assert sc.replies == metrics.counters['replies'] == len(HOSTS) * 41
+    assert metrics.counters['open'] == len(HOSTS) * len(OPEN)
+
+
+
+class CountingTransport(SimulatedTransport):
+    """Counts the connects in flight."""
+
+    def __init__(self, network):
+        super().__init__(network)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def connect(self, host, port_number, timeout):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            return super().connect(host, port_number, timeout)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+@pytest.mark.parametrize('protocol', ['thread', 'syn'])
+def test_worker_thread_scans_share_the_budget(protocol):
+    async def scan():
+        budget = ProbeBudget(1000, 4, asyncio.get_running_loop())
+        transport = CountingTransport(network())
+        sc = new_scan('thread', transport=transport, budget=budget)
+        if protocol == 'syn':
+            peak = 0
+            hold_slot = sc.hold_slot
+
+            def counting_hold_slot(*args):
+                nonlocal peak
+                hold_slot(*args)
+                peak = max(peak, len(sc.in_flight))
+
+            sc.hold_slot = counting_hold_slot
+            results = await asyncio.to_thread(sc.scan_syn)
+        else:
+            results = await asyncio.to_thread(sc.scan_tcp_thread)
+            peak = transport.peak
+        return results, peak, budget
+
+    results, peak, budget = asyncio.run(scan())
+    assert results == {host: OPEN for host in HOSTS}
+    # Three hosts with 4 slots each
+    assert 0 < peak <= 12
+    assert budget.hosts == {}
+
+
+def test_concurrent_records_keep_every_port():
+    """The threads of the thread engine record into the same PortSets, no port gets lost or out of order."""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for _ in range(50):
+            sc = new_scan('thread')
+            sc.output = {}
+
+            def record(offset):
+                for port_number in range(offset, 4000, 8):
+                    sc.record(HOSTS[port_number % 2], port_number, Scan.OPEN)
+
+            threads = [threading.Thread(target=record, args=(offset,)) for offset in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert sc.output == {HOSTS[0]: PortSet(range(0, 4000, 2)), HOSTS[1]: PortSet(range(1, 4000, 2))}
+            assert all(list(ports) == sorted(set(ports)) for ports in sc.output.values())
+    finally:
+        sys.setswitchinterval(interval)
@@ -0,0 +1,79 @@
+import io
+import json
+
+import pytest
+
+from classes.metrics import Metrics
+
+
+@pytest.fixture
+def metrics():
+    metrics = Metrics()
+    metrics.add_total(4)
+    metrics.probe('replies', wait=0.25)
+    metrics.probe('timeouts')
+    metrics.probe('send_errors')
+    metrics.result('open', 0.0004)
+    metrics.result('closed', 0.003)
+    metrics.result('filtered')
+    metrics.count('dns_lookups', 2)
+    with metrics.phase('scan'):
+        pass
+    return metrics
+
+
+def test_snapshot_counts_and_histogram(metrics):
+    stats = metrics.snapshot()
+    assert stats['counters']['probes_sent'] == 3
+    assert stats['counters']['replies'] == stats['counters']['timeouts'] == stats['counters']['send_errors'] == 1
+    assert (stats['counters']['open'], stats['counters']['closed'], stats['counters']['filtered']) == (1, 1, 1)
+    # Counters that were never counted are exported too
+    assert stats['counters']['retries'] == 0
+    assert stats['counters']['dns_lookups'] == 2
+    assert stats['phases']['connect_wait'] == {'seconds': 0.25, 'count': 1}
+    assert stats['phases']['scan']['count'] == 1
+    assert stats['rtt']['buckets']['0.0005'] == 1 and stats['rtt']['buckets']['0.005'] == 1
+    assert stats['rtt']['count'] == 2 and stats['rtt']['sum'] == pytest.approx(0.0034)
+    assert (stats['progress']['sent'], stats['progress']['total']) == (3, 4)
+
+
+def test_json_export(metrics, tmp_path):
+    path = tmp_path / 'stats.json'
+    metrics.export(json_path=str(path))
+    stats = json.loads(path.read_text())
+    snapshot = metrics.snapshot()
+    for key in ('counters', 'phases', 'rtt'):
+        assert stats[key] == snapshot[key]
+    assert (stats['progress']['sent'], stats['progress']['total']) == (3, 4)
+
+
+def test_prometheus_export(metrics, tmp_path):
+    path = tmp_path / 'penscan.prom'
+    metrics.export(prometheus_path=str(path))
+    lines = path.read_text().splitlines()
+    assert '# TYPE penscan_probes_sent_total counter' in lines
+    assert 'penscan_probes_sent_total 3' in lines
+    assert 'penscan_phase_seconds_total{phase="connect_wait"} 0.25' in lines
+    # The buckets of the histogram are cumulative
+    assert 'penscan_rtt_seconds_bucket{le="0.0005"} 1' in lines
+    assert 'penscan_rtt_seconds_bucket{le="0.005"} 2' in lines
+    assert 'penscan_rtt_seconds_bucket{le="+Inf"} 2' in lines
+    assert 'penscan_rtt_seconds_count 2' in lines
+    assert 'penscan_probes_total 4' in lines
+    assert not (tmp_path / 'penscan.prom.tmp').exists()
+
+
+def test_progress_line(metrics):
+    line = metrics.format_progress()
+    assert line.startswith('3/4 probes (75.0%), ')
+
+
+def test_reporting_prints_until_stopped(metrics, tmp_path):
+    file = io.StringIO()
+    path = tmp_path / 'penscan.prom'
+    metrics.start_reporting(interval=0.01, prometheus_path=str(path), file=file)
+    while not path.exists():
+        metrics.stopped.wait(0.01)
+    metrics.stop_reporting()
+    assert file.getvalue().startswith('3/4 probes')
+    assert metrics.reporter is None
@@ -0,0 +1,26 @@
+import pytest
+
+from classes.permutation import Permutation
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 100, 1000, 4097])
+def test_every_index_is_visited_once(size):
+    assert sorted(Permutation(size, 42)) == list(range(size))
+
+
+def test_same_seed_gives_same_order():
+    assert list(Permutation(500, 7)) == list(Permutation(500, 7))
+    assert list(Permutation(500, 7)) != list(Permutation(500, 8))
+
+
+def test_positions_can_be_read_in_any_order():
+    permutation = Permutation(300, 1)
+    order = list(permutation)
+    assert [permutation[position] for position in range(299, -1, -1)] == order[::-1]
+
+
+def test_position_out_of_range():
+    with pytest.raises(IndexError):
+        Permutation(10, 1)[10]
+    with pytest.raises(IndexError):
+        Permutation(10, 1)[-1]
@@ -0,0 +1,54 @@
+from classes.portset import PortSet
+
+
+def test_array_and_bitmap_hold_the_same_ports():
+    """A set that grows beyond the array limit switches to the bitmap without losing ports."""
+    ports = PortSet(range(0, 20000, 3))
+    assert ports.bitmap is not None
+    assert len(ports) == len(range(0, 20000, 3))
+    assert list(ports) == list(range(0, 20000, 3))
+    assert 19998 in ports and 19999 not in ports
+
+    small = PortSet([443, 22, 80, 22])
+    assert small.bitmap is None
+    assert list(small) == [22, 80, 443]
+
+
+def test_add_and_discard():
+    ports = PortSet()
+    ports.add(8080)
+    ports.add(8080)
+    assert len(ports) == 1
+    ports.discard(8080)
+    ports.discard(8080)
+    assert len(ports) == 0 and 8080 not in ports
+
+
+def test_bytes_round_trip_of_both_encodings():
+    for ports in (PortSet(), PortSet([0, 1, 65535]), PortSet(range(1, 65536, 2))):
+        data = ports.to_bytes()
+        assert data[0] == (PortSet.BITMAP if ports.bitmap is not None else PortSet.ARRAY)
+        assert PortSet.from_bytes(data) == ports
+
+
+def test_array_encoding_is_big_endian():
+    assert PortSet([1, 256]).to_bytes() == bytes([PortSet.ARRAY, 0, 1, 1, 0])
+
+
+def test_int_ranges_and_string_conversions():
+    ports = PortSet.from_ranges([range(20, 26), range(80, 81)])
+    assert list(ports) == [20, 21, 22, 23, 24, 25, 80]
+    assert PortSet.from_int(ports.to_int()) == ports
+    assert ports.to_string() == '20,21,22,23,24,25,80'
+    assert PortSet.from_string('20,21,22,23,24,25,80') == ports
+
+
+def test_set_operations_of_arrays_and_bitmaps():
+    small = PortSet([1, 2, 3, 5000])
+    large = PortSet(range(0, 10000, 2))
+    assert small | large == PortSet(set(small) | set(large))
+    assert small & large == PortSet([2, 5000])
+    assert small - large == PortSet([1, 3])
+    assert small.union(large) == small | large
+    assert large.intersection(small) == large & small
+    assert large.difference(small) == PortSet(set(large) - set(small))
@@ -0,0 +1,100 @@
+import pytest
+
+from classes import ratelimiter
+from classes.ratelimiter import RateLimiter
+
+
+class Clock:
+    """Monotonic time that only moves when the test advances it."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimiter, 'time', clock)
+    return clock
+
+
+def test_rate_and_burst_must_be_positive():
+    with pytest.raises(ValueError):
+        RateLimiter(0)
+    with pytest.raises(ValueError):
+        RateLimiter(100, -1)
+
+
+def test_unlimited_rate_never_waits(clock):
+    limiter = RateLimiter()
+    assert limiter.delay(100000) == 0.0
+    assert limiter.sent == 100000
+
+
+def test_bucket_allows_the_burst_and_then_paces(clock):
+    limiter = RateLimiter(1000, burst=10)
+    assert limiter.delay(10) == 0.0
+    # The bucket is empty, every further probe waits for its token
+    assert limiter.delay() == pytest.approx(0.001)
+    assert limiter.delay() == pytest.approx(0.002)
+    clock.now += 0.002
+    assert limiter.delay() == pytest.approx(0.001)
+    # The tokens refill up to the burst only
+    clock.now += 10
+    assert limiter.delay(10) == 0.0
+    assert limiter.delay() > 0
+
+
+def test_default_burst_is_a_hundredth_of_the_rate(clock):
+    assert RateLimiter(5000).burst == 50
+    assert RateLimiter(50).burst == 1
+
+
+def window(limiter, clock, sent, answered):
+    """Sends and answers probes within one window and starts the next one."""
+    limiter.delay(sent)
+    limiter.answered(answered)
+    clock.now += RateLimiter.window
+    limiter.delay(0)
+
+
+def test_loss_backs_off_and_good_windows_recover(clock):
+    limiter = RateLimiter(1000000, burst=1000000)
+    window(limiter, clock, 100, 90)
+    assert limiter.rate == 1000000
+    # The response ratio drops below half of its average
+    window(limiter, clock, 100, 10)
+    assert limiter.rate == 500000
+    for _ in range(12):
+        window(limiter, clock, 100, 90)
+    assert limiter.rate == 1000000
+
+
+def test_small_windows_do_not_change_the_rate(clock):
+    limiter = RateLimiter(1000000, burst=1000000)
+    window(limiter, clock, 100, 90)
+    window(limiter, clock, RateLimiter.min_window_probes - 1, 0)
+    assert limiter.rate == 1000000
+
+
+def test_rate_does_not_drop_below_a_hundredth_of_the_target(clock):
+    limiter = RateLimiter(10000)
+    for _ in range(20):
+        clock.now += RateLimiter.failure_holdoff
+        limiter.send_failed()
+    assert limiter.rate == 100
+
+
+def test_a_burst_of_failed_sends_backs_off_once(clock):
+    limiter = RateLimiter(10000)
+    for _ in range(50):
+        limiter.send_failed()
+    assert limiter.rate == 5000
+    assert limiter.failures == 50
+
+    clock.now += RateLimiter.failure_holdoff
+    limiter.send_failed()
+    assert limiter.rate == 2500
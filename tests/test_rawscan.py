@@ -0,0 +1,85 @@
+import socket
+from struct import pack, unpack_from
+
+from classes.rawscan import RawScan
+
+SECRET = bytes(range(16))
+TARGET = '192.0.2.10'
+
+
+def reply(rs, host, port_number, flags, ack_offset=1):
+    """Builds the answer of the host to the probe of the port."""
+    dest_addr = socket.inet_aton(host)
+    seq_no, src_port = rs.cookie(dest_addr, port_number)
+    return memoryview(pack('!BBHHHBBH4s4sHHLLBBHHH', 0x45, 0, 40, 0, 0, 64, 6, 0, dest_addr, bytes(4),
+                           port_number, src_port, 0, (seq_no + ack_offset) & 0xffffffff, 0x50, flags, 65535, 0, 0))
+
+
+def test_checksum_of_a_known_header():
+    header = bytes.fromhex('450000730000400040110000c0a80001c0a800c7')
+    assert RawScan.calc_checksum(header) == 0xb861
+
+
+def test_incremental_checksum_updates():
+    message = bytearray(bytes.fromhex('450000730000400040110000c0a80001c0a800c7'))
+    checksum = RawScan.calc_checksum(message)
+    message[4:6] = b'\x12\x34'
+    assert RawScan.update_checksum(checksum, 0, 0x1234) == RawScan.calc_checksum(message)
+    message[18:20] = b'\x00\x00'
+    zeroed = RawScan.calc_checksum(message)
+    assert RawScan.patch_checksum(zeroed, 0x00c7) == RawScan.calc_checksum(message[:18] + b'\x00\xc7')
+
+
+def test_probes_have_valid_checksums():
+    rs = RawScan(None, secret=SECRET, random_src_port=True)
+    hosts = ['192.0.2.1', '198.51.100.7', '127.0.0.1']
+    ports = [22, 80, 65535]
+    packets = rs.create_packets(ports, [socket.inet_aton(host) for host in hosts])
+    for index, (host, port_number) in enumerate(zip(hosts, ports)):
+        packet = bytes(packets[index * rs.packet_length:(index + 1) * rs.packet_length])
+        assert RawScan.calc_checksum(packet[:20]) == 0
+        assert packet[16:20] == socket.inet_aton(host)
+        src_port, dest_port, seq_no = unpack_from('!HHL', packet, 20)
+        assert dest_port == port_number
+        assert (seq_no, src_port) == rs.cookie(socket.inet_aton(host), port_number)
+        pseudo_header = packet[12:20] + pack('!BBH', 0, socket.IPPROTO_TCP, 20)
+        assert RawScan.calc_checksum(pseudo_header + packet[20:]) == 0
+
+
+def test_cookie_depends_on_the_secret_and_the_probe():
+    rs = RawScan(None, secret=SECRET)
+    addr = socket.inet_aton(TARGET)
+    assert rs.cookie(addr, 80) == RawScan(None, secret=SECRET).cookie(addr, 80)
+    assert rs.cookie(addr, 80) != RawScan(None, secret=bytes(16)).cookie(addr, 80)
+    assert rs.cookie(addr, 80) != rs.cookie(addr, 81)
+    assert rs.cookie(addr, 80) != rs.cookie(socket.inet_aton('192.0.2.11'), 80)
+
+
+def test_replies_are_validated_with_the_cookie():
+    rs = RawScan(None, secret=SECRET, random_src_port=True)
+    assert rs.parse_reply(reply(rs, TARGET, 443, rs.SYN_ACK)) == (TARGET, 443, rs.SYN_ACK)
+    assert rs.parse_reply(reply(rs, TARGET, 443, 0x14)) == (TARGET, 443, 0x14)
+    # Wrong acknowledgment number or a reply of another scan
+    assert rs.parse_reply(reply(rs, TARGET, 443, rs.SYN_ACK, ack_offset=2)) is None
+    assert rs.parse_reply(reply(RawScan(None, secret=bytes(16)), TARGET, 443, rs.SYN_ACK)) is None
+    assert rs.parse_reply(memoryview(b'\x45' + bytes(10))) is None
+
+
+def test_source_addresses_are_looked_up_per_network(monkeypatch):
+    lookups = []
+    udp_socket = socket.socket
+
+    def counting_socket(*args):
+        lookups.append(args)
+        return udp_socket(*args)
+
+    monkeypatch.setattr(socket, 'socket', counting_socket)
+    monkeypatch.setattr(RawScan, 'SOURCE_CACHE_SIZE', 4)
+    rs = RawScan(None, secret=SECRET)
+    addrs = [(0x0a000000 + index).to_bytes(4, 'big') for index in range(512)]
+    rs.create_packets([80] * len(addrs), addrs)
+    assert len(lookups) == 2
+
+    for network in range(10):
+        rs.source_address(bytes([10, 1, network, 1]))
+    assert len(rs.src_addrs) == 4
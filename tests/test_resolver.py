@@ -0,0 +1,109 @@
+import socket
+import threading
+
+import pytest
+
+from classes import resolver
+from classes.resolver import Resolver
+
+
+class Clock:
+    """Monotonic time that only moves when the test advances it."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+
+class FakeDNS:
+    """Answers the lookups from a table and counts them."""
+
+    def __init__(self, addresses):
+        self.addresses = addresses
+        self.lookups = []
+        self.lock = threading.Lock()
+
+    def gethostbyname(self, name):
+        with self.lock:
+            self.lookups.append(name)
+        if name not in self.addresses:
+            raise socket.gaierror('unknown host ' + name)
+        return self.addresses[name]
+
+    def getfqdn(self, address):
+        with self.lock:
+            self.lookups.append(address)
+        names = {address: name for name, address in self.addresses.items()}
+        return names.get(address, address)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resolver, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def dns(monkeypatch):
+    dns = FakeDNS({'host.test': '192.0.2.1', 'other.test': '192.0.2.2'})
+    monkeypatch.setattr(socket, 'gethostbyname', dns.gethostbyname)
+    monkeypatch.setattr(socket, 'getfqdn', dns.getfqdn)
+    return dns
+
+
+def test_lookups_are_cached_until_the_ttl(clock, dns):
+    res = Resolver()
+    assert res.forward('host.test') == '192.0.2.1'
+    assert res.forward('host.test') == '192.0.2.1'
+    assert dns.lookups == ['host.test']
+    clock.now += Resolver.ttl
+    assert res.forward('host.test') == '192.0.2.1'
+    assert dns.lookups == ['host.test', 'host.test']
+
+
+def test_failed_lookups_are_cached_shorter(clock, dns):
+    res = Resolver()
+    for _ in range(2):
+        with pytest.raises(socket.gaierror):
+            res.forward('missing.test')
+    assert dns.lookups == ['missing.test']
+    clock.now += Resolver.negative_ttl
+    with pytest.raises(socket.gaierror):
+        res.forward('missing.test')
+    assert dns.lookups == ['missing.test', 'missing.test']
+
+
+def test_least_recently_used_lookups_are_dropped(clock, dns, monkeypatch):
+    monkeypatch.setattr(Resolver, 'max_entries', 2)
+    res = Resolver()
+    res.forward('host.test')
+    res.forward('other.test')
+    res.forward('host.test')
+    res.reverse('192.0.2.1')
+    assert list(res.cache) == [('forward', 'host.test'), ('reverse', '192.0.2.1')]
+    res.forward('other.test')
+    assert dns.lookups.count('other.test') == 2
+
+
+def test_many_lookups_run_concurrently(clock, dns):
+    res = Resolver()
+    try:
+        assert res.forward_many(['other.test', 'host.test', 'other.test']) == ['192.0.2.2', '192.0.2.1', '192.0.2.2']
+        assert res.reverse_many(['192.0.2.1', '192.0.2.9']) == {'192.0.2.1': 'host.test', '192.0.2.9': '192.0.2.9'}
+        with pytest.raises(socket.gaierror):
+            res.forward_many(['host.test', 'missing.test'])
+    finally:
+        res.close()
+
+
+def test_reverse_lookups_can_be_switched_off(clock, dns):
+    res = Resolver(reverse_dns=False)
+    assert res.reverse('192.0.2.1') == '192.0.2.1'
+    assert res.reverse_many(['192.0.2.1']) == {'192.0.2.1': '192.0.2.1'}
+    assert dns.lookups == []
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from classes.services import Services
+
+
+@pytest.fixture
+def services(tmp_path, monkeypatch):
+    """Services with an own services file and cache, the index is loaded again."""
+    services_file = tmp_path / 'services'
+    services_file.write_text('# comment\n'
+                             'ssh-system\t22/tcp\n'
+                             'custom\t\t4242/tcp\tcustom-alias # own service\n'
+                             'custom\t\t4242/udp\n'
+                             'first\t\t4343/tcp\n'
+                             'second\t\t4343/tcp\n'
+                             'broken\t\tnot-a-port\n')
+    monkeypatch.setattr(Services, 'services_file', str(services_file))
+    monkeypatch.setattr(Services, 'cache_file', str(tmp_path / 'cache' / 'services.idx'))
+    monkeypatch.setattr(Services, 'names', None)
+    monkeypatch.setattr(Services, 'index', None)
+    return services_file
+
+
+def reload():
+    Services.names = Services.index = None
+    return Services.load()
+
+
+def test_lookup_of_system_and_bundled_names(services):
+    assert Services.get_service(4242) == 'custom'
+    assert Services.get_service(4242, 'udp') == 'custom'
+    # The first name of a port wins and the bundled names take precedence
+    assert Services.get_service(4343) == 'first'
+    assert Services.get_service(22) == 'ssh'
+    assert Services.get_service(445) == 'active directory / smb'
+    assert Services.get_service(4444) == ''
+    assert Services.get_service(70000) == ''
+    assert Services.get_service(22, 'sctp') == ''
+
+
+def test_names_are_stored_once(services):
+    Services.load()
+    assert len(Services.names) == len(set(Services.names))
+    assert Services.index['tcp'][4242] == Services.index['udp'][4242]
+
+
+def test_index_is_cached_and_mapped(services, monkeypatch):
+    Services.load()
+    assert os.path.exists(Services.cache_file)
+
+    def compile_again(signature):
+        raise AssertionError('the cache was compiled again')
+
+    monkeypatch.setattr(Services, 'compile', compile_again)
+    reload()
+    assert Services.get_service(4242) == 'custom'
+
+
+def test_changed_services_file_invalidates_the_cache(services):
+    Services.load()
+    services.write_text('changed\t\t4242/tcp\n')
+    os.utime(services, ns=(0, 0))
+    reload()
+    assert Services.get_service(4242) == 'changed'
+    assert Services.get_service(4343) == ''
+
+
+def test_damaged_cache_is_compiled_again(services):
+    Services.load()
+    with open(Services.cache_file, 'r+b') as file:
+        file.truncate(100)
+    reload()
+    assert Services.get_service(4242) == 'custom'
+    assert os.path.getsize(Services.cache_file) > 100
+
+
+def test_missing_services_file_uses_the_bundled_names(services):
+    services.unlink()
+    reload()
+    assert Services.get_service(80) == 'http'
+    assert Services.get_service(4242) == ''
+
+
+def test_unwritable_cache_still_works(services, monkeypatch, tmp_path):
+    blocker = tmp_path / 'file'
+    blocker.write_text('')
+    monkeypatch.setattr(Services, 'cache_file', str(blocker / 'services.idx'))
+    reload()
+    assert Services.get_service(4242) == 'custom'
@@ -0,0 +1,43 @@
+import socket
+
+from classes.portset import PortSet
+from classes.ratelimiter import RateLimiter
+from classes.scan import ScanEvent
+from classes.shardscan import ShardScan
+from classes.targets import Targets
+
+
+def test_shards_cover_the_targets_once():
+    sc = ShardScan(Targets('10.0.0.0/28', '1-10'), 4)
+    assert sc.shards() == [(0, 35), (35, 70), (70, 105), (105, 140)]
+    # There are never more workers than work items
+    assert ShardScan(Targets('10.0.0.1', '1-3'), 8).shards() == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_rate_and_concurrency_are_split():
+    sc = ShardScan(Targets('10.0.0.0/28', '1-10'), 4, rate_limiter=RateLimiter(1000, 100))
+    assert (sc.rate, sc.burst) == (250, 25)
+    assert ShardScan(Targets('10.0.0.1', '1-10'), 4, rate_limiter=RateLimiter()).rate is None
+
+
+def test_workers_scan_the_loopback_interface():
+    listeners = []
+    for _ in range(2):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen()
+        listeners.append(listener)
+    open_ports = sorted(listener.getsockname()[1] for listener in listeners)
+    ports = open_ports + [port_number for port_number in range(open_ports[0] + 1, open_ports[0] + 20)
+                          if port_number not in open_ports]
+    try:
+        sc = ShardScan(Targets('127.0.0.1', ','.join(map(str, ports))), 3, timing='lan')
+        events = list(sc.stream('tcp', states=('open', 'closed')))
+    finally:
+        for listener in listeners:
+            listener.close()
+
+    assert sc.output == {'127.0.0.1': PortSet(open_ports)}
+    assert sorted(event.port for event in events) == sorted(ports)
+    assert all(isinstance(event, ScanEvent) for event in events)
+    assert sorted(event.port for event in events if event.state == 'open') == open_ports
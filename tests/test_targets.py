@@ -0,0 +1,94 @@
+import pytest
+
+from classes.portset import PortSet
+from classes.targets import HostPorts, Targets
+
+
+class FakeResolver:
+    """Resolves the hostnames from a table instead of the DNS."""
+
+    def __init__(self, addresses):
+        self.addresses = addresses
+        self.names = []
+
+    def forward_many(self, names):
+        names = list(names)
+        self.names += names
+        return [self.addresses[name] for name in names]
+
+
+def hosts(spec, resolver=None):
+    return list(Targets(spec, '80', resolver=resolver).hosts())
+
+
+def test_addresses_blocks_and_ranges():
+    assert hosts('10.0.0.1') == ['10.0.0.1']
+    # Network and broadcast address are skipped
+    assert hosts('10.0.0.0/30') == ['10.0.0.1', '10.0.0.2']
+    assert hosts('10.0.0.0/31') == ['10.0.0.0', '10.0.0.1']
+    assert hosts('10.0.0.254-10.0.1.1') == ['10.0.0.254', '10.0.0.255', '10.0.1.0', '10.0.1.1']
+    assert hosts('10.0.0.8-10') == ['10.0.0.8', '10.0.0.9', '10.0.0.10']
+    assert hosts(' 10.0.0.1 , ,10.0.0.3') == ['10.0.0.1', '10.0.0.3']
+
+
+def test_reversed_range_is_rejected():
+    with pytest.raises(ValueError):
+        hosts('10.0.0.9-10.0.0.1')
+
+
+def test_hyphenated_hostnames_are_resolved():
+    resolver = FakeResolver({'my-host.test': '192.0.2.7', 'db': '192.0.2.8'})
+    assert hosts('my-host.test,10.0.0.1,db', resolver) == ['192.0.2.7', '10.0.0.1', '192.0.2.8']
+    assert resolver.names == ['my-host.test', 'db']
+
+
+def test_ports():
+    assert Targets.parse_ports('22,80-82, 443') == [range(22, 23), range(80, 83), range(443, 444)]
+    with pytest.raises(ValueError):
+        Targets.parse_ports('90-80')
+    with pytest.raises(ValueError):
+        Targets.parse_ports('65536')
+
+
+def test_items_interleave_the_hosts():
+    targets = Targets('10.0.0.1-3', '80,443')
+    assert len(targets) == 6
+    assert list(targets) == [('10.0.0.1', 80), ('10.0.0.2', 80), ('10.0.0.3', 80),
+                             ('10.0.0.1', 443), ('10.0.0.2', 443), ('10.0.0.3', 443)]
+
+
+def test_index_matches_the_ascending_order():
+    targets = Targets('10.0.0.1-3,10.0.1.0/30', '1-5,80')
+    assert [targets.item(index) for index in range(targets.size())] == list(targets)
+
+
+def test_items_resume_at_a_position():
+    for seed in (None, 5):
+        targets = Targets('10.0.0.0/28', '1-20', seed)
+        items = list(targets)
+        assert list(targets.items(37)) == items[37:]
+
+
+def test_seeded_order_visits_every_item_once():
+    ascending = list(Targets('10.0.0.0/28', '1-20'))
+    shuffled = list(Targets('10.0.0.0/28', '1-20', seed=3))
+    assert shuffled != ascending
+    assert sorted(shuffled) == sorted(ascending)
+    assert shuffled == list(Targets('10.0.0.0/28', '1-20', seed=3))
+
+
+def test_exclude_and_limit():
+    targets = Targets('10.0.0.1-2', '1-10', exclude={'10.0.0.1': PortSet([2, 3, 100])})
+    assert len(targets) == 18
+    assert ('10.0.0.1', 2) not in list(targets) and ('10.0.0.2', 2) in list(targets)
+
+    limited = Targets('10.0.0.1-2', '1-10', limit=5)
+    assert len(limited) == 5
+    assert len(list(limited)) == 5
+
+
+def test_host_ports():
+    host_ports = HostPorts({'10.0.0.1': PortSet([1, 2, 3]), '10.0.0.2': PortSet([7]), '10.0.0.3': PortSet()})
+    assert len(host_ports) == 4
+    assert list(host_ports) == [('10.0.0.1', 1), ('10.0.0.2', 7), ('10.0.0.1', 2), ('10.0.0.1', 3)]
+    assert list(host_ports.items(2)) == [('10.0.0.1', 2), ('10.0.0.1', 3)]
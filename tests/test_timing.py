@@ -0,0 +1,65 @@
+import pytest
+
+from classes.timing import Timing
+
+
+def test_unmeasured_hosts_use_the_initial_timeout():
+    timing = Timing('normal')
+    assert timing.timeout('10.0.0.1') == 0.5
+    assert timing.drain_timeout() == 0.5
+
+
+def test_estimator_follows_rfc_6298():
+    timing = Timing('slow')
+    timing.update('10.0.0.1', 0.2)
+    # The first sample sets SRTT = R and RTTVAR = R / 2
+    assert timing.estimates['10.0.0.1'] == pytest.approx([0.2, 0.1])
+    assert timing.timeout('10.0.0.1') == pytest.approx(0.2 + 4 * 0.1)
+
+    timing.update('10.0.0.1', 0.4)
+    rttvar = 0.75 * 0.1 + 0.25 * abs(0.2 - 0.4)
+    srtt = 0.875 * 0.2 + 0.125 * 0.4
+    assert timing.estimates['10.0.0.1'] == pytest.approx([srtt, rttvar])
+    assert timing.timeout('10.0.0.1') == pytest.approx(srtt + 4 * rttvar)
+
+
+def test_timeouts_stay_within_the_profile():
+    timing = Timing('lan')
+    timing.update('10.0.0.1', 0.0001)
+    timing.update('10.0.0.2', 3.0)
+    assert timing.timeout('10.0.0.1') == 0.01
+    assert timing.timeout('10.0.0.2') == 0.5
+
+
+def test_unmeasured_hosts_use_the_overall_estimate():
+    timing = Timing('normal')
+    timing.update('10.0.0.1', 0.1)
+    timing.update('10.0.0.2', 0.1)
+    assert timing.timeout('10.0.0.3') == pytest.approx(timing.bounded(timing.overall))
+    assert timing.timeout('10.0.0.3') < timing.initial
+
+
+def test_drain_timeout_waits_for_the_slowest_host():
+    timing = Timing('normal')
+    timing.update('10.0.0.1', 0.05)
+    timing.update('10.0.0.2', 0.3)
+    assert timing.drain_timeout() == timing.timeout('10.0.0.2')
+
+
+def test_least_recently_updated_hosts_are_dropped(monkeypatch):
+    monkeypatch.setattr(Timing, 'max_hosts', 2)
+    timing = Timing('normal')
+    for host in ('10.0.0.1', '10.0.0.2', '10.0.0.1', '10.0.0.3'):
+        timing.update(host, 0.1)
+    assert list(timing.estimates) == ['10.0.0.1', '10.0.0.3']
+
+
+def test_a_reply_gives_one_sample():
+    timing = Timing('normal')
+    key = 0x0a000001 << 16 | 80
+    timing.probe_sent(key, 10.0)
+    assert timing.probe_answered('10.0.0.1', key, 10.25) == pytest.approx(0.25)
+    # A retransmitted reply and replies to probes that were not sent give none
+    assert timing.probe_answered('10.0.0.1', key, 10.5) is None
+    assert timing.probe_answered('10.0.0.1', key + 1, 10.5) is None
+    assert timing.estimates['10.0.0.1'] == pytest.approx([0.25, 0.125])
@@ -0,0 +1,36 @@
+from classes.portset import PortSet
+from classes.topports import TopPorts
+
+
+def test_logged_ports_rank_first(controller):
+    controller.save_scan('10.0.0.1', PortSet([8081, 22]))
+    controller.save_scan('10.0.0.2', PortSet([8081]))
+    controller.flush()
+    assert TopPorts.ranking(4, controller) == [8081, 22, 80, 23]
+
+
+def test_ranking_without_logged_scans(controller):
+    assert TopPorts.ranking(3, controller) == TopPorts.default_ranking[:3]
+    ranking = TopPorts.ranking(65535, controller)
+    assert len(ranking) == 65535
+    assert sorted(ranking) == list(range(1, 65536))
+
+
+def test_cached_ranking_follows_new_scans(controller):
+    controller.save_scan('10.0.0.1', PortSet([8081]))
+    controller.flush()
+    assert TopPorts.ranking(1, controller) == [8081]
+    controller.save_scan('10.0.0.1', PortSet([9999]))
+    controller.save_scan('10.0.0.2', PortSet([9999]))
+    controller.flush()
+    assert TopPorts.ranking(1, controller) == [9999]
+
+
+def test_presets_are_expanded(controller):
+    assert TopPorts.expand('top:3', controller) == '80,23,443'
+    assert TopPorts.expand('1-5, top:2,8000', controller) == '1-5,80,23,8000'
+
+
+def test_consecutive_ports_become_ranges():
+    assert TopPorts.to_port_string([80, 81, 82, 22, 443, 444]) == '80-82,22,443-444'
+    assert TopPorts.to_port_string([]) == ''
@@ -0,0 +1,57 @@
+import io
+import json
+
+import pytest
+
+from classes.banners import BannerEvent
+from classes.scan import ScanEvent
+from classes.writers import BinaryWriter, NDJSONWriter
+
+EVENTS = [
+    ScanEvent('10.0.0.1', 22, 'open', 0.0123),
+    ScanEvent('192.168.1.254', 65535, 'closed', None),
+    ScanEvent('255.255.255.255', 0, 'filtered', 5000.0),
+]
+
+
+def test_binary_round_trip():
+    file = io.BytesIO()
+    writer = BinaryWriter(file)
+    for event in EVENTS:
+        writer.write(event)
+    # Banners have no record
+    writer.write(BannerEvent('10.0.0.1', 22, 'banner', 0.01, 'ssh', 'OpenSSH', 'SSH-2.0-OpenSSH'))
+    writer.flush()
+
+    data = file.getvalue()
+    assert data.startswith(BinaryWriter.MAGIC)
+    assert len(data) == len(BinaryWriter.MAGIC) + len(EVENTS) * BinaryWriter.record.size
+
+    events = list(BinaryWriter.read(io.BytesIO(data)))
+    assert [event[:3] for event in events] == [event[:3] for event in EVENTS]
+    assert events[0].rtt == pytest.approx(0.0123, abs=1e-6)
+    assert events[1].rtt is None
+    # Round trip times beyond the record are capped
+    assert events[2].rtt == pytest.approx((BinaryWriter.UNKNOWN_RTT - 1) / 1000000)
+
+
+def test_binary_reader_rejects_other_files():
+    with pytest.raises(ValueError):
+        list(BinaryWriter.read(io.BytesIO(b'{"host": "10.0.0.1"}')))
+
+
+def test_empty_binary_file_has_the_magic():
+    file = io.BytesIO()
+    BinaryWriter(file).flush()
+    assert file.getvalue() == BinaryWriter.MAGIC
+    assert list(BinaryWriter.read(io.BytesIO(file.getvalue()))) == []
+
+
+def test_ndjson_lines():
+    file = io.StringIO()
+    writer = NDJSONWriter(file)
+    for event in EVENTS[:2]:
+        writer.write(event)
+    writer.flush()
+    lines = [json.loads(line) for line in file.getvalue().splitlines()]
+    assert [(line['host'], line['port'], line['state']) for line in lines] == [event[:3] for event in EVENTS[:2]]